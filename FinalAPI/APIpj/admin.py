@@ -1,16 +1,272 @@
 from django.contrib import admin
+from django.db.models import Exists, OuterRef, Subquery
+from django.urls import reverse
+from django.utils.html import format_html, format_html_join
+
 from .models import (User,
                      Coords,
                      Level,
                      Image,
                      ActivityType,
                      PerevalAdded,
-                     PerevalImage)
+                     PerevalArchive,
+                     PerevalAudit,
+                     PerevalImage,
+                     PossibleDuplicate)
+from .exif import gps_mismatch_images, gps_mismatches
+from . import http_cache
+from .paginators import EstimatedCountPaginator
+from .thumbnails import thumbnail_url
 
-admin.site.register([User,
-                     Coords,
-                     Level,
-                     Image,
-                     ActivityType,
-                     PerevalAdded,
-                     PerevalImage])
\ No newline at end of file
+
+def _thumbnail(name: str) -> str:
+    url = thumbnail_url(name)
+    return format_html('<img src="{}" style="max-height: 60px;">', url) if url else "—"
+
+
+class PhotoGpsFilter(admin.SimpleListFilter):
+    title = "GPS фото"
+    parameter_name = "photo_gps"
+
+    def lookups(self, request, model_admin):
+        return (("far", "Далеко от координат"),)
+
+    def queryset(self, request, queryset):
+        if self.value() == "far":
+            # коррелированный подзапрос: отбор и пагинация списка остаются в одном SQL-запросе
+            return queryset.filter(Exists(gps_mismatch_images().filter(pereval=OuterRef("pk"))))
+        return queryset
+
+
+class DuplicateFilter(admin.SimpleListFilter):
+    title = "Возможные дубли"
+    parameter_name = "duplicates"
+
+    def lookups(self, request, model_admin):
+        return (("yes", "Есть"), ("no", "Нет"))
+
+    def queryset(self, request, queryset):
+        if self.value() == "yes":
+            return queryset.filter(has_duplicates=True)
+        if self.value() == "no":
+            return queryset.filter(has_duplicates=False)
+        return queryset
+
+
+class LargeTableAdmin(admin.ModelAdmin):
+    # таблицы на 10^5+ строк: без точного COUNT(*) и без выпадающих списков по FK
+    paginator = EstimatedCountPaginator
+    show_full_result_count = False
+    list_per_page = 50
+    ordering = ("-id",)
+
+
+class PerevalPartAdmin(LargeTableAdmin):
+    """
+    Части карточки перевала, которые правятся отдельно от него: после правки у перевалов
+    обновляется updated_at, чтобы сменился ETag и кэши клиентов (APIpj.http_cache).
+    """
+    pereval_lookup = ""
+
+    def touch_perevals(self, obj) -> None:
+        http_cache.touch(**{self.pereval_lookup: obj.pk})
+
+    def save_model(self, request, obj, form, change):
+        super().save_model(request, obj, form, change)
+        if change:
+            self.touch_perevals(obj)
+
+
+@admin.register(User)
+class UserAdmin(LargeTableAdmin):
+    list_display = ("id", "email", "phone", "last_name", "first_name", "patronymic")
+    search_fields = ("=email", "=phone", "^last_name")
+
+
+@admin.register(Coords)
+class CoordsAdmin(PerevalPartAdmin):
+    list_display = ("id", "latitude", "longitude", "height")
+    pereval_lookup = "coords_id"
+
+
+@admin.register(Level)
+class LevelAdmin(PerevalPartAdmin):
+    list_display = ("id", "winter", "summer", "autumn", "spring")
+    pereval_lookup = "level_id"
+
+
+@admin.register(Image)
+class ImageAdmin(PerevalPartAdmin):
+    list_display = ("id", "title", "date_added", "taken_at", "width", "height", "thumbnail")
+    pereval_lookup = "perevalimage__image_id"
+    readonly_fields = ("thumbnail", "width", "height", "taken_at", "gps_latitude", "gps_longitude")
+
+    @admin.display(description="Превью")
+    def thumbnail(self, obj: Image) -> str:
+        return _thumbnail(obj.data.name)
+
+
+@admin.register(ActivityType)
+class ActivityTypeAdmin(admin.ModelAdmin):
+    list_display = ("id", "title")
+    search_fields = ("title",)
+
+
+class PerevalImageInline(admin.TabularInline):
+    model = PerevalImage
+    raw_id_fields = ("image",)
+    readonly_fields = ("thumbnail",)
+    extra = 0
+
+    @admin.display(description="Превью")
+    def thumbnail(self, obj: PerevalImage) -> str:
+        return _thumbnail(obj.image.data.name) if obj.image_id else "—"
+
+    def get_queryset(self, request):
+        return super().get_queryset(request).select_related("image")
+
+
+@admin.register(PerevalAdded)
+class PerevalAddedAdmin(LargeTableAdmin):
+    list_display = ("id", "title", "status", "activity_type", "user", "add_time", "duplicates_flag", "thumbnail")
+    list_display_links = ("id", "title")
+    list_select_related = ("user", "activity_type")
+    list_filter = ("status", "activity_type", DuplicateFilter, PhotoGpsFilter)
+    search_fields = ("=id", "^title")
+    raw_id_fields = ("user", "coords", "level")
+    autocomplete_fields = ("activity_type",)
+    readonly_fields = ("add_time", "possible_duplicates", "photo_gps_check", "edit_history")
+    inlines = (PerevalImageInline,)
+    actions = ("make_pending", "make_accepted", "make_rejected")
+
+    def get_queryset(self, request):
+        # имя файла первой картинки подтягиваем подзапросом, чтобы не делать запрос на каждую строку
+        first_image = PerevalImage.objects.filter(pereval=OuterRef("pk")).order_by("id").values("image__data")[:1]
+        # дубли ищутся при отправке перевала (APIpj.duplicates.flag_new), здесь — только флаг
+        has_duplicates = Exists(PossibleDuplicate.objects.filter(pereval=OuterRef("pk")))
+        return super().get_queryset(request).annotate(first_image=Subquery(first_image), has_duplicates=has_duplicates)
+
+    @admin.display(description="Дубли", boolean=True, ordering="has_duplicates")
+    def duplicates_flag(self, obj: PerevalAdded) -> bool:
+        return getattr(obj, "has_duplicates", False)
+
+    @admin.display(description="Превью")
+    def thumbnail(self, obj: PerevalAdded) -> str:
+        return _thumbnail(getattr(obj, "first_image", None) or "")
+
+    @admin.display(description="Возможные дубли")
+    def possible_duplicates(self, obj: PerevalAdded) -> str:
+        if not obj.pk:
+            return "—"
+        # NumPy подгружаем только при открытии карточки, а не при старте воркера
+        from .duplicates import find_duplicates
+
+        duplicates = find_duplicates(obj)
+        if not duplicates:
+            return "—"
+        return format_html_join(
+            format_html("<br>"),
+            '<a href="{}">#{}</a> — {} км, похожесть названия {}',
+            (
+                (reverse("admin:APIpj_perevaladded_change", args=[d.id]), d.id, d.distance_km, d.similarity)
+                for d in duplicates
+            ),
+        )
+
+    @admin.display(description="GPS фото")
+    def photo_gps_check(self, obj: PerevalAdded) -> str:
+        if not obj.pk:
+            return "—"
+        mismatches = gps_mismatches(obj)
+        if not mismatches:
+            return "—"
+        return format_html_join(
+            format_html("<br>"),
+            '<a href="{}">фото #{}</a> снято в {} км от координат',
+            ((reverse("admin:APIpj_image_change", args=[pk]), pk, km) for pk, km in mismatches),
+        )
+
+    @admin.display(description="Правки")
+    def edit_history(self, obj: PerevalAdded) -> str:
+        if not obj.pk:
+            return "—"
+        entries = PerevalAudit.objects.filter(pereval_id=obj.pk).order_by("-id")[:20]
+        if not entries:
+            return "—"
+        return format_html_join(
+            format_html("<br>"),
+            "{} {}.{}: {} → {}",
+            ((e.changed_at.strftime("%d.%m.%Y %H:%M"), e.model, e.field, e.old_value, e.new_value) for e in entries),
+        )
+
+    def _transition(self, request, queryset, sources, target: str) -> None:
+        # один UPDATE на все выбранные записи; записи с неподходящим статусом не трогаем
+        updated = queryset.set_status(target, sources=sources)
+        label = PerevalAdded.StatusChoices(target).label
+        self.message_user(request, f"Статус «{label}» установлен у записей: {updated}")
+
+    @admin.action(description="Взять в работу")
+    def make_pending(self, request, queryset):
+        self._transition(request, queryset, [PerevalAdded.StatusChoices.NEW], PerevalAdded.StatusChoices.PENDING)
+
+    @admin.action(description="Принять")
+    def make_accepted(self, request, queryset):
+        sources = [PerevalAdded.StatusChoices.NEW, PerevalAdded.StatusChoices.PENDING]
+        self._transition(request, queryset, sources, PerevalAdded.StatusChoices.ACCEPTED)
+
+    @admin.action(description="Отклонить")
+    def make_rejected(self, request, queryset):
+        sources = [PerevalAdded.StatusChoices.NEW, PerevalAdded.StatusChoices.PENDING]
+        self._transition(request, queryset, sources, PerevalAdded.StatusChoices.REJECTED)
+
+
+@admin.register(PerevalImage)
+class PerevalImageAdmin(PerevalPartAdmin):
+    list_display = ("id", "pereval", "image")
+    list_select_related = ("pereval", "image")
+    raw_id_fields = ("pereval", "image")
+
+    def touch_perevals(self, obj: PerevalImage) -> None:
+        http_cache.touch(id=obj.pereval_id)
+
+    def save_model(self, request, obj, form, change):
+        # новая или удалённая связь тоже меняет список фото перевала
+        obj.save()
+        self.touch_perevals(obj)
+
+    def delete_model(self, request, obj):
+        super().delete_model(request, obj)
+        self.touch_perevals(obj)
+
+    def delete_queryset(self, request, queryset):
+        pereval_ids = list(queryset.values_list("pereval_id", flat=True))
+        super().delete_queryset(request, queryset)
+        http_cache.touch(id__in=pereval_ids)
+
+
+@admin.register(PerevalArchive)
+class PerevalArchiveAdmin(LargeTableAdmin):
+    list_display = ("id", "title", "status", "user", "add_time", "archived_at")
+    list_select_related = ("user",)
+    list_filter = ("status",)
+    search_fields = ("=id", "^title")
+    raw_id_fields = ("user", "activity_type", "images")
+
+    def has_change_permission(self, request, obj=None):
+        return False
+
+
+@admin.register(PerevalAudit)
+class PerevalAuditAdmin(LargeTableAdmin):
+    list_display = ("id", "pereval_id", "model", "field", "old_value", "new_value", "changed_at")
+    list_filter = ("model",)
+    search_fields = ("=pereval_id", "=revision")
+
+    def has_add_permission(self, request):
+        return False
+
+    def has_change_permission(self, request, obj=None):
+        return False
+
+    def has_delete_permission(self, request, obj=None):
+        return False
@@ -4,3 +4,12 @@ from django.apps import AppConfig
 class ApipjConfig(AppConfig):
     default_auto_field = 'django.db.models.BigAutoField'
     name = 'APIpj'
+
+    def ready(self):
+        from django.core.signals import request_started
+        from . import receivers  # noqa: F401
+        from .refdata import WARM_UP_UID, warm_up
+
+        # запросы к БД в ready() Django не рекомендует, поэтому кэш справочников
+        # прогревается перед первым запросом воркера
+        request_started.connect(warm_up, dispatch_uid=WARM_UP_UID)
@@ -0,0 +1,105 @@
+"""
+Архивация старых промодерированных перевалов.
+
+Рабочая таблица PerevalAdded должна содержать в основном new/pending: принятые и отклонённые
+перевалы старше ARCHIVE_AFTER_DAYS переносятся пачками в PerevalArchive вместе с координатами,
+уровнем сложности и связями с изображениями. Сами изображения (и файлы) остаются на месте.
+Детальный GET /api/submitData/<id>/ ищет перевал в архиве, если его нет в рабочей таблице.
+
+Удаление строк PerevalAdded при переносе — не удаление перевала: receivers проверяют
+is_archiving() и не вычитают перенесённые перевалы из сводок, кластеров, индекса высот
+и журнала изменений: архивный перевал остаётся во всех производных индексах, пока его не удалят из архива.
+"""
+from contextvars import ContextVar
+from datetime import datetime, timedelta
+from typing import List, Optional
+
+from django.conf import settings
+from django.db import transaction
+from django.utils import timezone
+
+from .models import Coords, Level, PerevalAdded, PerevalArchive, PerevalChange, PerevalImage
+
+ARCHIVED_STATUSES = (PerevalAdded.StatusChoices.ACCEPTED, PerevalAdded.StatusChoices.REJECTED)
+
+_COPIED_FIELDS = (
+    "id", "beauty_title", "title", "other_titles", "connect", "add_time", "updated_at", "status",
+    "user_id", "activity_type_id",
+)
+_COORDS_FIELDS = ("latitude", "longitude", "height")
+_LEVEL_FIELDS = ("winter", "summer", "autumn", "spring")
+
+_archiving: ContextVar[bool] = ContextVar("archiving", default=False)
+
+
+def is_archiving() -> bool:
+    """True, пока archive_batch удаляет перенесённые в архив строки PerevalAdded."""
+    return _archiving.get()
+
+
+def archive_cutoff(days: Optional[int] = None) -> datetime:
+    if days is None:
+        days = settings.ARCHIVE_AFTER_DAYS
+    return timezone.now() - timedelta(days=days)
+
+
+def candidates(cutoff: datetime):
+    return PerevalAdded.objects.filter(status__in=ARCHIVED_STATUSES, add_time__lt=cutoff)
+
+
+@transaction.atomic
+def archive_batch(ids: List[int]) -> int:
+    """Переносит перевалы ids в архив. Строки блокируются и перепроверяются: статус мог измениться."""
+    rows = list(
+        PerevalAdded.objects.select_for_update()
+        .filter(id__in=ids, status__in=ARCHIVED_STATUSES)
+        .values(
+            *_COPIED_FIELDS, "coords_id", "level_id",
+            *(f"coords__{f}" for f in _COORDS_FIELDS), *(f"level__{f}" for f in _LEVEL_FIELDS),
+        )
+    )
+    if not rows:
+        return 0
+    ids = [row["id"] for row in rows]
+
+    PerevalArchive.objects.bulk_create(
+        PerevalArchive(
+            **{f: row[f] for f in _COPIED_FIELDS},
+            **{f: row[f"coords__{f}"] for f in _COORDS_FIELDS},
+            **{f: row[f"level__{f}"] for f in _LEVEL_FIELDS},
+        )
+        for row in rows
+    )
+    Through = PerevalArchive.images.through
+    Through.objects.bulk_create(
+        Through(perevalarchive_id=pereval_id, image_id=image_id)
+        for pereval_id, image_id in PerevalImage.objects.filter(pereval_id__in=ids).values_list("pereval_id", "image_id")
+    )
+
+    # старые записи журнала заменяет одна archived: клиент перечитает перевал из архива
+    PerevalChange.objects.filter(pereval_id__in=ids).delete()
+    PerevalChange.objects.bulk_create(
+        PerevalChange(pereval_id=row["id"], user_id=row["user_id"], kind=PerevalChange.Kind.ARCHIVED, status=row["status"])
+        for row in rows
+    )
+
+    # PerevalImage удаляются каскадом; координаты и уровень — если больше ни на что не ссылаются
+    token = _archiving.set(True)
+    try:
+        PerevalAdded.objects.filter(id__in=ids).delete()
+    finally:
+        _archiving.reset(token)
+    Coords.objects.filter(id__in=[row["coords_id"] for row in rows], perevaladded__isnull=True).delete()
+    Level.objects.filter(id__in=[row["level_id"] for row in rows], perevaladded__isnull=True).delete()
+    return len(rows)
+
+
+def archive_older_than(cutoff: datetime, batch_size: int = 1000) -> int:
+    """Архивирует всех кандидатов пачками по batch_size, каждая пачка — отдельная транзакция."""
+    archived, last_id = 0, 0
+    while True:
+        ids = list(candidates(cutoff).filter(id__gt=last_id).order_by("id").values_list("id", flat=True)[:batch_size])
+        if not ids:
+            return archived
+        last_id = ids[-1]
+        archived += archive_batch(ids)
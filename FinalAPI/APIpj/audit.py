@@ -0,0 +1,203 @@
+"""
+Журнал правок перевалов по полям (PerevalAudit) с отложенной записью.
+
+PATCH /api/submitData/<id>/ не пишет журнал сам: после commit правки изменения полей
+PerevalAdded, Coords, Level и список изображений попадают в буфер процесса, а фоновый
+поток записывает буфер пачками (один INSERT на AUDIT_LOG["BATCH_SIZE"] строк) раз в
+FLUSH_INTERVAL секунд или как только набралась пачка.
+
+Буфер ограничен MAX_BUFFER записями. Если БД не успевает, записи правки, не поместившиеся
+в буфер, отбрасываются и учитываются в метрике audit.overflow: запрос не ждёт записи журнала,
+память процесса не растёт. При остановке процесса буфер дописывается через atexit.
+Пачка, которую не удалось записать из-за ошибки БД, отбрасывается и учитывается
+в метрике audit.dropped. С BACKGROUND=False (профиль тестов) записи пишутся сразу.
+"""
+import atexit
+import logging
+import os
+import threading
+import uuid
+from collections import deque
+from typing import Any, Deque, Dict, List, Optional
+
+from django.conf import settings
+from django.db import DatabaseError, close_old_connections, connection, transaction
+from django.utils import timezone
+
+from . import metrics
+from .models import PerevalAudit, PerevalImage
+
+logger = logging.getLogger(__name__)
+
+# отслеживаемые поля: модель -> поля (для ForeignKey — attname)
+TRACKED = {
+    "PerevalAdded": ("beauty_title", "title", "other_titles", "connect", "activity_type_id"),
+    "Coords": ("latitude", "longitude", "height"),
+    "Level": ("winter", "summer", "autumn", "spring"),
+}
+
+
+def config() -> Dict[str, Any]:
+    return settings.AUDIT_LOG
+
+
+class AuditWriter:
+    def __init__(self, batch_size: int = 500, flush_interval: float = 2.0, max_buffer: int = 10_000,
+                 background: bool = True) -> None:
+        self.batch_size = batch_size
+        self.flush_interval = flush_interval
+        self.max_buffer = max_buffer
+        self.background = background
+        self._buffer: Deque[PerevalAudit] = deque()
+        self._lock = threading.Lock()
+        # одна запись в БД за раз: фоновый поток и atexit не пишут одну пачку дважды
+        self._flush_lock = threading.Lock()
+        self._wakeup = threading.Event()
+        self._stopping = False
+        self._thread: Optional[threading.Thread] = None
+        self._pid: Optional[int] = None
+        self._atexit_registered = False
+
+    def __len__(self) -> int:
+        return len(self._buffer)
+
+    def add(self, entries: List[PerevalAudit]) -> None:
+        if not entries:
+            return
+        if not self.background:
+            self._write(entries)
+            return
+        self._ensure_thread()
+        with self._lock:
+            overflow = len(self._buffer) + len(entries) > self.max_buffer
+            if not overflow:
+                self._buffer.extend(entries)
+            full_batch = len(self._buffer) >= self.batch_size
+        if overflow:
+            # запрос не пишет в БД сам: под перегрузкой это добавило бы ему задержку записи всего буфера
+            metrics.incr("audit.overflow", len(entries))
+            logger.warning("Буфер журнала правок переполнен: отброшено записей %s", len(entries))
+        if full_batch:
+            self._wakeup.set()
+
+    def flush(self) -> int:
+        """Записывает всё, что накопилось в буфере. Возвращает число записанных строк."""
+        written = 0
+        with self._flush_lock:
+            while True:
+                with self._lock:
+                    batch = [self._buffer.popleft() for _ in range(min(self.batch_size, len(self._buffer)))]
+                if not batch:
+                    return written
+                written += self._write(batch)
+
+    def _write(self, batch: List[PerevalAudit]) -> int:
+        try:
+            PerevalAudit.objects.bulk_create(batch)
+        except DatabaseError:
+            logger.exception("Не удалось записать журнал правок: потеряно записей %s", len(batch))
+            metrics.incr("audit.dropped", len(batch))
+            return 0
+        metrics.incr("audit.written", len(batch))
+        return len(batch)
+
+    def _ensure_thread(self) -> None:
+        # после fork (gunicorn --preload) поток родителя в дочернем процессе не существует
+        if self._thread is not None and self._pid == os.getpid():
+            return
+        with self._lock:
+            if self._thread is not None and self._pid == os.getpid():
+                return
+            self._pid = os.getpid()
+            self._thread = threading.Thread(target=self._run, name="pereval-audit", daemon=True)
+            self._thread.start()
+            # обработчик atexit наследуется при fork, поэтому регистрируем его один раз на писателя
+            if not self._atexit_registered:
+                self._atexit_registered = True
+                atexit.register(self.stop)
+
+    def _run(self) -> None:
+        while True:
+            self._wakeup.wait(self.flush_interval)
+            self._wakeup.clear()
+            if self._stopping:
+                # остаток буфера дописывает stop() в своём потоке
+                break
+            close_old_connections()
+            try:
+                self.flush()
+            except Exception:
+                logger.exception("Ошибка фоновой записи журнала правок")
+        connection.close()
+
+    def stop(self, timeout: float = 5.0) -> None:
+        """Останавливает фоновый поток и дописывает буфер в текущем потоке."""
+        self._stopping = True
+        self._wakeup.set()
+        thread = self._thread
+        if thread is not None and thread.is_alive() and thread is not threading.current_thread():
+            thread.join(timeout)
+        self.flush()
+
+
+_writer: Optional[AuditWriter] = None
+_writer_lock = threading.Lock()
+
+
+def get_writer() -> AuditWriter:
+    global _writer
+    if _writer is None:
+        with _writer_lock:
+            if _writer is None:
+                options = config()
+                _writer = AuditWriter(
+                    batch_size=options["BATCH_SIZE"],
+                    flush_interval=options["FLUSH_INTERVAL"],
+                    max_buffer=options["MAX_BUFFER"],
+                    background=options["BACKGROUND"],
+                )
+                metrics.register_gauge("audit.buffered", lambda: len(_writer))
+    return _writer
+
+
+def capture(pereval, images: bool = False) -> Dict[str, Any]:
+    """Значения отслеживаемых полей перевала до правки. Список изображений — только если он будет заменён."""
+    state: Dict[str, Any] = {
+        "PerevalAdded": {f: getattr(pereval, f) for f in TRACKED["PerevalAdded"]},
+        "Coords": {f: getattr(pereval.coords, f) for f in TRACKED["Coords"]},
+        "Level": {f: getattr(pereval.level, f) for f in TRACKED["Level"]},
+    }
+    if images:
+        state["PerevalImage"] = _image_ids(pereval)
+    return state
+
+
+def _image_ids(pereval) -> List[int]:
+    return list(PerevalImage.objects.filter(pereval=pereval).order_by("id").values_list("image_id", flat=True))
+
+
+def diff(pereval, before: Dict[str, Any]) -> List[PerevalAudit]:
+    after = capture(pereval, images="PerevalImage" in before)
+    revision, now = uuid.uuid4(), timezone.now()
+    entries = [
+        PerevalAudit(
+            pereval_id=pereval.id, revision=revision, model=model, field=field,
+            old_value=old, new_value=after[model][field], changed_at=now,
+        )
+        for model, fields in TRACKED.items()
+        for field, old in before[model].items()
+        if after[model][field] != old
+    ]
+    if "PerevalImage" in before and before["PerevalImage"] != after["PerevalImage"]:
+        entries.append(PerevalAudit(
+            pereval_id=pereval.id, revision=revision, model="PerevalImage", field="images",
+            old_value=before["PerevalImage"], new_value=after["PerevalImage"], changed_at=now,
+        ))
+    return entries
+
+
+def record(pereval, before: Dict[str, Any]) -> None:
+    """Ставит изменения в буфер после commit текущей транзакции; откаченная правка в журнал не попадает."""
+    entries = diff(pereval, before)
+    if entries:
+        transaction.on_commit(lambda: get_writer().add(entries))
@@ -0,0 +1,305 @@
+"""
+Наборы замеров для команды `python manage.py benchmark <suite>`.
+Каждый набор — функция (options, write) -> None, зарегистрированная в SUITES.
+"""
+import gzip
+import os
+import subprocess
+import sys
+import time
+from typing import Any, Callable, Dict, List, Tuple
+
+from django.conf import settings
+from django.core.management.base import CommandError
+from rest_framework.renderers import JSONRenderer
+
+from .renderers import ORJSONRenderer
+
+try:
+    import brotli
+except ImportError:
+    brotli = None
+
+
+SUITES: Dict[str, Callable[..., None]] = {}
+
+
+def suite(name: str):
+    def decorator(func):
+        SUITES[name] = func
+        return func
+    return decorator
+
+
+def _timeit(func: Callable[[], Any], repeat: int) -> float:
+    # лучшее время из repeat запусков, в миллисекундах
+    best = float("inf")
+    for _ in range(repeat):
+        start = time.perf_counter()
+        func()
+        best = min(best, time.perf_counter() - start)
+    return best * 1000
+
+
+def _fake_pereval(i: int) -> Dict[str, Any]:
+    # структура совпадает с выводом PerevalDetailSerializer
+    return {
+        "id": i,
+        "beauty_title": "пер.",
+        "title": f"Перевал {i}",
+        "other_titles": "Другое название",
+        "connect": "Соединяет долины рек",
+        "add_time": "2025-08-12T08:55:00.000000+03:00",
+        "status": "new",
+        "user": {
+            "email": f"user{i}@mail.ru",
+            "first_name": "Иван",
+            "last_name": "Иванов",
+            "patronymic": "Иванович",
+            "phone": "+79001234567",
+            "username": f"user{i}",
+        },
+        "coords": {"latitude": 43.3 + i * 1e-5, "longitude": 42.4 + i * 1e-5, "height": 3000 + i % 2000},
+        "level": {"winter": "1А", "summer": "2Б", "autumn": "1Б", "spring": "2А"},
+        "activity_type": {"title": "Пеший"},
+        "images": [
+            {"id": i * 2 + k, "title": f"Фото {k}", "date_added": "2025-08-12T08:55:00.000000+03:00",
+             "url": f"http://testserver/media/pereval_images/{i}_{k}.jpg"}
+            for k in range(2)
+        ],
+    }
+
+
+@suite("render")
+def render_suite(options: Dict[str, Any], write: Callable[[str], None]) -> None:
+    """Время рендера и размер ответа для списка перевалов разного размера."""
+    repeat = options["repeat"]
+    sizes: List[int] = options["sizes"] or [10, 100, 1000]
+    std, fast = JSONRenderer(), ORJSONRenderer()
+
+    write(f"{'items':>6} {'json ms':>9} {'orjson ms':>10} {'raw KB':>8} {'gzip KB':>8} {'br KB':>8}")
+    for size in sizes:
+        data = {"count": size, "next": None, "previous": None,
+                "results": [_fake_pereval(i) for i in range(size)]}
+        std_ms = _timeit(lambda: std.render(data), repeat)
+        fast_ms = _timeit(lambda: fast.render(data), repeat)
+        body = fast.render(data)
+        gz = len(gzip.compress(body, compresslevel=6)) / 1024
+        br = f"{len(brotli.compress(body, quality=5)) / 1024:8.1f}" if brotli else f"{'-':>8}"
+        write(f"{size:>6} {std_ms:>9.2f} {fast_ms:>10.2f} {len(body) / 1024:>8.1f} {gz:>8.1f} {br}")
+
+
+@suite("duplicates")
+def duplicates_suite(options: Dict[str, Any], write: Callable[[str], None]) -> None:
+    """Проверка на дубли по синтетической базе перевалов (цель — меньше 50 мс на проверку)."""
+    import numpy as np
+    from .duplicates import DuplicateDetector
+
+    rng = np.random.default_rng(42)
+    sizes: List[int] = options["sizes"] or [1_000_000]
+    write(f"{'passes':>9} {'load ms':>9} {'p50 ms':>8} {'p99 ms':>8} {'max ms':>8}")
+    for size in sizes:
+        # перевалы сгущены в горных районах: 50 кластеров по ~1 градусу
+        centers = rng.uniform([30, 20], [60, 120], size=(50, 2))
+        points = centers[rng.integers(0, 50, size)] + rng.normal(0, 0.5, size=(size, 2))
+        detector = DuplicateDetector(title_loader=lambda ids: {i: f"Перевал {i}" for i in ids})
+
+        start = time.perf_counter()
+        detector.load_arrays(np.arange(size), points[:, 0], points[:, 1])
+        load_ms = (time.perf_counter() - start) * 1000
+
+        timings = []
+        for lat, lon in points[rng.integers(0, size, 200)]:
+            start = time.perf_counter()
+            detector.check(float(lat), float(lon), "Перевал 123")
+            timings.append((time.perf_counter() - start) * 1000)
+        p50, p99 = np.percentile(timings, [50, 99])
+        write(f"{size:>9} {load_ms:>9.1f} {p50:>8.2f} {p99:>8.2f} {max(timings):>8.2f}")
+
+
+_STARTUP_SCRIPT = (
+    "import time; t = time.perf_counter(); import {module}; "
+    "from django.urls import get_resolver; get_resolver().url_patterns; "
+    "print((time.perf_counter() - t) * 1000)"
+)
+
+
+def parse_importtime(stderr: str) -> List[Tuple[int, str]]:
+    """Разбор вывода -X importtime: список (cumulative мкс, модуль) для модулей верхнего уровня пакетов."""
+    totals: Dict[str, int] = {}
+    for line in stderr.splitlines():
+        if not line.startswith("import time:") or "self [us]" in line:
+            continue
+        _, cumulative, name = line.split("|", 2)
+        package = name.strip().split(".")[0]
+        depth = len(name) - len(name.lstrip(" "))
+        # берём самый внешний импорт пакета, чтобы не считать вложенные дважды
+        if depth <= totals.get(package + "#depth", depth):
+            totals[package + "#depth"] = depth
+            totals[package] = max(totals.get(package, 0), int(cumulative))
+    return sorted(((us, pkg) for pkg, us in totals.items() if not pkg.endswith("#depth")), reverse=True)
+
+
+@suite("startup")
+def startup_suite(options: Dict[str, Any], write: Callable[[str], None]) -> None:
+    """
+    Время холодного старта воркера: импорт wsgi/asgi приложения и загрузка URLconf.
+    Превышение STARTUP_IMPORT_BUDGET_MS (или --max-ms) считается регрессией.
+    """
+    budget = options.get("max_ms") or settings.STARTUP_IMPORT_BUDGET_MS
+    failed = []
+    for module in ("FinalAPI.wsgi", "FinalAPI.asgi"):
+        best, stderr = float("inf"), ""
+        for _ in range(options["repeat"]):
+            proc = subprocess.run(
+                [sys.executable, "-X", "importtime", "-c", _STARTUP_SCRIPT.format(module=module)],
+                cwd=settings.BASE_DIR, env=os.environ.copy(), capture_output=True, text=True, check=True,
+            )
+            elapsed = float(proc.stdout.strip().splitlines()[-1])
+            if elapsed < best:
+                best, stderr = elapsed, proc.stderr
+        write(f"{module}: {best:.0f} мс (бюджет {budget} мс), профиль {settings.API_PROFILE}")
+        for us, package in parse_importtime(stderr)[:10]:
+            write(f"    {us / 1000:8.1f} мс  {package}")
+        if best > budget:
+            failed.append(module)
+    if failed:
+        raise CommandError(f"Время старта превысило бюджет: {', '.join(failed)}")
+
+
+def _fill_passes(size: int, old_share: float) -> None:
+    from datetime import timedelta
+    from django.utils import timezone
+    from .models import ActivityType, Coords, Level, PerevalAdded, User
+
+    users = User.objects.bulk_create(
+        User(username=f"bench{i}", email=f"bench{i}@bench.local", phone=f"+7999{i:07d}", first_name="Б", last_name="Б")
+        for i in range(100)
+    )
+    activity = ActivityType.objects.create(title="Бенчмарк")
+    coords = Coords.objects.bulk_create(Coords(latitude=43.0, longitude=42.0, height=3000) for _ in range(size))
+    levels = Level.objects.bulk_create(Level(summer="1А") for _ in range(size))
+    old = int(size * old_share)
+    statuses = (PerevalAdded.StatusChoices.ACCEPTED, PerevalAdded.StatusChoices.REJECTED)
+    perevals = PerevalAdded.objects.bulk_create(
+        PerevalAdded(
+            beauty_title="пер.", title=f"Перевал {i}", user=users[i % len(users)], coords=coords[i], level=levels[i],
+            activity_type=activity, status=statuses[i % 2] if i < old else PerevalAdded.StatusChoices.NEW,
+        )
+        for i in range(size)
+    )
+    PerevalAdded.objects.filter(id__in=[p.id for p in perevals[:old]]).update(add_time=timezone.now() - timedelta(days=3650))
+
+
+def _hot_queries(repeat: int, size: int) -> Dict[str, float]:
+    from .models import PerevalAdded, User
+
+    user = User.objects.filter(username="bench7").first()
+    # поиск по подстроке не использует индекс и читает таблицу целиком
+    title = f"вал {size - 1}"
+    queue = PerevalAdded.objects.filter(status__in=["new", "pending"]).select_related("user", "coords", "level")
+    return {
+        "moderation queue": _timeit(lambda: list(queue.order_by("-id")[:50]), repeat),
+        "user passes": _timeit(lambda: list(PerevalAdded.objects.filter(user=user).order_by("-id")[:50]), repeat),
+        "title search": _timeit(lambda: list(PerevalAdded.objects.filter(title__icontains=title).values_list("id")[:50]), repeat),
+        "count(*)": _timeit(lambda: PerevalAdded.objects.count(), repeat),
+    }
+
+
+@suite("archive")
+def archive_suite(options: Dict[str, Any], write: Callable[[str], None]) -> None:
+    """
+    Горячие запросы к PerevalAdded до и после archive_perevals на синтетических данных
+    (90% записей — старые промодерированные). Всё выполняется в транзакции и откатывается.
+    """
+    from django.db import transaction
+    from .archive import archive_cutoff, archive_older_than
+
+    sizes: List[int] = options["sizes"] or [20_000]
+    for size in sizes:
+        with transaction.atomic():
+            _fill_passes(size, old_share=0.9)
+            before = _hot_queries(options["repeat"], size)
+            start = time.perf_counter()
+            archived = archive_older_than(archive_cutoff(), batch_size=1000)
+            archive_s = time.perf_counter() - start
+            after = _hot_queries(options["repeat"], size)
+            transaction.set_rollback(True)
+
+        write(f"{size} перевалов, в архив перенесено {archived} за {archive_s:.1f} с")
+        write(f"{'query':>18} {'before ms':>10} {'after ms':>9}")
+        for name in before:
+            write(f"{name:>18} {before[name]:>10.2f} {after[name]:>9.2f}")
+
+
+HEIGHT_CATEGORIES = ("1А", "1Б", "2А", "2Б", "3А", "3Б")
+
+
+def _fill_height_passes(size: int, chunk: int = 50_000) -> None:
+    from .models import ActivityType, Coords, Level, PerevalAdded, User
+
+    user = User.objects.create(username="bench-heights", email="heights@bench.local", phone="+79990000000")
+    activity = ActivityType.objects.create(title="Бенчмарк")
+    for start in range(0, size, chunk):
+        ids = range(start, min(start + chunk, size))
+        # высоты 500–7000 м и категории распределены равномерно, но без периодичности по id
+        coords = Coords.objects.bulk_create(
+            Coords(latitude=43.0, longitude=42.0, height=500 + (i * 7919) % 6500) for i in ids
+        )
+        levels = Level.objects.bulk_create(
+            Level(summer=HEIGHT_CATEGORIES[(i * 31) % len(HEIGHT_CATEGORIES)], winter="2А") for i in ids
+        )
+        PerevalAdded.objects.bulk_create(
+            PerevalAdded(beauty_title="пер.", title=f"Перевал {i}", user=user, coords=c, level=lv, activity_type=activity)
+            for i, c, lv in zip(ids, coords, levels)
+        )
+
+
+@suite("heights")
+def heights_suite(options: Dict[str, Any], write: Callable[[str], None]) -> None:
+    """
+    Поиск «летние 1А на 3000–4000 м» и гистограмма высот: JOIN PerevalAdded/Coords/Level
+    против индекса HeightBand. Синтетические данные создаются в транзакции и откатываются.
+    """
+    from django.db import transaction
+    from django.db.models import Count, F
+    from . import heights
+    from .models import PerevalAdded
+
+    season, category, low, high = "summer", "1А", 3000, 4000
+    size_m = heights.band_size()
+    sizes: List[int] = options["sizes"] or [100_000]
+    repeat = options["repeat"]
+    for size in sizes:
+        with transaction.atomic():
+            _fill_height_passes(size)
+            start = time.perf_counter()
+            heights.rebuild()
+            rebuild_s = time.perf_counter() - start
+
+            joined = PerevalAdded.objects.filter(
+                coords__height__gte=low, coords__height__lte=high, **{f"level__{season}": category}
+            )
+            indexed = heights.search(season, category, low, high)
+            results = {
+                "count": (
+                    _timeit(lambda: joined.count(), repeat),
+                    _timeit(lambda: indexed.count(), repeat),
+                ),
+                "page (100)": (
+                    _timeit(lambda: list(joined.order_by("coords__height", "id").values_list(
+                        "id", "title", "status", "coords__height")[:100]), repeat),
+                    _timeit(lambda: heights.page(indexed, 0, 100), repeat),
+                ),
+                "histogram": (
+                    _timeit(lambda: list(joined.values(band=F("coords__height") / size_m)
+                                         .annotate(n=Count("id")).order_by("band")), repeat),
+                    _timeit(lambda: heights.histogram(indexed), repeat),
+                ),
+            }
+            transaction.set_rollback(True)
+
+        write(f"{size} перевалов, индекс HeightBand построен за {rebuild_s:.1f} с")
+        write(f"{'query':>12} {'join ms':>9} {'index ms':>9}")
+        for name, (join_ms, index_ms) in results.items():
+            write(f"{name:>12} {join_ms:>9.2f} {index_ms:>9.2f}")
@@ -0,0 +1,239 @@
+"""
+Кластеры маркеров перевалов для карты: GET /api/map/tiles/<z>/<x>/<y>/.
+
+Для каждого уровня 0..MAX_ZOOM хранятся агрегаты по ячейкам сетки (ClusterCell):
+число перевалов, суммы координат для центра кластера и число перевалов по статусам.
+Каждый тайл делится на CELLS_PER_TILE² ячеек, ответ для тайла — это его непустые ячейки.
+
+Агрегаты меняются при создании, смене статуса, удалении и правке координат перевала
+(post_save Coords — в том числе из админки). Изменение — это дельты по ячейкам. В транзакции
+перевала они только вычисляются, а применяются после её commit в отдельной короткой транзакции:
+ячейки мелких зумов (одна строка на весь мир на зуме 0) общие для всех перевалов, и их блокировки
+не должны держаться до конца чужой транзакции создания. Недостающие строки создаются
+INSERT ... ON CONFLICT DO NOTHING, затем ячейки с одинаковой дельтой обновляются одним UPDATE.
+Если применить дельты не удалось, ошибка пишется в лог и в метрику clusters.apply_failed,
+агрегаты выравнивает `python manage.py rebuild_clusters`. Архивные перевалы остаются на карте.
+
+Ключ кэша тайла содержит его версию. После применения дельт версии затронутых тайлов увеличиваются:
+запрос, прочитавший ячейки раньше, положит в кэш ответ под старой версией, и его больше никто не прочтёт.
+"""
+import logging
+from collections import defaultdict
+from typing import Any, Dict, Iterable, List, Optional, Tuple
+
+from django.conf import settings
+from django.core.cache import cache
+from django.db import transaction
+from django.db.models import F, Q
+
+from . import metrics
+from .geo import mercator_cell
+from .models import ClusterCell, PerevalAdded, PerevalArchive
+from .signals import StatusChange
+
+logger = logging.getLogger(__name__)
+
+Cell = Tuple[int, int, int]
+Deltas = Dict[Cell, Dict[str, float]]
+
+STATUSES = tuple(PerevalAdded.StatusChoices.values)
+# ячеек в одном UPDATE: длинная цепочка OR упирается в ограничение глубины выражения SQLite
+UPDATE_CHUNK = 200
+
+
+def config() -> Dict[str, Any]:
+    return settings.MAP_CLUSTERS
+
+
+def cells_for(lat: float, lon: float) -> List[Cell]:
+    per_tile = config()["CELLS_PER_TILE"]
+    return [(z, *mercator_cell(lat, lon, z, per_tile)) for z in range(config()["MAX_ZOOM"] + 1)]
+
+
+def tile_key(z: int, x: int, y: int, version: int) -> str:
+    return f"clusters:tile:{z}:{x}:{y}:v{version}"
+
+
+def version_key(z: int, x: int, y: int) -> str:
+    return f"clusters:tile-version:{z}:{x}:{y}"
+
+
+def tile_version(z: int, x: int, y: int) -> int:
+    key = version_key(z, x, y)
+    cache.add(key, 0, timeout=None)
+    return cache.get(key, 0)
+
+
+def bump_versions(tiles: Iterable[Tuple[int, int, int]]) -> None:
+    for tile_xyz in tiles:
+        key = version_key(*tile_xyz)
+        try:
+            cache.incr(key)
+        except ValueError:
+            # версии нет (не запрашивался или вытеснен) — любое новое значение отличается от закэшированных
+            cache.add(key, 1, timeout=None)
+
+
+def _add(deltas: Deltas, lat: float, lon: float, status: Optional[str], sign: int) -> None:
+    for cell in cells_for(lat, lon):
+        delta = deltas[cell]
+        delta["count"] += sign
+        delta["sum_lat"] += sign * lat
+        delta["sum_lon"] += sign * lon
+        if status:
+            delta[status] += sign
+
+
+def aggregate(rows: Iterable[Tuple[float, float, str]]) -> Deltas:
+    """Агрегаты ячеек для набора перевалов (широта, долгота, статус)."""
+    deltas: Deltas = defaultdict(lambda: defaultdict(float))
+    for lat, lon, status in rows:
+        _add(deltas, lat, lon, status, 1)
+    return deltas
+
+
+def cell_columns(delta: Dict[str, float]) -> Dict[str, float]:
+    # счётчики — целые, суммы координат — float
+    return {field: value if field.startswith("sum_") else int(value) for field, value in delta.items() if value}
+
+
+def apply(deltas: Deltas) -> None:
+    """Применяет дельты в текущей транзакции. Из обработчиков сигналов вызывается через apply_on_commit()."""
+    if not deltas:
+        return
+    ClusterCell.objects.bulk_create([ClusterCell(zoom=z, x=x, y=y) for z, x, y in deltas], ignore_conflicts=True)
+
+    groups: Dict[Tuple[Tuple[str, float], ...], List[Cell]] = defaultdict(list)
+    for cell, delta in deltas.items():
+        key = tuple(sorted(cell_columns(delta).items()))
+        if key:
+            groups[key].append(cell)
+    for key, cells in groups.items():
+        changes = {field: F(field) + value for field, value in key}
+        for i in range(0, len(cells), UPDATE_CHUNK):
+            chunk = cells[i:i + UPDATE_CHUNK]
+            where = Q(*(Q(zoom=z, x=x, y=y) for z, x, y in chunk), _connector=Q.OR)
+            ClusterCell.objects.filter(where).update(**changes)
+
+    per_tile = config()["CELLS_PER_TILE"]
+    tiles = {(z, x // per_tile, y // per_tile) for z, x, y in deltas}
+    transaction.on_commit(lambda: bump_versions(tiles))
+
+
+def apply_on_commit(deltas: Deltas) -> None:
+    """Откладывает дельты до commit текущей транзакции и применяет их в своей короткой транзакции."""
+    if not deltas:
+        return
+
+    def run() -> None:
+        try:
+            with transaction.atomic():
+                apply(deltas)
+        except Exception:
+            # перевал уже сохранён: клиенту ошибка не нужна, агрегаты выровняет rebuild_clusters
+            logger.exception("Не удалось обновить кластеры карты")
+            metrics.incr("clusters.apply_failed")
+
+    transaction.on_commit(run)
+
+
+def record_created(pereval) -> None:
+    deltas: Deltas = defaultdict(lambda: defaultdict(float))
+    _add(deltas, pereval.coords.latitude, pereval.coords.longitude, pereval.status, 1)
+    apply_on_commit(deltas)
+
+
+def record_deleted(pereval) -> None:
+    record_removed(pereval.coords.latitude, pereval.coords.longitude, pereval.status)
+
+
+def record_removed(lat: float, lon: float, status: str) -> None:
+    """Перевал в точке (lat, lon) удалён — в том числе из архива."""
+    deltas: Deltas = defaultdict(lambda: defaultdict(float))
+    _add(deltas, lat, lon, status, -1)
+    apply_on_commit(deltas)
+
+
+def record_moved(coords, old_lat: float, old_lon: float) -> None:
+    """Координаты coords изменились: перевалы с ними переходят из старых ячеек в новые."""
+    if (old_lat, old_lon) == (coords.latitude, coords.longitude):
+        return
+    deltas: Deltas = defaultdict(lambda: defaultdict(float))
+    for status in PerevalAdded.objects.filter(coords_id=coords.id).values_list("status", flat=True):
+        _add(deltas, old_lat, old_lon, status, -1)
+        _add(deltas, coords.latitude, coords.longitude, status, 1)
+    apply_on_commit(deltas)
+
+
+def record_status_changes(changes: List[StatusChange]) -> None:
+    points = {
+        pk: (lat, lon)
+        for pk, lat, lon in PerevalAdded.objects.filter(id__in=[c.pereval_id for c in changes])
+        .values_list("id", "coords__latitude", "coords__longitude")
+    }
+    deltas: Deltas = defaultdict(lambda: defaultdict(float))
+    for change in changes:
+        if change.pereval_id not in points:
+            continue
+        for cell in cells_for(*points[change.pereval_id]):
+            if change.old_status in STATUSES:
+                deltas[cell][change.old_status] -= 1
+            deltas[cell][change.new_status] += 1
+    apply_on_commit(deltas)
+
+
+def rebuild() -> int:
+    """Пересчитывает все ячейки по рабочей и архивной таблицам. Возвращает число ячеек."""
+    rows = [
+        *PerevalAdded.objects.values_list("coords__latitude", "coords__longitude", "status").iterator(chunk_size=2000),
+        *PerevalArchive.objects.values_list("latitude", "longitude", "status").iterator(chunk_size=2000),
+    ]
+    cells = [ClusterCell(zoom=z, x=x, y=y, **cell_columns(delta)) for (z, x, y), delta in aggregate(rows).items()]
+    per_tile = config()["CELLS_PER_TILE"]
+    with transaction.atomic():
+        tiles = {(z, x // per_tile, y // per_tile) for z, x, y in ClusterCell.objects.values_list("zoom", "x", "y")}
+        ClusterCell.objects.all().delete()
+        ClusterCell.objects.bulk_create(cells, batch_size=1000)
+    tiles.update((c.zoom, c.x // per_tile, c.y // per_tile) for c in cells)
+    bump_versions(tiles)
+    return len(cells)
+
+
+def _tile_clusters(z: int, x: int, y: int) -> List[Dict[str, Any]]:
+    per_tile = config()["CELLS_PER_TILE"]
+    rows = (
+        ClusterCell.objects.filter(
+            zoom=z, count__gt=0,
+            x__gte=x * per_tile, x__lt=(x + 1) * per_tile,
+            y__gte=y * per_tile, y__lt=(y + 1) * per_tile,
+        )
+        .values_list("count", "sum_lat", "sum_lon", *STATUSES)
+        .order_by("x", "y")
+    )
+    return [
+        {
+            "count": count,
+            "lat": round(sum_lat / count, 6),
+            "lon": round(sum_lon / count, 6),
+            "statuses": dict(zip(STATUSES, by_status)),
+        }
+        for count, sum_lat, sum_lon, *by_status in rows
+    ]
+
+
+def tile(z: int, x: int, y: int) -> List[Dict[str, Any]]:
+    """
+    Кластеры тайла z/x/y. Тайлы мельче MAX_ZOOM берутся из тайла-предка на MAX_ZOOM
+    с отбором кластеров, чей центр попадает в запрошенный тайл.
+    """
+    max_zoom = config()["MAX_ZOOM"]
+    shift = max(0, z - max_zoom)
+    base = (z - shift, x >> shift, y >> shift)
+    key = tile_key(*base, tile_version(*base))
+    clusters = cache.get(key)
+    if clusters is None:
+        clusters = _tile_clusters(*base)
+        cache.set(key, clusters, config()["CACHE_TTL"])
+    if shift:
+        clusters = [c for c in clusters if mercator_cell(c["lat"], c["lon"], z) == (x, y)]
+    return clusters
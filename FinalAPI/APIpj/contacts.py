@@ -0,0 +1,61 @@
+"""
+Канонический вид email и телефона отправителя (User.email_canonical, User.phone_canonical).
+
+Пользователь ищется по каноническим колонкам с уникальными индексами, поэтому
+`Alex@mail.ru` и `alex@mail.ru`, `+7 (900) 123-45-67` и `89001234567` — один и тот же человек.
+
+Исключение — дубликаты, созданные до нормализации (миграция 0017): у более поздних из них
+каноническое значение занято более ранним пользователем и остаётся NULL. Такие пользователи
+находятся по точному совпадению email/телефона (email_lookup, phone_lookup).
+"""
+import re
+from typing import Optional
+
+from django.db.models import Q
+
+_NON_DIGITS_RE = re.compile(r"\D")
+# E.164: не больше 15 цифр после «+»
+MAX_PHONE_DIGITS = 15
+
+
+def canonical_email(email: Optional[str]) -> Optional[str]:
+    """Email без пробелов по краям и в нижнем регистре; None для пустого."""
+    if not isinstance(email, str) or not email.strip():
+        return None
+    return email.strip().lower()
+
+
+def canonical_phone(phone: Optional[str]) -> Optional[str]:
+    """
+    Телефон в виде «+» и цифры: скобки, пробелы и дефисы отбрасываются, российский
+    префикс 8 заменяется на +7. None, если цифр нет или их больше MAX_PHONE_DIGITS.
+    """
+    if not isinstance(phone, str):
+        return None
+    digits = _NON_DIGITS_RE.sub("", phone)
+    if len(digits) == 11 and digits[0] == "8":
+        digits = "7" + digits[1:]
+    if not digits or len(digits) > MAX_PHONE_DIGITS:
+        return None
+    return "+" + digits
+
+
+def _lookup(field: str, value: Optional[str], key: Optional[str], prefix: str) -> Optional[Q]:
+    if key is None:
+        return None
+    return Q(**{f"{prefix}{field}_canonical": key}) | Q(
+        **{f"{prefix}{field}_canonical__isnull": True, f"{prefix}{field}": value.strip()}
+    )
+
+
+def email_lookup(email: Optional[str], prefix: str = "") -> Optional[Q]:
+    """
+    Условие поиска пользователя по email: канонический email или, у дубликатов без него, точный.
+    prefix — путь к пользователю («user__»). None для пустого email: по NULL искать нельзя.
+    """
+    return _lookup("email", email, canonical_email(email), prefix)
+
+
+def phone_lookup(phone: Optional[str], prefix: str = "") -> Optional[Q]:
+    """То же для телефона."""
+    return _lookup("phone", phone, canonical_phone(phone), prefix)
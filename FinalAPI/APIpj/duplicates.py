@@ -0,0 +1,226 @@
+"""
+Поиск возможных дублей перевалов: рядом по координатам и с похожим названием.
+
+Координаты всех перевалов держатся в памяти процесса в массивах NumPy, отсортированных по широте.
+Проверка берёт полосу широт бинарным поиском, считает haversine векторно только по ней,
+а названия догружает из БД лишь для кандидатов в радиусе.
+
+Новый перевал проверяется после commit его создания (flag_new): найденные дубли сохраняются
+в PossibleDuplicate, и в списке перевалов админки они отмечены колонкой и фильтром.
+Удалённые и перенесённые в архив перевалы убираются из индекса сразу в своём процессе (forget)
+и по журналу PerevalChange — в остальных.
+"""
+import logging
+import re
+import threading
+import time
+from difflib import SequenceMatcher
+from typing import Callable, Dict, Iterable, List, NamedTuple, Optional, Tuple
+
+import numpy as np
+from django.conf import settings
+
+from .geo import KM_PER_DEGREE, haversine_km_many
+
+logger = logging.getLogger(__name__)
+
+TitleLoader = Callable[[Iterable[int]], Dict[int, str]]
+
+_PREFIX_RE = re.compile(r"^(пер\.?|перевал)\s+", re.IGNORECASE)
+
+
+class Duplicate(NamedTuple):
+    id: int
+    distance_km: float
+    similarity: float
+
+
+def normalize_title(title: str) -> str:
+    title = " ".join((title or "").lower().replace("ё", "е").split())
+    return _PREFIX_RE.sub("", title)
+
+
+def title_similarity(a: str, b: str) -> float:
+    a, b = normalize_title(a), normalize_title(b)
+    if not a or not b:
+        return 0.0
+    return SequenceMatcher(None, a, b).ratio()
+
+
+def _load_titles(ids: Iterable[int]) -> Dict[int, str]:
+    from .models import PerevalAdded
+
+    return dict(PerevalAdded.objects.filter(id__in=list(ids)).values_list("id", "title"))
+
+
+class DuplicateDetector:
+    def __init__(self, title_loader: TitleLoader = _load_titles) -> None:
+        self.title_loader = title_loader
+        self._ids = np.empty(0, dtype=np.int64)
+        self._lat = np.empty(0, dtype=np.float64)
+        self._lon = np.empty(0, dtype=np.float64)
+        self._lock = threading.Lock()
+        # одно обновление из БД за раз: параллельные запросы не повторяют одно и то же сканирование
+        self._refresh_lock = threading.Lock()
+        self._synced_at = None
+        self._checked_at = 0.0
+        self._loaded_at = 0.0
+
+    def __len__(self) -> int:
+        return len(self._ids)
+
+    def load_arrays(self, ids, lats, lons) -> None:
+        """Полная загрузка из готовых массивов (используется в refresh и в замерах)."""
+        order = np.argsort(lats, kind="stable")
+        with self._lock:
+            self._ids = np.asarray(ids, dtype=np.int64)[order]
+            self._lat = np.asarray(lats, dtype=np.float64)[order]
+            self._lon = np.asarray(lons, dtype=np.float64)[order]
+
+    def upsert(self, rows: List[Tuple[int, float, float]]) -> None:
+        """Добавляет или переставляет точки. rows — список (id, широта, долгота)."""
+        if not rows:
+            return
+        ids = np.fromiter((r[0] for r in rows), dtype=np.int64, count=len(rows))
+        lats = np.fromiter((r[1] for r in rows), dtype=np.float64, count=len(rows))
+        lons = np.fromiter((r[2] for r in rows), dtype=np.float64, count=len(rows))
+        with self._lock:
+            keep = ~np.isin(self._ids, ids)
+            base_ids, base_lat, base_lon = self._ids[keep], self._lat[keep], self._lon[keep]
+            order = np.argsort(lats, kind="stable")
+            pos = np.searchsorted(base_lat, lats[order])
+            self._ids = np.insert(base_ids, pos, ids[order])
+            self._lat = np.insert(base_lat, pos, lats[order])
+            self._lon = np.insert(base_lon, pos, lons[order])
+
+    def refresh(self, force: bool = False) -> None:
+        """
+        Подтягивает из БД перевалы, изменённые после прошлой синхронизации. Окно перекрывается
+        с прошлым на OVERLAP секунд: upsert идемпотентен, а поздно зафиксированные правки не теряются.
+        """
+        # первую загрузку ждём; инкрементальное обновление, уже идущее в другом потоке, не повторяем
+        if not self._refresh_lock.acquire(blocking=force or self._synced_at is None):
+            return
+        try:
+            self._refresh(force)
+        finally:
+            self._refresh_lock.release()
+
+    def _refresh(self, force: bool) -> None:
+        from datetime import timedelta
+
+        from django.utils import timezone
+        from .models import PerevalAdded, PerevalChange
+
+        config = settings.DUPLICATE_DETECTOR
+        now = time.monotonic()
+        if not force and now - self._checked_at < config["REFRESH_INTERVAL"]:
+            return
+        self._checked_at = now
+
+        full = force or self._synced_at is None or now - self._loaded_at > config["RELOAD_INTERVAL"]
+        synced_at = timezone.now()
+        qs = PerevalAdded.objects.exclude(status=PerevalAdded.StatusChoices.REJECTED)
+        if full:
+            rows = np.array(list(qs.values_list("id", "coords__latitude", "coords__longitude")), dtype=np.float64)
+            rows = rows.reshape(-1, 3)
+            self.load_arrays(rows[:, 0].astype(np.int64), rows[:, 1], rows[:, 2])
+            self._loaded_at = now
+        else:
+            since = self._synced_at - timedelta(seconds=config.get("OVERLAP", 60))
+            changed = PerevalAdded.objects.filter(updated_at__gte=since)
+            rows = list(changed.values_list("id", "coords__latitude", "coords__longitude", "status"))
+            rejected = [r[0] for r in rows if r[3] == PerevalAdded.StatusChoices.REJECTED]
+            gone = PerevalChange.objects.filter(
+                created_at__gte=since, kind__in=[PerevalChange.Kind.DELETED, PerevalChange.Kind.ARCHIVED],
+            ).values_list("pereval_id", flat=True)
+            self.remove(rejected + list(gone))
+            self.upsert([r[:3] for r in rows if r[3] != PerevalAdded.StatusChoices.REJECTED])
+        self._synced_at = synced_at
+
+    def remove(self, ids: List[int]) -> None:
+        if not ids:
+            return
+        with self._lock:
+            keep = ~np.isin(self._ids, np.asarray(ids, dtype=np.int64))
+            self._ids, self._lat, self._lon = self._ids[keep], self._lat[keep], self._lon[keep]
+
+    def nearby(self, lat: float, lon: float, radius_km: float) -> Tuple[np.ndarray, np.ndarray]:
+        """id и расстояния (км) всех точек в радиусе radius_km."""
+        dlat = radius_km / KM_PER_DEGREE
+        with self._lock:
+            lo = np.searchsorted(self._lat, lat - dlat, side="left")
+            hi = np.searchsorted(self._lat, lat + dlat, side="right")
+            ids, lats, lons = self._ids[lo:hi], self._lat[lo:hi], self._lon[lo:hi]
+        dist = haversine_km_many(lat, lon, lats, lons)
+        mask = dist <= radius_km
+        return ids[mask], dist[mask]
+
+    def check(self, lat: float, lon: float, title: str, exclude_id: Optional[int] = None) -> List[Duplicate]:
+        """
+        Возможные дубли: в радиусе RADIUS_KM с похожестью названия не ниже MIN_SIMILARITY,
+        либо ближе SAME_PLACE_KM независимо от названия.
+        """
+        config = settings.DUPLICATE_DETECTOR
+        ids, dist = self.nearby(lat, lon, config["RADIUS_KM"])
+        if exclude_id is not None:
+            mask = ids != exclude_id
+            ids, dist = ids[mask], dist[mask]
+        if not len(ids):
+            return []
+
+        # названия нужны только кандидатам, поэтому догружаем их точечно
+        order = np.argsort(dist)[: config["MAX_CANDIDATES"]]
+        titles = self.title_loader(int(i) for i in ids[order])
+        result: List[Duplicate] = []
+        for i in order:
+            pk, km = int(ids[i]), float(dist[i])
+            if pk not in titles:
+                continue
+            similarity = title_similarity(title, titles[pk])
+            if similarity >= config["MIN_SIMILARITY"] or km <= config["SAME_PLACE_KM"]:
+                result.append(Duplicate(pk, round(km, 3), round(similarity, 2)))
+        return result
+
+
+_detector: Optional[DuplicateDetector] = None
+_detector_lock = threading.Lock()
+
+
+def get_detector() -> DuplicateDetector:
+    global _detector
+    with _detector_lock:
+        if _detector is None:
+            _detector = DuplicateDetector()
+    _detector.refresh()
+    return _detector
+
+
+def find_duplicates(pereval) -> List[Duplicate]:
+    coords = pereval.coords
+    return get_detector().check(coords.latitude, coords.longitude, pereval.title, exclude_id=pereval.id)
+
+
+def forget(pereval_id: int) -> None:
+    """Убирает удалённый перевал из индекса процесса, если индекс уже построен."""
+    if _detector is not None:
+        _detector.remove([pereval_id])
+
+
+def flag_new(pereval_id: int) -> List[Duplicate]:
+    """Проверяет только что созданный перевал и сохраняет найденные дубли в PossibleDuplicate."""
+    from .models import PerevalAdded, PossibleDuplicate
+
+    pereval = PerevalAdded.objects.select_related("coords").filter(id=pereval_id).first()
+    if pereval is None:
+        return []
+    detector = get_detector()
+    if pereval.status != PerevalAdded.StatusChoices.REJECTED:
+        detector.upsert([(pereval.id, pereval.coords.latitude, pereval.coords.longitude)])
+    duplicates = find_duplicates(pereval)
+    PossibleDuplicate.objects.bulk_create(
+        [PossibleDuplicate(pereval_id=pereval.id, duplicate_id=d.id, distance_km=d.distance_km, similarity=d.similarity)
+         for d in duplicates],
+        ignore_conflicts=True,
+    )
+    return duplicates
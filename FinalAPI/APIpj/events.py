@@ -0,0 +1,208 @@
+"""
+Рассылка смен статуса перевалов подписчикам SSE (GET /api/submitData/events/).
+
+EventBroker раздаёт события подписчикам своего процесса. Между процессами события
+передаёт бэкенд (settings.API_EVENTS["BACKEND"]):
+- LocalBackend — только текущий процесс;
+- PostgresNotifyBackend — PostgreSQL LISTEN/NOTIFY, для нескольких воркеров.
+
+У каждого подписчика ограниченная очередь. Если клиент не успевает читать, очередь
+очищается и ему отправляется событие resync: клиент догружает изменения через /api/submitData/changes/.
+"""
+import asyncio
+import json
+import logging
+import select
+import threading
+import time
+from collections import defaultdict
+from typing import Any, Callable, Dict, Optional, Set
+
+from django.conf import settings
+from django.db import connections
+from django.utils.module_loading import import_string
+
+from . import metrics
+
+logger = logging.getLogger(__name__)
+
+Event = Dict[str, Any]
+RESYNC: Event = {"type": "resync"}
+
+
+class Subscription:
+    def __init__(self, user_id: int, maxsize: int) -> None:
+        self.user_id = user_id
+        self.loop = asyncio.get_running_loop()
+        self.queue: asyncio.Queue = asyncio.Queue(maxsize=maxsize)
+
+    def push(self, event: Event) -> None:
+        # вызывается в потоке event loop подписчика
+        if self.queue.full():
+            while not self.queue.empty():
+                self.queue.get_nowait()
+            self.queue.put_nowait(RESYNC)
+            metrics.incr("events.overflow")
+            return
+        self.queue.put_nowait(event)
+
+
+class EventBroker:
+    def __init__(self, backend, queue_size: int) -> None:
+        self.backend = backend
+        self.queue_size = queue_size
+        self._subscriptions: Dict[int, Set[Subscription]] = defaultdict(set)
+        self._lock = threading.Lock()
+        self._started = False
+
+    def subscribe(self, user_id: int) -> Subscription:
+        with self._lock:
+            if not self._started:
+                self.backend.start(self.dispatch)
+                self._started = True
+            sub = Subscription(user_id, self.queue_size)
+            self._subscriptions[user_id].add(sub)
+        metrics.incr("events.subscribed")
+        return sub
+
+    def unsubscribe(self, sub: Subscription) -> None:
+        with self._lock:
+            subs = self._subscriptions.get(sub.user_id)
+            if subs is not None:
+                subs.discard(sub)
+                if not subs:
+                    del self._subscriptions[sub.user_id]
+
+    def subscriber_count(self) -> int:
+        with self._lock:
+            return sum(len(subs) for subs in self._subscriptions.values())
+
+    def publish(self, event: Event) -> None:
+        self.backend.publish(event)
+
+    def dispatch(self, event: Event) -> None:
+        # событие из бэкенда раздаём подписчикам этого процесса; RESYNC — всем
+        with self._lock:
+            if event is RESYNC:
+                subs = [sub for user_subs in self._subscriptions.values() for sub in user_subs]
+            else:
+                subs = list(self._subscriptions.get(event.get("user_id"), ()))
+        for sub in subs:
+            try:
+                sub.loop.call_soon_threadsafe(sub.push, event)
+            except RuntimeError:
+                # event loop подписчика уже закрыт
+                self.unsubscribe(sub)
+
+
+class LocalBackend:
+    def __init__(self, **options: Any) -> None:
+        self._dispatch: Optional[Callable[[Event], None]] = None
+
+    def start(self, dispatch: Callable[[Event], None]) -> None:
+        self._dispatch = dispatch
+
+    def publish(self, event: Event) -> None:
+        if self._dispatch is not None:
+            self._dispatch(event)
+
+
+class PostgresNotifyBackend:
+    """
+    События через NOTIFY: каждый процесс с подписчиками слушает канал в отдельном потоке.
+
+    При ошибке соединения поток переподключается с задержкой reconnect_delay, которая удваивается
+    до max_reconnect_delay. NOTIFY, отправленные, пока слушателя не было, потеряны, поэтому после
+    переподключения все подписчики процесса получают resync.
+    """
+
+    def __init__(
+        self,
+        channel: str = "pereval_status",
+        database: str = "default",
+        reconnect_delay: float = 1.0,
+        max_reconnect_delay: float = 30.0,
+        **options: Any,
+    ) -> None:
+        self.channel = channel
+        self.database = database
+        self.reconnect_delay = reconnect_delay
+        self.max_reconnect_delay = max_reconnect_delay
+
+    def publish(self, event: Event) -> None:
+        with connections[self.database].cursor() as cursor:
+            cursor.execute("SELECT pg_notify(%s, %s)", [self.channel, json.dumps(event)])
+
+    def start(self, dispatch: Callable[[Event], None]) -> None:
+        thread = threading.Thread(target=self._listen, args=(dispatch,), name="pereval-events", daemon=True)
+        thread.start()
+
+    def _listen(self, dispatch: Callable[[Event], None]) -> None:
+        delay, lost = self.reconnect_delay, False
+        while True:
+            conn = None
+            try:
+                conn = self._connect()
+                if lost:
+                    metrics.incr("events.reconnected")
+                    dispatch(RESYNC)
+                delay, lost = self.reconnect_delay, False
+                self._serve(conn, dispatch)
+            except Exception:
+                lost = True
+                metrics.incr("events.connection_lost")
+                logger.warning(
+                    "Соединение LISTEN %s потеряно, повтор через %.0f с", self.channel, delay, exc_info=True
+                )
+            finally:
+                if conn is not None:
+                    try:
+                        conn.close()
+                    except Exception:
+                        pass
+            time.sleep(delay)
+            delay = min(delay * 2, self.max_reconnect_delay)
+
+    def _connect(self):
+        import psycopg2
+        from psycopg2.extensions import ISOLATION_LEVEL_AUTOCOMMIT
+
+        db = settings.DATABASES[self.database]
+        conn = psycopg2.connect(
+            dbname=db["NAME"], user=db["USER"], password=db["PASSWORD"], host=db["HOST"], port=db["PORT"],
+        )
+        conn.set_isolation_level(ISOLATION_LEVEL_AUTOCOMMIT)
+        with conn.cursor() as cursor:
+            cursor.execute(f'LISTEN "{self.channel}"')
+        return conn
+
+    def _serve(self, conn, dispatch: Callable[[Event], None]) -> None:
+        # возвращается только исключением: обрыв соединения, ошибка select/poll
+        while True:
+            if select.select([conn], [], [], 5) == ([], [], []):
+                # тишина в канале: проверяем, что соединение живо (полуоткрытое TCP select не заметит)
+                with conn.cursor() as cursor:
+                    cursor.execute("SELECT 1")
+                continue
+            conn.poll()
+            while conn.notifies:
+                notify = conn.notifies.pop(0)
+                try:
+                    dispatch(json.loads(notify.payload))
+                except ValueError:
+                    logger.warning("Некорректное событие в канале %s: %r", self.channel, notify.payload)
+
+
+_broker: Optional[EventBroker] = None
+_broker_lock = threading.Lock()
+
+
+def get_broker() -> EventBroker:
+    global _broker
+    with _broker_lock:
+        if _broker is None:
+            config = settings.API_EVENTS
+            backend = import_string(config["BACKEND"])(**config.get("OPTIONS", {}))
+            _broker = EventBroker(backend, queue_size=config.get("QUEUE_SIZE", 100))
+            metrics.register_gauge("events.subscribers", _broker.subscriber_count)
+        return _broker
@@ -0,0 +1,132 @@
+"""
+Единый обработчик ошибок API (REST_FRAMEWORK["EXCEPTION_HANDLER"]).
+
+Ответ об ошибке сохраняет привычный конверт эндпоинта и дополняет его стабильным кодом:
+    {"status": 400, "message": "...", "id": null, "code": "invalid", "errors": {...}}
+    {"state": 0, "message": "...", "code": "not_editable"}  — правка перевала (PUT/PATCH)
+code — код DRF (invalid, not_found, throttled, parse_error, ...) или код ApiError, errors —
+ошибки полей в виде {"поле": [{"message": ..., "code": ...}]}, только для ошибок валидации.
+
+Нарушение уникального ограничения в БД (гонка двух запросов за одну запись) — 409 с code="conflict"
+и предупреждением в логе; прочие IntegrityError (внешний ключ, NOT NULL, CHECK) — ошибки сервера.
+Непредвиденные исключения не маскируются: они пишутся в лог с трассировкой, а клиент
+получает 500 с code="server_error" без текста исключения. Число ошибок по кодам —
+в метриках errors.<code> (GET /api/metrics/).
+"""
+import logging
+from typing import Any, Dict, Iterator, Optional
+
+from django.core.exceptions import PermissionDenied, ValidationError as DjangoValidationError
+from django.db import IntegrityError
+from django.http import Http404, JsonResponse
+from rest_framework import exceptions, status
+from rest_framework.fields import get_error_detail
+from rest_framework.response import Response
+from rest_framework.views import exception_handler, set_rollback
+
+from . import metrics
+
+logger = logging.getLogger(__name__)
+
+SERVER_ERROR_MESSAGE = "Внутренняя ошибка сервера"
+# SQLSTATE unique_violation в PostgreSQL
+UNIQUE_VIOLATION = "23505"
+
+
+class ApiError(exceptions.APIException):
+    """Ошибка с сообщением для конверта ответа и стабильным кодом."""
+
+    def __init__(self, message: str, code: str, status_code: int = status.HTTP_400_BAD_REQUEST) -> None:
+        self.status_code = status_code
+        super().__init__(message, code)
+
+
+class Conflict(exceptions.APIException):
+    status_code = status.HTTP_409_CONFLICT
+    default_detail = "Запись конфликтует с уже существующими данными"
+    default_code = "conflict"
+
+
+def is_unique_violation(exc: IntegrityError) -> bool:
+    # Django оборачивает исключение драйвера и сохраняет его в __cause__
+    cause = exc.__cause__
+    if getattr(cause, "pgcode", None) == UNIQUE_VIOLATION or getattr(cause, "sqlstate", None) == UNIQUE_VIOLATION:
+        return True
+    return str(exc).startswith("UNIQUE constraint failed")  # SQLite
+
+
+def _as_api_exception(exc: Exception, view=None) -> Optional[exceptions.APIException]:
+    if isinstance(exc, exceptions.APIException):
+        return exc
+    if isinstance(exc, Http404):
+        return exceptions.NotFound(*exc.args)
+    if isinstance(exc, PermissionDenied):
+        return exceptions.PermissionDenied(*exc.args)
+    if isinstance(exc, DjangoValidationError):
+        return exceptions.ValidationError(get_error_detail(exc))
+    if isinstance(exc, IntegrityError) and is_unique_violation(exc):
+        logger.warning("Конфликт уникальности в %s: %s", type(view).__name__, exc)
+        return Conflict()
+    return None
+
+
+def _flatten(detail: Any, path: str = "") -> Iterator[str]:
+    if isinstance(detail, dict):
+        for key, value in detail.items():
+            yield from _flatten(value, f"{path}.{key}" if path else str(key))
+    elif isinstance(detail, list):
+        for i, item in enumerate(detail):
+            yield from _flatten(item, f"{path}[{i}]" if isinstance(item, (dict, list)) else path)
+    else:
+        yield f"{path}: {detail}" if path else str(detail)
+
+
+def describe(exc: exceptions.APIException) -> str:
+    """Короткий текст ошибки для поля message: «поле: сообщение» через точку с запятой."""
+    if isinstance(exc, exceptions.ValidationError):
+        return "Validation error: " + "; ".join(_flatten(exc.detail))
+    return str(exc.detail)
+
+
+def error_code(exc: exceptions.APIException) -> str:
+    if isinstance(exc, exceptions.ValidationError):
+        return exc.default_code
+    code = exc.get_codes()
+    return code if isinstance(code, str) else exc.default_code
+
+
+def error_body(view, status_code: int, message: str, code: str, errors: Any = None) -> Dict[str, Any]:
+    if view is not None and view.request.method in getattr(view, "state_envelope_methods", ()):
+        body: Dict[str, Any] = {"state": 0, "message": message, "code": code}
+    else:
+        body = {"status": status_code, "message": message, "id": None, "code": code}
+    if errors is not None:
+        body["errors"] = errors
+    return body
+
+
+def json_error(status_code: int, message: str, code: str) -> JsonResponse:
+    """Ошибка в том же конверте для обычных Django views и middleware, минуя DRF."""
+    metrics.incr(f"errors.{code}")
+    return JsonResponse(error_body(None, status_code, message, code), status=status_code)
+
+
+def api_exception_handler(exc: Exception, context: Dict[str, Any]) -> Response:
+    view = context.get("view")
+    api_exc = _as_api_exception(exc, view)
+    if api_exc is None:
+        logger.error("Необработанная ошибка в %s", type(view).__name__, exc_info=exc)
+        set_rollback()
+        metrics.incr("errors.server_error")
+        return Response(
+            error_body(view, status.HTTP_500_INTERNAL_SERVER_ERROR, SERVER_ERROR_MESSAGE, "server_error"),
+            status=status.HTTP_500_INTERNAL_SERVER_ERROR,
+        )
+
+    # стандартный обработчик DRF проставляет Retry-After/WWW-Authenticate и откатывает транзакцию
+    response = exception_handler(api_exc, context)
+    code = error_code(api_exc)
+    metrics.incr(f"errors.{code}")
+    errors = api_exc.get_full_details() if isinstance(api_exc, exceptions.ValidationError) else None
+    response.data = error_body(view, response.status_code, describe(api_exc), code, errors)
+    return response
@@ -0,0 +1,160 @@
+"""
+Метаданные фотографий: время съёмки, GPS и размеры из EXIF.
+
+Файл открывается через Pillow без декодирования пикселей: читаются только заголовок и блок EXIF.
+При загрузке через API метаданные читаются сразу из загруженного файла. Старые файлы из media/
+обрабатывает `python manage.py backfill_exif` пулом процессов, по одному на ядро.
+"""
+import math
+from concurrent.futures import ProcessPoolExecutor
+from datetime import datetime, timedelta, timezone as dt_timezone
+from typing import Any, Dict, Iterable, Iterator, List, NamedTuple, Optional, Tuple
+
+from django.conf import settings
+from django.db.models import F, Q
+from django.db.models.functions import Abs
+from django.utils import timezone
+
+from .geo import KM_PER_DEGREE, haversine_km_expr
+
+EXIF_IFD = 0x8769
+GPS_IFD = 0x8825
+TAG_DATETIME = 0x0132
+TAG_DATETIME_ORIGINAL = 0x9003
+TAG_OFFSET_TIME_ORIGINAL = 0x9011
+GPS_LATITUDE_REF, GPS_LATITUDE, GPS_LONGITUDE_REF, GPS_LONGITUDE = 1, 2, 3, 4
+
+
+class ExifData(NamedTuple):
+    width: int
+    height: int
+    taken_at: Optional[datetime]
+    gps_latitude: Optional[float]
+    gps_longitude: Optional[float]
+
+    def fields(self) -> Dict[str, Any]:
+        """Значения для колонок Image. Время без часового пояса считаем временем TIME_ZONE."""
+        taken_at = self.taken_at
+        if taken_at is not None and settings.USE_TZ and timezone.is_naive(taken_at):
+            taken_at = timezone.make_aware(taken_at)
+        return {
+            "width": self.width,
+            "height": self.height,
+            "taken_at": taken_at,
+            "gps_latitude": self.gps_latitude,
+            "gps_longitude": self.gps_longitude,
+        }
+
+
+# файл не удалось прочитать как изображение: нулевые размеры, чтобы backfill не брал его снова
+UNREADABLE = ExifData(0, 0, None, None, None)
+
+
+def _parse_datetime(value: Any, offset: Any) -> Optional[datetime]:
+    try:
+        parsed = datetime.strptime(str(value).strip("\x00 "), "%Y:%m:%d %H:%M:%S")
+    except ValueError:
+        return None
+    if isinstance(offset, str) and len(offset) >= 6 and offset[0] in "+-":
+        try:
+            delta = timedelta(hours=int(offset[1:3]), minutes=int(offset[4:6]))
+        except ValueError:
+            return parsed
+        parsed = parsed.replace(tzinfo=dt_timezone(-delta if offset[0] == "-" else delta))
+    return parsed
+
+
+def _parse_coordinate(dms: Any, ref: Any, limit: float) -> Optional[float]:
+    try:
+        degrees, minutes, seconds = (float(part) for part in dms)
+    except (TypeError, ValueError, ZeroDivisionError):
+        return None
+    value = degrees + minutes / 60 + seconds / 3600
+    if str(ref).upper().startswith(("S", "W")):
+        value = -value
+    return value if abs(value) <= limit else None
+
+
+def read_exif(fp) -> ExifData:
+    """Читает EXIF из пути или файлового объекта. Пиксели не декодируются."""
+    from PIL import Image as PILImage, UnidentifiedImageError
+
+    try:
+        with PILImage.open(fp) as img:
+            width, height = img.size
+            exif = img.getexif()
+            sub = exif.get_ifd(EXIF_IFD)
+            gps = exif.get_ifd(GPS_IFD)
+    except (UnidentifiedImageError, OSError, ValueError, SyntaxError):
+        return UNREADABLE
+
+    taken_at = _parse_datetime(
+        sub.get(TAG_DATETIME_ORIGINAL) or exif.get(TAG_DATETIME), sub.get(TAG_OFFSET_TIME_ORIGINAL)
+    )
+    lat = _parse_coordinate(gps.get(GPS_LATITUDE), gps.get(GPS_LATITUDE_REF), 90)
+    lon = _parse_coordinate(gps.get(GPS_LONGITUDE), gps.get(GPS_LONGITUDE_REF), 180)
+    if lat is None or lon is None:
+        lat = lon = None
+    return ExifData(width, height, taken_at, lat, lon)
+
+
+def read_uploaded(file_obj) -> Dict[str, Any]:
+    """Поля Image для загруженного файла; позиция в файле возвращается в начало для сохранения."""
+    if file_obj is None:
+        return {}
+    try:
+        return read_exif(file_obj).fields()
+    finally:
+        file_obj.seek(0)
+
+
+def _read_path(path: str) -> ExifData:
+    # выполняется в процессе пула: только Pillow, без обращений к Django и БД
+    return read_exif(path)
+
+
+def read_many(paths: List[str], pool: Optional[ProcessPoolExecutor] = None, chunksize: int = 16) -> Iterator[ExifData]:
+    """
+    EXIF для списка путей в том же порядке. С пулом все задачи отправляются сразу,
+    поэтому пока вызывающий код пишет в БД предыдущую пачку, процессы уже читают следующую.
+    """
+    if pool is None:
+        return map(_read_path, paths)
+    return pool.map(_read_path, paths, chunksize=chunksize)
+
+
+def gps_mismatch_images():
+    """
+    Связи PerevalImage с фото, снятыми дальше EXIF_GPS_MAX_DISTANCE_KM от координат перевала,
+    с аннотацией km. Сначала отсекаются пары, разошедшиеся по широте и долготе меньше чем
+    на limit/√2 (далёкие пары в них не входят), точное расстояние считается только для остальных.
+    Годится для подзапроса: Exists(gps_mismatch_images().filter(pereval=OuterRef("pk"))).
+    """
+    from .models import PerevalImage
+
+    limit = settings.EXIF_GPS_MAX_DISTANCE_KM
+    threshold = limit / KM_PER_DEGREE / math.sqrt(2)
+    return PerevalImage.objects.filter(image__gps_latitude__isnull=False).alias(
+        dlat=Abs(F("image__gps_latitude") - F("pereval__coords__latitude")),
+        dlon=Abs(F("image__gps_longitude") - F("pereval__coords__longitude")),
+    ).filter(Q(dlat__gte=threshold) | Q(dlon__gte=threshold)).annotate(
+        km=haversine_km_expr(
+            "pereval__coords__latitude", "pereval__coords__longitude",
+            "image__gps_latitude", "image__gps_longitude",
+        ),
+    ).filter(km__gt=limit)
+
+
+def gps_mismatch_rows(pereval_ids: Optional[Iterable[int]] = None) -> Iterator[Tuple[int, int, float]]:
+    """(id перевала, id изображения, расстояние в км) для фото, снятых далеко от координат перевала."""
+    qs = gps_mismatch_images()
+    if pereval_ids is not None:
+        qs = qs.filter(pereval_id__in=list(pereval_ids))
+    rows = qs.values_list("pereval_id", "image_id", "km").order_by("pereval_id", "image_id")
+    for pereval_id, image_id, km in rows.iterator(chunk_size=2000):
+        yield pereval_id, image_id, round(km, 1)
+
+
+def gps_mismatches(pereval) -> List[Tuple[int, float]]:
+    """(id изображения, расстояние в км) для далёких фото одного перевала."""
+    return [(image_id, km) for _, image_id, km in gps_mismatch_rows([pereval.pk])]
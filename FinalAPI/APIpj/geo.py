@@ -0,0 +1,52 @@
+import math
+from typing import Tuple
+
+EARTH_RADIUS_KM = 6371.0088
+# длина одного градуса широты, км
+KM_PER_DEGREE = math.pi * EARTH_RADIUS_KM / 180
+
+
+def haversine_km(lat1: float, lon1: float, lat2: float, lon2: float) -> float:
+    """Расстояние по большому кругу между двумя точками в градусах, км."""
+    phi1, phi2 = math.radians(lat1), math.radians(lat2)
+    dphi = phi2 - phi1
+    dlmb = math.radians(lon2 - lon1)
+    a = math.sin(dphi / 2) ** 2 + math.cos(phi1) * math.cos(phi2) * math.sin(dlmb / 2) ** 2
+    return 2 * EARTH_RADIUS_KM * math.asin(min(1.0, math.sqrt(a)))
+
+
+def haversine_km_expr(lat1, lon1, lat2, lon2):
+    """SQL-версия haversine_km для аннотаций: аргументы — выражения или имена полей в градусах."""
+    from django.db.models import F, Value
+    from django.db.models.functions import ASin, Cos, Least, Power, Radians, Sin, Sqrt
+
+    lat1, lon1, lat2, lon2 = (F(arg) if isinstance(arg, str) else arg for arg in (lat1, lon1, lat2, lon2))
+    a = (
+        Power(Sin(Radians(lat2 - lat1) / 2), 2)
+        + Cos(Radians(lat1)) * Cos(Radians(lat2)) * Power(Sin(Radians(lon2 - lon1) / 2), 2)
+    )
+    return 2 * EARTH_RADIUS_KM * ASin(Least(Value(1.0), Sqrt(a)))
+
+
+def haversine_km_many(lat: float, lon: float, lats, lons):
+    """Векторная версия haversine_km: от точки (lat, lon) до массивов NumPy lats/lons."""
+    import numpy as np
+
+    phi1 = math.radians(lat)
+    phi2 = np.radians(lats)
+    dlmb = np.radians(lons - lon)
+    a = np.sin((phi2 - phi1) / 2) ** 2 + math.cos(phi1) * np.cos(phi2) * np.sin(dlmb / 2) ** 2
+    return 2 * EARTH_RADIUS_KM * np.arcsin(np.minimum(1.0, np.sqrt(a)))
+
+
+# граница проекции Web Mercator по широте
+MERCATOR_MAX_LAT = 85.05112878
+
+
+def mercator_cell(lat: float, lon: float, zoom: int, cells_per_tile: int = 1) -> Tuple[int, int]:
+    """Номер ячейки (x, y) сетки тайлов Web Mercator на уровне zoom; тайл делится на cells_per_tile² ячеек."""
+    n = (1 << zoom) * cells_per_tile
+    lat = max(-MERCATOR_MAX_LAT, min(MERCATOR_MAX_LAT, lat))
+    x = (lon + 180.0) / 360.0 * n
+    y = (1.0 - math.asinh(math.tan(math.radians(lat))) / math.pi) / 2.0 * n
+    return min(n - 1, max(0, int(x))), min(n - 1, max(0, int(y)))
@@ -0,0 +1,154 @@
+"""
+Поиск перевалов по высоте и категории сложности сезона: GET /api/heights/.
+
+Высота (Coords.height) и категории (Level) лежат в разных таблицах без индексов, поэтому
+запрос «летние 1А на 3000–4000 м» — это JOIN трёх таблиц с полным просмотром. Вместо него
+используется таблица HeightBand: строка на перевал и сезон с категорией и номером полосы
+высот band = height // HEIGHT_BAND_SIZE, с составным индексом (season, category, band, height).
+Гистограмма для графиков — GROUP BY band по тому же индексу.
+
+Строки создаются вместе с перевалом и обновляются при правке его Coords или Level (в том
+числе из админки). Перевалы, перенесённые в архив, остаются в индексе, как в сводках и кластерах
+карты; удалённые (из рабочей таблицы или из архива) из него удаляются.
+Полный пересчёт — `python manage.py rebuild_height_bands`.
+"""
+from collections import Counter
+from typing import Any, Dict, List, Optional
+
+from django.conf import settings
+from django.db import connection, transaction
+from django.db.models import Case, Count, Value, When
+
+from .models import Coords, HeightBand, Level, PerevalAdded, PerevalArchive
+
+SEASONS = tuple(HeightBand.Season.values)
+
+
+def band_size() -> int:
+    return getattr(settings, "HEIGHT_BAND_SIZE", 100)
+
+
+def band_of(height: int) -> int:
+    return height // band_size()
+
+
+def _rows(pereval_id: int, height: int, categories: Dict[str, Optional[str]]) -> List[HeightBand]:
+    band = band_of(height)
+    return [
+        HeightBand(pereval_id=pereval_id, season=season, category=categories.get(season) or "", band=band, height=height)
+        for season in SEASONS
+    ]
+
+
+def record_created(pereval) -> None:
+    level = pereval.level
+    HeightBand.objects.bulk_create(
+        _rows(pereval.id, pereval.coords.height, {season: getattr(level, season) for season in SEASONS})
+    )
+
+
+def record_deleted(pereval_id: int) -> None:
+    HeightBand.objects.filter(pereval_id=pereval_id).delete()
+
+
+def record_coords(coords) -> None:
+    """Новая высота для перевалов с этими координатами, одним UPDATE."""
+    HeightBand.objects.filter(pereval__coords_id=coords.id).update(height=coords.height, band=band_of(coords.height))
+
+
+def record_level(level) -> None:
+    """Новые категории для перевалов с этим уровнем сложности, одним UPDATE на все сезоны."""
+    category = Case(
+        *(When(season=season, then=Value(getattr(level, season) or "")) for season in SEASONS),
+    )
+    HeightBand.objects.filter(pereval__level_id=level.id).update(category=category)
+
+
+def rebuild() -> int:
+    """
+    Пересчитывает индекс по рабочей и архивной таблицам. Возвращает число перевалов.
+    Строки собираются в БД через INSERT ... SELECT по сезону: на миллионе перевалов это
+    секунды, а не минуты создания объектов HeightBand в Python.
+    """
+    qn = connection.ops.quote_name
+    pereval, coords, level, archive = (m._meta for m in (PerevalAdded, Coords, Level, PerevalArchive))
+    size = band_size()
+
+    def band(height: str) -> str:
+        # floor(height / size) и для отрицательных высот, как band_of()
+        return f"CASE WHEN {height} >= 0 THEN {height} / {size} ELSE -((-{height} + {size - 1}) / {size}) END"
+
+    height = f"c.{qn(coords.get_field('height').column)}"
+    archive_height = f"a.{qn(archive.get_field('height').column)}"
+    with transaction.atomic():
+        HeightBand.objects.all().delete()
+        with connection.cursor() as cursor:
+            for season in SEASONS:
+                cursor.execute(
+                    f"INSERT INTO {qn(HeightBand._meta.db_table)} (pereval_id, season, category, band, height) "
+                    f"SELECT p.{qn(pereval.pk.column)}, %s, COALESCE(l.{qn(level.get_field(season).column)}, ''), "
+                    f"{band(height)}, {height} "
+                    f"FROM {qn(pereval.db_table)} p "
+                    f"JOIN {qn(coords.db_table)} c ON c.{qn(coords.pk.column)} = p.{qn(pereval.get_field('coords').column)} "
+                    f"JOIN {qn(level.db_table)} l ON l.{qn(level.pk.column)} = p.{qn(pereval.get_field('level').column)}",
+                    [season],
+                )
+                # в архиве координаты и уровень лежат в той же строке
+                cursor.execute(
+                    f"INSERT INTO {qn(HeightBand._meta.db_table)} (pereval_id, season, category, band, height) "
+                    f"SELECT a.{qn(archive.pk.column)}, %s, COALESCE(a.{qn(archive.get_field(season).column)}, ''), "
+                    f"{band(archive_height)}, {archive_height} "
+                    f"FROM {qn(archive.db_table)} a",
+                    [season],
+                )
+    return PerevalAdded.objects.count() + PerevalArchive.objects.count()
+
+
+def search(season: str, category: Optional[str] = None, min_height: Optional[int] = None,
+           max_height: Optional[int] = None):
+    """
+    Строки индекса для сезона, категории и диапазона высот (границы включены).
+    Условие по band отсекает лишние полосы по индексу, условие по height уточняет края диапазона.
+    """
+    qs = HeightBand.objects.filter(season=season)
+    if category is not None:
+        qs = qs.filter(category=category)
+    if min_height is not None:
+        qs = qs.filter(band__gte=band_of(min_height), height__gte=min_height)
+    if max_height is not None:
+        qs = qs.filter(band__lte=band_of(max_height), height__lte=max_height)
+    return qs
+
+
+def histogram(qs, step: Optional[int] = None) -> List[Dict[str, int]]:
+    """
+    Число перевалов по интервалам высот шириной step (кратно HEIGHT_BAND_SIZE).
+    Из БД читаются счётчики по полосам, укрупнение до step — в Python.
+    """
+    size = band_size()
+    per_bin = max(1, -(-(step or size) // size))
+    counts: Counter = Counter()
+    for band, count in qs.values_list("band").annotate(n=Count("id")).order_by("band"):
+        counts[band // per_bin] += count
+    width = per_bin * size
+    return [{"from": b * width, "to": (b + 1) * width, "count": counts[b]} for b in sorted(counts)]
+
+
+def page(qs, offset: int, limit: int) -> List[Dict[str, Any]]:
+    # порядок band, height совпадает с порядком по высоте, но идёт по индексу
+    rows = list(qs.order_by("band", "height", "pereval_id").values_list(
+        "pereval_id", "height", "category",
+    )[offset:offset + limit])
+    # название и статус — из рабочей таблицы, для перенесённых в архив — из архива
+    ids = [row[0] for row in rows]
+    info = {pk: (title, status) for pk, title, status in
+            PerevalAdded.objects.filter(id__in=ids).values_list("id", "title", "status")} if ids else {}
+    archived = [pk for pk in ids if pk not in info]
+    if archived:
+        info.update((pk, (title, status)) for pk, title, status in
+                    PerevalArchive.objects.filter(id__in=archived).values_list("id", "title", "status"))
+    return [
+        {"id": pk, "title": info[pk][0], "status": info[pk][1], "height": height, "category": category or None}
+        for pk, height, category in rows
+        if pk in info
+    ]
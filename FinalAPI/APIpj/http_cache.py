@@ -0,0 +1,113 @@
+"""
+Условные GET для перевалов: ETag, Last-Modified и Cache-Control в списке и карточке.
+
+ETag считается не по телу ответа, а по отпечатку строк (id, updated_at, status) перевалов,
+которые попадают в ответ. Отпечаток читается одним лёгким запросом без JOIN на координаты,
+уровень и фото; если он совпал с If-None-Match (или ответ не новее If-Modified-Since), view
+отвечает 304, не загружая и не сериализуя перевалы.
+
+updated_at (auto_now) меняется при любой правке через API и при смене статуса. Координаты,
+уровень и фото, изменённые в админке отдельно от перевала, обновляют его через touch().
+
+Cache-Control зависит от статуса: промодерированные перевалы (accepted/rejected) кэшируются
+на API_HTTP_CACHE["MAX_AGE"][status] секунд, new/pending и списки — no-cache (каждый раз
+проверяются по ETag).
+"""
+import hashlib
+from datetime import datetime
+from typing import Iterable, List, NamedTuple, Optional, Sequence, Tuple
+
+from django.conf import settings
+from django.db.models import Value
+from django.utils import timezone
+from django.utils.cache import get_conditional_response, patch_cache_control, patch_vary_headers
+from django.utils.http import http_date
+
+from .models import PerevalAdded, PerevalArchive
+
+Row = Tuple[int, datetime, str]
+FIELDS = ("id", "updated_at", "status")
+CONDITIONAL_HEADERS = ("HTTP_IF_NONE_MATCH", "HTTP_IF_MODIFIED_SINCE")
+
+
+class Validators(NamedTuple):
+    etag: str
+    last_modified: Optional[datetime]
+    max_age: int
+
+    def not_modified(self, request):
+        """304, если у клиента актуальная версия, иначе None."""
+        response = get_conditional_response(request, etag=self.etag, last_modified=self._timestamp())
+        return self.apply(response) if response is not None else None
+
+    def apply(self, response):
+        if not 200 <= response.status_code < 400:
+            return response
+        response["ETag"] = self.etag
+        if self.last_modified is not None:
+            response["Last-Modified"] = http_date(self._timestamp())
+        if self.max_age:
+            patch_cache_control(response, public=True, max_age=self.max_age)
+        else:
+            patch_cache_control(response, no_cache=True)
+        # тело зависит от формата (JSON или Browsable API)
+        patch_vary_headers(response, ("Accept",))
+        return response
+
+    def _timestamp(self) -> Optional[int]:
+        return int(self.last_modified.timestamp()) if self.last_modified is not None else None
+
+
+def is_conditional(request) -> bool:
+    return any(header in request.META for header in CONDITIONAL_HEADERS)
+
+
+def max_age(status: str) -> int:
+    return settings.API_HTTP_CACHE["MAX_AGE"].get(status, 0)
+
+
+def _etag(request, kind: str, rows: Iterable[Row]) -> str:
+    digest = hashlib.sha1(f"{kind}:{request.accepted_renderer.format}:{request.get_full_path()}".encode())
+    for pk, updated_at, status in rows:
+        digest.update(f"|{pk}:{updated_at.isoformat()}:{status}".encode())
+    return '"%s"' % digest.hexdigest()
+
+
+def for_rows(request, kind: str, rows: Sequence[Row], status: Optional[str] = None) -> Validators:
+    """Валидаторы ответа по отпечатку строк. status задаётся для карточки перевала, у списка его нет."""
+    last_modified = max((row[1] for row in rows), default=None)
+    return Validators(_etag(request, kind, rows), last_modified, max_age(status) if status else 0)
+
+
+def for_instance(request, instance) -> Validators:
+    """Валидаторы уже загруженного перевала (рабочего или архивного) — без запроса к БД."""
+    kind = "archive" if isinstance(instance, PerevalArchive) else "pereval"
+    return for_rows(request, kind, [(instance.id, instance.updated_at, instance.status)], instance.status)
+
+
+def for_pereval(request, pk) -> Optional[Validators]:
+    """Валидаторы карточки по отпечатку: сначала рабочая таблица, затем архив. None — перевала нет."""
+    for kind, model in (("pereval", PerevalAdded), ("archive", PerevalArchive)):
+        row = model.objects.filter(id=pk).values_list(*FIELDS).first()
+        if row is not None:
+            return for_rows(request, kind, [row], row[2])
+    return None
+
+
+def list_rows(*querysets) -> List[Tuple[int, datetime, str, int]]:
+    """
+    Отпечаток списка по нескольким таблицам (рабочей и архиву) одним запросом UNION ALL, по возрастанию id:
+    (id, updated_at, status, номер выборки в querysets).
+    """
+    parts = [qs.order_by().annotate(source=Value(i)).values_list(*FIELDS, "source") for i, qs in enumerate(querysets)]
+    return list(parts[0].union(*parts[1:], all=True).order_by("id"))
+
+
+def for_list(request, rows: Sequence[Tuple]) -> Validators:
+    """Валидаторы списка: отпечаток всех перевалов выборки (list_rows), а не только текущей страницы, — от них зависит count."""
+    return for_rows(request, "list", [row[:3] for row in rows])
+
+
+def touch(**lookup) -> int:
+    """Обновляет updated_at перевалов, чьи связанные объекты изменены в обход PerevalAdded.save()."""
+    return PerevalAdded.objects.filter(**lookup).update(updated_at=timezone.now())
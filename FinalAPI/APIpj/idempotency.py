@@ -0,0 +1,125 @@
+"""
+Поддержка заголовка Idempotency-Key для POST /api/submitData/.
+
+Ключ резервируется до разбора тела запроса. Пока первый запрос не завершился, повтор получает 409
+сразу, без разбора multipart, сколько бы ни шла обработка: иначе медленная загрузка фотографий
+и повтор клиента создали бы два перевала. Ключ освобождается, когда первый запрос завершился
+ошибкой; резерв упавшего воркера удаляется вместе с устаревшими ключами (IDEMPOTENCY_KEY_TTL).
+
+Сохраняются только успешные ответы вместе с отпечатком тела запроса (fingerprint). Повтор с тем же
+телом получает сохранённый ответ, с другим — 422: ключ уже связан с другим перевалом.
+"""
+import hashlib
+import json
+from datetime import timedelta
+from typing import Any, Dict, List, NamedTuple, Optional, Tuple
+
+from django.conf import settings
+from django.db import IntegrityError
+from django.utils import timezone
+
+from .models import IdempotencyKey
+
+IDEMPOTENCY_HEADER = "HTTP_IDEMPOTENCY_KEY"
+MAX_KEY_LENGTH = 255
+
+StoredResponse = Tuple[int, Dict[str, Any]]
+
+
+class Stored(NamedTuple):
+    status_code: int
+    response: Dict[str, Any]
+    # None — ответ не зависит от тела запроса (409, ключ ещё обрабатывается)
+    fingerprint: Optional[str] = None
+
+
+def _ttl() -> timedelta:
+    return timedelta(seconds=getattr(settings, "IDEMPOTENCY_KEY_TTL", 24 * 60 * 60))
+
+
+def _in_progress() -> Stored:
+    return Stored(409, {
+        "status": 409, "message": "Запрос с таким Idempotency-Key ещё обрабатывается", "id": None,
+        "code": "request_in_progress",
+    })
+
+
+def _reused() -> StoredResponse:
+    return 422, {
+        "status": 422, "message": "Idempotency-Key уже использован с другим телом запроса", "id": None,
+        "code": "idempotency_key_reused",
+    }
+
+
+def get_key(request) -> Optional[str]:
+    key = request.META.get(IDEMPOTENCY_HEADER, "").strip()
+    return key or None
+
+
+def fingerprint(payload: Dict[str, Any], images: List[Dict[str, Any]]) -> str:
+    """
+    Отпечаток разобранного тела запроса: поля (порядок ключей JSON не важен), подписи
+    и содержимое файлов изображений.
+    """
+    digest = hashlib.sha256(json.dumps(payload, sort_keys=True, ensure_ascii=False, default=str).encode())
+    for image in images:
+        data = image.get("data")
+        digest.update(b"\0" + str(image.get("title", "")).encode())
+        if hasattr(data, "chunks"):
+            for chunk in data.chunks():
+                digest.update(chunk)
+            data.seek(0)
+        else:
+            digest.update(str(data).encode())
+    return digest.hexdigest()
+
+
+def reserve(key: str) -> Optional[Stored]:
+    """
+    Резервирует ключ. Возвращает сохранённый ответ, если ключ уже использовался
+    (для завершённого запроса сверить тело — replay()), или None, если запрос нужно обработать.
+    """
+    now = timezone.now()
+    row = IdempotencyKey.objects.filter(key=key).values_list(
+        "id", "status_code", "response", "fingerprint", "created_at",
+    ).first()
+    if row is not None:
+        row_id, status_code, response, stored_fingerprint, created_at = row
+        if created_at >= now - _ttl():
+            if status_code is None:
+                return _in_progress()
+            return Stored(status_code, response, stored_fingerprint)
+        # ключ устарел — освобождаем его
+        IdempotencyKey.objects.filter(id=row_id).delete()
+
+    try:
+        IdempotencyKey.objects.create(key=key)
+    except IntegrityError:
+        # параллельный повтор успел зарезервировать ключ раньше
+        return _in_progress()
+    return None
+
+
+def replay(stored: Stored, request_fingerprint: str) -> StoredResponse:
+    """Ответ на повтор завершённого запроса: сохранённый ответ или 422, если тело другое."""
+    # ключи, сохранённые до появления отпечатков, сверить не с чем
+    if stored.fingerprint and stored.fingerprint != request_fingerprint:
+        return _reused()
+    return stored.status_code, stored.response
+
+
+def store(key: str, status_code: int, response: Dict[str, Any], request_fingerprint: str) -> None:
+    IdempotencyKey.objects.filter(key=key).update(
+        status_code=status_code, response=response, fingerprint=request_fingerprint,
+    )
+
+
+def release(key: str) -> None:
+    # при ошибке сервера ключ освобождаем, чтобы клиент мог повторить запрос
+    IdempotencyKey.objects.filter(key=key, status_code__isnull=True).delete()
+
+
+def purge_expired() -> int:
+    cutoff = timezone.now() - _ttl()
+    deleted, _ = IdempotencyKey.objects.filter(created_at__lt=cutoff).delete()
+    return deleted
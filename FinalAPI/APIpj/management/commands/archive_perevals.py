@@ -0,0 +1,20 @@
+from django.core.management.base import BaseCommand
+
+from APIpj.archive import archive_cutoff, archive_older_than, candidates
+
+
+class Command(BaseCommand):
+    help = "Переносит принятые и отклонённые перевалы старше ARCHIVE_AFTER_DAYS в архивную таблицу"
+
+    def add_arguments(self, parser):
+        parser.add_argument("--days", type=int, help="Возраст записи в днях, по умолчанию ARCHIVE_AFTER_DAYS")
+        parser.add_argument("--batch-size", type=int, default=1000)
+        parser.add_argument("--dry-run", action="store_true", help="Только посчитать кандидатов")
+
+    def handle(self, *args, **options):
+        cutoff = archive_cutoff(options["days"])
+        if options["dry_run"]:
+            self.stdout.write(f"К архивации: {candidates(cutoff).count()} (добавлены до {cutoff:%Y-%m-%d})")
+            return
+        archived = archive_older_than(cutoff, batch_size=options["batch_size"])
+        self.stdout.write(f"Перенесено в архив: {archived}")
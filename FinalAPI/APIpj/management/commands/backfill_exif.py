@@ -0,0 +1,72 @@
+import os
+from concurrent.futures import ProcessPoolExecutor
+
+from django.core.files.storage import default_storage
+from django.core.management.base import BaseCommand, CommandError
+
+from APIpj.exif import gps_mismatch_rows, read_many
+from APIpj.models import Image
+
+FIELDS = ("width", "height", "taken_at", "gps_latitude", "gps_longitude")
+
+
+class Command(BaseCommand):
+    help = "Читает EXIF (время съёмки, GPS, размеры) у ещё не обработанных изображений из media/"
+
+    def add_arguments(self, parser):
+        parser.add_argument("--batch-size", type=int, default=500)
+        parser.add_argument(
+            "--workers", type=int, default=None,
+            help="Число процессов, по умолчанию — по числу ядер; 0 — читать EXIF в текущем процессе, без пула",
+        )
+        parser.add_argument("--report", action="store_true", help="Вывести перевалы, у которых фото снято далеко от координат")
+
+    def handle(self, *args, **options):
+        workers = options["workers"]
+        if workers is None:
+            workers = os.cpu_count() or 1
+        if workers < 0:
+            raise CommandError("--workers не может быть отрицательным")
+        try:
+            default_storage.path("")
+        except NotImplementedError:
+            raise CommandError("backfill_exif работает только с локальным хранилищем файлов")
+
+        processed = 0
+        if workers > 1:
+            with ProcessPoolExecutor(max_workers=workers) as pool:
+                processed = self._run(pool, options["batch_size"])
+        else:
+            processed = self._run(None, options["batch_size"])
+        mode = f"процессов: {workers}" if workers > 1 else "в текущем процессе"
+        self.stdout.write(f"Обработано изображений: {processed} ({mode})")
+
+        if options["report"]:
+            for pereval_id, image_id, km in gps_mismatch_rows():
+                self.stdout.write(f"  перевал #{pereval_id}: фото #{image_id} снято в {km} км от координат")
+
+    def _run(self, pool, batch_size: int) -> int:
+        processed, last_id, pending = 0, 0, None
+        while True:
+            batch = list(
+                Image.objects.filter(width__isnull=True, id__gt=last_id)
+                .order_by("id")
+                .values_list("id", "data")[:batch_size]
+            )
+            if not batch:
+                break
+            last_id = batch[-1][0]
+            # следующая пачка уходит в пул до записи предыдущей, чтобы процессы не простаивали
+            results = read_many([default_storage.path(name) for _, name in batch], pool)
+            if pending is not None:
+                processed += self._save(*pending)
+            pending = (batch, results)
+        if pending is not None:
+            processed += self._save(*pending)
+        return processed
+
+    @staticmethod
+    def _save(batch, results) -> int:
+        images = [Image(id=pk, **data.fields()) for (pk, _), data in zip(batch, results)]
+        Image.objects.bulk_update(images, FIELDS)
+        return len(images)
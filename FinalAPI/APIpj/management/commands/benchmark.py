@@ -0,0 +1,19 @@
+from django.core.management.base import BaseCommand, CommandError
+
+from APIpj.benchmarks import SUITES
+
+
+class Command(BaseCommand):
+    help = "Запуск замеров производительности: python manage.py benchmark <suite>"
+
+    def add_arguments(self, parser):
+        parser.add_argument("suite", choices=sorted(SUITES), help="Набор замеров")
+        parser.add_argument("--repeat", type=int, default=5, help="Число повторов, берётся лучшее время")
+        parser.add_argument("--sizes", type=int, nargs="*", help="Размеры входных данных")
+        parser.add_argument("--max-ms", type=float, help="Порог регрессии для наборов с бюджетом времени")
+
+    def handle(self, *args, **options):
+        suite = SUITES.get(options["suite"])
+        if suite is None:
+            raise CommandError(f"Неизвестный набор замеров: {options['suite']}")
+        suite(options, self.stdout.write)
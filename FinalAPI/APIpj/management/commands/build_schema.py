@@ -0,0 +1,38 @@
+from pathlib import Path
+
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+
+from APIpj.schema import compare_operations, generate_schema, load_schema_file, render_yaml
+
+
+class Command(BaseCommand):
+    help = "Генерирует OpenAPI-схему в API_SCHEMA_FILE и сверяет её со static/FinalAPI.yaml"
+
+    def add_arguments(self, parser):
+        parser.add_argument("--check", action="store_true", help="Завершиться с ошибкой, если схемы расходятся")
+        parser.add_argument("--no-write", action="store_true", help="Только сверить, файл не записывать")
+
+    def handle(self, *args, **options):
+        if not settings.API_DOCS_ENABLED:
+            raise CommandError("Документация выключена (API_DOCS_ENABLED=0), drf-spectacular не подключён")
+
+        schema = generate_schema()
+        if not options["no_write"]:
+            path = Path(settings.API_SCHEMA_FILE)
+            path.write_bytes(render_yaml(schema))
+            self.stdout.write(f"Схема записана в {path}")
+
+        missing, stale = compare_operations(schema, load_schema_file(settings.API_STATIC_SCHEMA_FILE))
+        for path, method in sorted(missing):
+            self.stdout.write(f"  нет в статической схеме: {method.upper()} {path}")
+        for path, method in sorted(stale):
+            self.stdout.write(f"  нет в коде: {method.upper()} {path}")
+
+        if missing or stale:
+            message = f"Статическая схема расходится с кодом: {len(missing)} новых операций, {len(stale)} устаревших"
+            if options["check"]:
+                raise CommandError(message)
+            self.stdout.write(self.style.WARNING(message))
+        else:
+            self.stdout.write(self.style.SUCCESS("Статическая схема совпадает с кодом"))
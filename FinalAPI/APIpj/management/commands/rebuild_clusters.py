@@ -0,0 +1,10 @@
+from django.core.management.base import BaseCommand
+
+from APIpj.clusters import rebuild
+
+
+class Command(BaseCommand):
+    help = "Пересчитывает агрегаты кластеров карты (ClusterCell) по рабочей и архивной таблицам перевалов"
+
+    def handle(self, *args, **options):
+        self.stdout.write(f"Пересчитано ячеек: {rebuild()}")
@@ -0,0 +1,10 @@
+from django.core.management.base import BaseCommand
+
+from APIpj.heights import rebuild
+
+
+class Command(BaseCommand):
+    help = "Пересчитывает индекс перевалов по высоте (HeightBand) по рабочей таблице перевалов"
+
+    def handle(self, *args, **options):
+        self.stdout.write(f"Проиндексировано перевалов: {rebuild()}")
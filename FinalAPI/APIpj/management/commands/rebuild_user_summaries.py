@@ -0,0 +1,17 @@
+from django.core.management.base import BaseCommand
+
+from APIpj.models import User
+from APIpj.summaries import rebuild
+
+
+class Command(BaseCommand):
+    help = "Пересчитывает сводки пользователей (UserPassSummary) по рабочей и архивной таблицам перевалов"
+
+    def add_arguments(self, parser):
+        parser.add_argument("--email", nargs="*", help="Пересчитать только этих пользователей")
+
+    def handle(self, *args, **options):
+        user_ids = None
+        if options["email"]:
+            user_ids = list(User.objects.filter(email__in=options["email"]).values_list("id", flat=True))
+        self.stdout.write(f"Пересчитано сводок: {rebuild(user_ids)}")
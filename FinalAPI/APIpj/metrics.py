@@ -0,0 +1,34 @@
+"""
+Простые счётчики процесса для мониторинга (GET /api/metrics/).
+Значения живут в памяти воркера: при нескольких воркерах каждый отдаёт свои.
+"""
+import threading
+from collections import Counter
+from typing import Callable, Dict
+
+_lock = threading.Lock()
+_counters: Counter = Counter()
+_gauges: Dict[str, Callable[[], float]] = {}
+
+
+def incr(name: str, value: int = 1) -> None:
+    with _lock:
+        _counters[name] += value
+
+
+def register_gauge(name: str, func: Callable[[], float]) -> None:
+    # значение gauge считается в момент чтения метрик
+    _gauges[name] = func
+
+
+def snapshot() -> Dict[str, float]:
+    with _lock:
+        data: Dict[str, float] = dict(_counters)
+    for name, func in _gauges.items():
+        data[name] = func()
+    return data
+
+
+def reset() -> None:
+    with _lock:
+        _counters.clear()
@@ -0,0 +1,145 @@
+import re
+from typing import Dict, Optional
+
+from django.conf import settings
+from django.utils.cache import patch_vary_headers
+from django.utils.deprecation import MiddlewareMixin
+from django.utils.text import compress_string
+
+from .exceptions import json_error
+from .throttling import acquire_upload_slot, release_upload_slot
+
+try:
+    import brotli
+except ImportError:  # brotli необязателен — без него сжимаем только gzip
+    brotli = None
+
+
+_ACCEPT_ENCODING_RE = re.compile(r"\s*([^\s;,]+)\s*(?:;\s*q=([0-9.]+))?")
+
+
+def _accepted_encodings(header: str) -> Dict[str, float]:
+    # разбираем Accept-Encoding вида "gzip;q=0.8, br" в словарь {кодировка: q}
+    encodings: Dict[str, float] = {}
+    for part in header.split(","):
+        m = _ACCEPT_ENCODING_RE.match(part)
+        if not m:
+            continue
+        try:
+            q = float(m.group(2)) if m.group(2) else 1.0
+        except ValueError:
+            q = 0.0
+        encodings[m.group(1).lower()] = q
+    return encodings
+
+
+def choose_encoding(header: str) -> Optional[str]:
+    encodings = _accepted_encodings(header)
+    candidates = ["br", "gzip"] if brotli is not None else ["gzip"]
+    best, best_q = None, 0.0
+    for name in candidates:
+        q = encodings.get(name, encodings.get("*", 0.0))
+        if q > best_q:
+            best, best_q = name, q
+    return best
+
+
+_DEFAULT_COMPRESSIBLE_TYPES = (
+    "application/json", "application/vnd.oai.openapi", "application/javascript",
+    "text/html", "text/plain", "text/css", "text/javascript", "image/svg+xml",
+)
+
+
+def is_compressible(content_type: str) -> bool:
+    # сжимаем только текст и JSON из списка API_COMPRESSION_TYPES (и любые +json); изображения
+    # и архивы уже сжаты, а text/event-stream должен уходить клиенту событие за событием
+    mime = content_type.split(";", 1)[0].strip().lower()
+    allowed = getattr(settings, "API_COMPRESSION_TYPES", _DEFAULT_COMPRESSIBLE_TYPES)
+    return mime in allowed or mime.endswith("+json")
+
+
+class CompressionMiddleware(MiddlewareMixin):
+    """
+    Сжатие ответов brotli/gzip по Accept-Encoding клиента.
+    Сжимаются только типы из API_COMPRESSION_TYPES размером от API_COMPRESSION_MIN_SIZE байт.
+    Потоковые ответы (в том числе SSE) и ответы с Cache-Control: no-transform не сжимаются.
+
+    BREACH: по размеру сжатого ответа атакующий может подбирать секрет, если в том же ответе
+    отражается его ввод. Ответы API секретов не содержат (JWT передаётся в заголовке), токен CSRF
+    в HTML админки Django маскирует заново для каждого ответа. Ответ, в котором секрет соседствует
+    с данными запроса, должен выставить Cache-Control: no-transform — такой ответ не сжимается.
+    """
+
+    def process_response(self, request, response):
+        if response.streaming or response.has_header("Content-Encoding"):
+            return response
+        if not is_compressible(response.get("Content-Type", "")):
+            return response
+        if "no-transform" in response.get("Cache-Control", "").lower():
+            return response
+
+        min_size = getattr(settings, "API_COMPRESSION_MIN_SIZE", 1024)
+        if len(response.content) < min_size:
+            return response
+
+        patch_vary_headers(response, ("Accept-Encoding",))
+
+        encoding = choose_encoding(request.META.get("HTTP_ACCEPT_ENCODING", ""))
+        if encoding is None:
+            return response
+
+        if encoding == "br":
+            quality = getattr(settings, "API_COMPRESSION_BROTLI_QUALITY", 5)
+            compressed = brotli.compress(response.content, quality=quality)
+        else:
+            compressed = compress_string(response.content)
+
+        # если сжатие не дало выигрыша — отдаём как есть
+        if len(compressed) >= len(response.content):
+            return response
+
+        response.content = compressed
+        response["Content-Length"] = str(len(compressed))
+        response["Content-Encoding"] = encoding
+
+        # сжатое тело отличается побайтно, поэтому сильный ETag становится слабым (как в GZipMiddleware)
+        etag = response.get("ETag")
+        if etag and etag.startswith('"'):
+            response["ETag"] = "W/" + etag
+        return response
+
+
+class UploadConcurrencyMiddleware(MiddlewareMixin):
+    """
+    Ограничивает число одновременно обрабатываемых загрузок (multipart POST/PUT/PATCH в /api/).
+    Если свободного слота нет, отвечает 503 с Retry-After, не читая тело запроса.
+    """
+
+    upload_methods = ("POST", "PUT", "PATCH")
+
+    def is_upload(self, request) -> bool:
+        return (
+            request.method in self.upload_methods
+            and request.path.startswith("/api/")
+            and request.content_type == "multipart/form-data"
+        )
+
+    def process_request(self, request):
+        if not self.is_upload(request):
+            return None
+
+        if not acquire_upload_slot():
+            retry_after = settings.API_THROTTLE.get("UPLOAD_RETRY_AFTER", 5)
+            response = json_error(503, "Сервер перегружен загрузками, повторите позже", "uploads_busy")
+            response["Retry-After"] = str(retry_after)
+            return response
+
+        request._holds_upload_slot = True
+        return None
+
+    def process_response(self, request, response):
+        # process_response вызывается и после исключений во view, поэтому слот не теряется
+        if getattr(request, "_holds_upload_slot", False):
+            request._holds_upload_slot = False
+            release_upload_slot()
+        return response
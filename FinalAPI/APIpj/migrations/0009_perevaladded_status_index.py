@@ -0,0 +1,18 @@
+# Generated by Django 5.2.5 on 2026-10-19 14:44
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('APIpj', '0008_idempotencykey'),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name='perevaladded',
+            name='status',
+            field=models.CharField(choices=[('new', 'Новый'), ('pending', 'В работе'), ('accepted', 'Принят'), ('rejected', 'Отклонен')], db_index=True, default='new', max_length=10, verbose_name='Статус'),
+        ),
+    ]
@@ -0,0 +1,51 @@
+# Generated by Django 5.2.5 on 2026-10-19 14:45
+
+import django.db.models.deletion
+from django.conf import settings
+from django.db import migrations, models
+
+
+def backfill_changes(apps, schema_editor):
+    # updated_at для старых записей — время добавления; в журнал пишем событие создания,
+    # чтобы клиент с курсором 0 получил все существующие перевалы
+    PerevalAdded = apps.get_model('APIpj', 'PerevalAdded')
+    PerevalChange = apps.get_model('APIpj', 'PerevalChange')
+    PerevalAdded.objects.update(updated_at=models.F('add_time'))
+
+    q = schema_editor.quote_name
+    schema_editor.execute(
+        f"INSERT INTO {q(PerevalChange._meta.db_table)} (pereval_id, user_id, kind, status, created_at) "
+        f"SELECT id, user_id, 'created', status, add_time FROM {q(PerevalAdded._meta.db_table)} ORDER BY id"
+    )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('APIpj', '0009_perevaladded_status_index'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='perevaladded',
+            name='updated_at',
+            field=models.DateTimeField(auto_now=True, db_index=True, verbose_name='Дата изменения'),
+        ),
+        migrations.CreateModel(
+            name='PerevalChange',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('kind', models.CharField(choices=[('created', 'Создан'), ('updated', 'Изменён'), ('status', 'Смена статуса')], max_length=10, verbose_name='Тип изменения')),
+                ('status', models.CharField(choices=[('new', 'Новый'), ('pending', 'В работе'), ('accepted', 'Принят'), ('rejected', 'Отклонен')], max_length=10, verbose_name='Статус')),
+                ('created_at', models.DateTimeField(auto_now_add=True, verbose_name='Дата изменения')),
+                ('pereval', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='changes', to='APIpj.perevaladded', verbose_name='Перевал')),
+                ('user', models.ForeignKey(db_index=False, on_delete=django.db.models.deletion.CASCADE, related_name='+', to=settings.AUTH_USER_MODEL, verbose_name='Пользователь')),
+            ],
+            options={
+                'verbose_name': 'Изменение перевала',
+                'verbose_name_plural': 'Изменения перевалов',
+                'indexes': [models.Index(fields=['user', 'id'], name='perevalchange_user_cursor')],
+            },
+        ),
+        migrations.RunPython(backfill_changes, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,38 @@
+# Generated by Django 5.2.5 on 2026-10-19 14:55
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('APIpj', '0010_perevaladded_updated_at_perevalchange'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='image',
+            name='gps_latitude',
+            field=models.FloatField(blank=True, null=True, verbose_name='Широта съёмки'),
+        ),
+        migrations.AddField(
+            model_name='image',
+            name='gps_longitude',
+            field=models.FloatField(blank=True, null=True, verbose_name='Долгота съёмки'),
+        ),
+        migrations.AddField(
+            model_name='image',
+            name='height',
+            field=models.PositiveIntegerField(blank=True, null=True, verbose_name='Высота'),
+        ),
+        migrations.AddField(
+            model_name='image',
+            name='taken_at',
+            field=models.DateTimeField(blank=True, null=True, verbose_name='Дата съёмки'),
+        ),
+        migrations.AddField(
+            model_name='image',
+            name='width',
+            field=models.PositiveIntegerField(blank=True, null=True, verbose_name='Ширина'),
+        ),
+    ]
@@ -0,0 +1,43 @@
+# Generated by Django 5.2.5 on 2026-10-19 14:56
+
+import django.db.models.deletion
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('APIpj', '0011_image_exif'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='PerevalArchive',
+            fields=[
+                ('id', models.IntegerField(primary_key=True, serialize=False)),
+                ('beauty_title', models.CharField(max_length=255, verbose_name='Красивое название')),
+                ('title', models.CharField(max_length=255, verbose_name='Название')),
+                ('other_titles', models.CharField(blank=True, max_length=255, null=True, verbose_name='Другие названия')),
+                ('connect', models.TextField(blank=True, null=True, verbose_name='Что соединяет')),
+                ('add_time', models.DateTimeField(verbose_name='Дата добавления')),
+                ('updated_at', models.DateTimeField(verbose_name='Дата изменения')),
+                ('status', models.CharField(choices=[('new', 'Новый'), ('pending', 'В работе'), ('accepted', 'Принят'), ('rejected', 'Отклонен')], max_length=10, verbose_name='Статус')),
+                ('latitude', models.FloatField(verbose_name='Широта')),
+                ('longitude', models.FloatField(verbose_name='Долгота')),
+                ('height', models.IntegerField(verbose_name='Высота')),
+                ('winter', models.CharField(blank=True, max_length=10, null=True, verbose_name='Зима')),
+                ('summer', models.CharField(blank=True, max_length=10, null=True, verbose_name='Лето')),
+                ('autumn', models.CharField(blank=True, max_length=10, null=True, verbose_name='Осень')),
+                ('spring', models.CharField(blank=True, max_length=10, null=True, verbose_name='Весна')),
+                ('archived_at', models.DateTimeField(auto_now_add=True, verbose_name='Дата архивации')),
+                ('activity_type', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='+', to='APIpj.activitytype', verbose_name='Вид активности')),
+                ('images', models.ManyToManyField(related_name='+', to='APIpj.image', verbose_name='Изображения')),
+                ('user', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='+', to=settings.AUTH_USER_MODEL, verbose_name='Пользователь')),
+            ],
+            options={
+                'verbose_name': 'Архивный перевал',
+                'verbose_name_plural': 'Архивные перевалы',
+            },
+        ),
+    ]
@@ -0,0 +1,56 @@
+# Generated by Django 5.2.5 on 2026-10-19 15:01
+
+import django.db.models.deletion
+from django.conf import settings
+from django.db import migrations, models
+from django.utils import timezone
+
+RECENT = 10
+
+
+def backfill_summaries(apps, schema_editor):
+    # то же, что APIpj.summaries.rebuild(), но на исторических моделях
+    UserPassSummary = apps.get_model('APIpj', 'UserPassSummary')
+    summaries = {}
+    for name in ('PerevalAdded', 'PerevalArchive'):
+        model = apps.get_model('APIpj', name)
+        taken = {}
+        rows = model.objects.order_by('-id').values_list('id', 'user_id', 'title', 'status', 'add_time')
+        for pk, user_id, title, status, add_time in rows.iterator(chunk_size=2000):
+            summary = summaries.setdefault(user_id, UserPassSummary(user_id=user_id, recent=[]))
+            setattr(summary, status, getattr(summary, status) + 1)
+            if summary.last_submitted_at is None or add_time > summary.last_submitted_at:
+                summary.last_submitted_at = add_time
+            if taken.get(user_id, 0) < RECENT:
+                taken[user_id] = taken.get(user_id, 0) + 1
+                summary.recent.append({'id': pk, 'title': title, 'status': status, 'add_time': timezone.localtime(add_time).isoformat()})
+    for summary in summaries.values():
+        summary.recent = sorted(summary.recent, key=lambda e: e['id'], reverse=True)[:RECENT]
+    UserPassSummary.objects.bulk_create(summaries.values(), batch_size=1000)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('APIpj', '0012_perevalarchive'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='UserPassSummary',
+            fields=[
+                ('user', models.OneToOneField(on_delete=django.db.models.deletion.CASCADE, primary_key=True, related_name='pass_summary', serialize=False, to=settings.AUTH_USER_MODEL, verbose_name='Пользователь')),
+                ('new', models.PositiveIntegerField(default=0, verbose_name='Новые')),
+                ('pending', models.PositiveIntegerField(default=0, verbose_name='В работе')),
+                ('accepted', models.PositiveIntegerField(default=0, verbose_name='Приняты')),
+                ('rejected', models.PositiveIntegerField(default=0, verbose_name='Отклонены')),
+                ('last_submitted_at', models.DateTimeField(blank=True, null=True, verbose_name='Последняя отправка')),
+                ('recent', models.JSONField(default=list, verbose_name='Последние перевалы')),
+            ],
+            options={
+                'verbose_name': 'Сводка пользователя',
+                'verbose_name_plural': 'Сводки пользователей',
+            },
+        ),
+        migrations.RunPython(backfill_summaries, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,51 @@
+# Generated by Django 5.2.5 on 2026-10-19 15:03
+
+from django.db import migrations, models
+
+
+def backfill_clusters(apps, schema_editor):
+    from APIpj.clusters import aggregate, cell_columns
+
+    ClusterCell = apps.get_model('APIpj', 'ClusterCell')
+    PerevalAdded = apps.get_model('APIpj', 'PerevalAdded')
+    PerevalArchive = apps.get_model('APIpj', 'PerevalArchive')
+    rows = [
+        *PerevalAdded.objects.values_list('coords__latitude', 'coords__longitude', 'status').iterator(chunk_size=2000),
+        *PerevalArchive.objects.values_list('latitude', 'longitude', 'status').iterator(chunk_size=2000),
+    ]
+    ClusterCell.objects.bulk_create(
+        (ClusterCell(zoom=z, x=x, y=y, **cell_columns(delta)) for (z, x, y), delta in aggregate(rows).items()),
+        batch_size=1000,
+    )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('APIpj', '0013_userpasssummary'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='ClusterCell',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('zoom', models.PositiveSmallIntegerField(verbose_name='Масштаб')),
+                ('x', models.IntegerField(verbose_name='Ячейка X')),
+                ('y', models.IntegerField(verbose_name='Ячейка Y')),
+                ('count', models.IntegerField(default=0, verbose_name='Перевалов')),
+                ('sum_lat', models.FloatField(default=0, verbose_name='Сумма широт')),
+                ('sum_lon', models.FloatField(default=0, verbose_name='Сумма долгот')),
+                ('new', models.IntegerField(default=0, verbose_name='Новые')),
+                ('pending', models.IntegerField(default=0, verbose_name='В работе')),
+                ('accepted', models.IntegerField(default=0, verbose_name='Приняты')),
+                ('rejected', models.IntegerField(default=0, verbose_name='Отклонены')),
+            ],
+            options={
+                'verbose_name': 'Ячейка карты',
+                'verbose_name_plural': 'Ячейки карты',
+                'constraints': [models.UniqueConstraint(fields=('zoom', 'x', 'y'), name='clustercell_zoom_x_y')],
+            },
+        ),
+        migrations.RunPython(backfill_clusters, migrations.RunPython.noop),
+    ]
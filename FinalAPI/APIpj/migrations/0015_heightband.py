@@ -0,0 +1,52 @@
+# Generated by Django 5.2.5 on 2026-10-19 15:11
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+BAND_SIZE = 100
+SEASONS = ('winter', 'summer', 'autumn', 'spring')
+
+
+def backfill_height_bands(apps, schema_editor):
+    # то же, что APIpj.heights.rebuild(), но на исторических моделях
+    PerevalAdded = apps.get_model('APIpj', 'PerevalAdded')
+    HeightBand = apps.get_model('APIpj', 'HeightBand')
+    rows = PerevalAdded.objects.order_by('id').values_list('id', 'coords__height', *(f'level__{s}' for s in SEASONS))
+    batch = []
+    for pk, height, *categories in rows.iterator(chunk_size=2000):
+        batch.extend(
+            HeightBand(pereval_id=pk, season=season, category=category or '', band=height // BAND_SIZE, height=height)
+            for season, category in zip(SEASONS, categories)
+        )
+        if len(batch) >= 4000:
+            HeightBand.objects.bulk_create(batch)
+            batch = []
+    HeightBand.objects.bulk_create(batch)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('APIpj', '0014_clustercell'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='HeightBand',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('season', models.CharField(choices=[('winter', 'Зима'), ('summer', 'Лето'), ('autumn', 'Осень'), ('spring', 'Весна')], max_length=6, verbose_name='Сезон')),
+                ('category', models.CharField(blank=True, default='', max_length=10, verbose_name='Категория')),
+                ('band', models.SmallIntegerField(verbose_name='Полоса высот')),
+                ('height', models.IntegerField(verbose_name='Высота')),
+                ('pereval', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='height_bands', to='APIpj.perevaladded', verbose_name='Перевал')),
+            ],
+            options={
+                'verbose_name': 'Полоса высот',
+                'verbose_name_plural': 'Полосы высот',
+                'indexes': [models.Index(fields=['season', 'category', 'band', 'height'], name='heightband_lookup')],
+                'constraints': [models.UniqueConstraint(fields=('pereval', 'season'), name='heightband_pereval_season')],
+            },
+        ),
+        migrations.RunPython(backfill_height_bands, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,31 @@
+# Generated by Django 5.2.5 on 2026-10-19 15:20
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('APIpj', '0015_heightband'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='PerevalAudit',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('pereval_id', models.BigIntegerField(verbose_name='Перевал')),
+                ('revision', models.UUIDField(verbose_name='Ревизия')),
+                ('model', models.CharField(max_length=20, verbose_name='Модель')),
+                ('field', models.CharField(max_length=50, verbose_name='Поле')),
+                ('old_value', models.JSONField(blank=True, null=True, verbose_name='Было')),
+                ('new_value', models.JSONField(blank=True, null=True, verbose_name='Стало')),
+                ('changed_at', models.DateTimeField(verbose_name='Время правки')),
+            ],
+            options={
+                'verbose_name': 'Правка перевала',
+                'verbose_name_plural': 'Журнал правок',
+                'indexes': [models.Index(fields=['pereval_id', 'id'], name='perevalaudit_pereval')],
+            },
+        ),
+    ]
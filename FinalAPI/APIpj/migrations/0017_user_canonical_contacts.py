@@ -0,0 +1,84 @@
+# Generated by Django 5.2.5 on 2026-10-19 15:28
+
+import re
+
+from django.db import migrations, models, transaction
+
+BATCH_SIZE = 2000
+
+
+def canonical_email(email):
+    # то же, что APIpj.contacts, на момент миграции
+    return email.strip().lower() if isinstance(email, str) and email.strip() else None
+
+
+def canonical_phone(phone):
+    digits = re.sub(r'\D', '', phone or '')
+    if len(digits) == 11 and digits[0] == '8':
+        digits = '7' + digits[1:]
+    return '+' + digits if digits and len(digits) <= 15 else None
+
+
+def backfill_canonical_contacts(apps, schema_editor):
+    # пачками по id, каждая пачка в своей транзакции: блокировки строк держатся недолго.
+    # Пользователи, совпавшие с более ранним по каноническому email/телефону, остаются с NULL
+    # (дубликаты, созданные до нормализации): API находит их по точному email/телефону (APIpj.contacts),
+    # User.save() оставляет у них NULL, пока значение занято. Объединять — вручную.
+    User = apps.get_model('APIpj', 'User')
+    seen_emails, seen_phones = set(), set()
+    last_id = 0
+    while True:
+        rows = list(User.objects.filter(id__gt=last_id).order_by('id').values_list('id', 'email', 'phone')[:BATCH_SIZE])
+        if not rows:
+            return
+        batch = []
+        for pk, email, phone in rows:
+            user = User(id=pk, email_canonical=canonical_email(email), phone_canonical=canonical_phone(phone))
+            if user.email_canonical in seen_emails:
+                user.email_canonical = None
+            if user.phone_canonical in seen_phones:
+                user.phone_canonical = None
+            seen_emails.add(user.email_canonical)
+            seen_phones.add(user.phone_canonical)
+            batch.append(user)
+        with transaction.atomic():
+            User.objects.bulk_update(batch, ['email_canonical', 'phone_canonical'])
+        last_id = rows[-1][0]
+
+
+class Migration(migrations.Migration):
+    atomic = False
+
+    dependencies = [
+        ('APIpj', '0016_perevalaudit'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='user',
+            name='email_canonical',
+            field=models.CharField(editable=False, max_length=254, null=True, verbose_name='Email (канонический)'),
+        ),
+        migrations.AddField(
+            model_name='user',
+            name='phone_canonical',
+            field=models.CharField(editable=False, max_length=16, null=True, verbose_name='Телефон (канонический)'),
+        ),
+        migrations.AlterField(
+            model_name='user',
+            name='phone',
+            field=models.CharField(max_length=32, unique=True, verbose_name='Телефон'),
+        ),
+        migrations.RunPython(backfill_canonical_contacts, migrations.RunPython.noop),
+        # уникальные индексы — после заполнения
+        migrations.AlterField(
+            model_name='user',
+            name='email_canonical',
+            field=models.CharField(editable=False, max_length=254, null=True, unique=True, verbose_name='Email (канонический)'),
+        ),
+        migrations.AlterField(
+            model_name='user',
+            name='phone_canonical',
+            field=models.CharField(editable=False, max_length=16, null=True, unique=True, verbose_name='Телефон (канонический)'),
+        ),
+    ]
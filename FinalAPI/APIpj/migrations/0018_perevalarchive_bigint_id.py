@@ -0,0 +1,18 @@
+# Generated by Django 5.2.5 on 2026-10-19 15:42
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('APIpj', '0017_user_canonical_contacts'),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name='perevalarchive',
+            name='id',
+            field=models.BigIntegerField(primary_key=True, serialize=False),
+        ),
+    ]
@@ -0,0 +1,24 @@
+# Generated by Django 5.2.5 on 2026-10-19 15:44
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('APIpj', '0018_perevalarchive_bigint_id'),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name='perevalchange',
+            name='kind',
+            field=models.CharField(choices=[('created', 'Создан'), ('updated', 'Изменён'), ('status', 'Смена статуса'), ('archived', 'Перенесён в архив'), ('deleted', 'Удалён')], max_length=10, verbose_name='Тип изменения'),
+        ),
+        migrations.AlterField(
+            model_name='perevalchange',
+            name='pereval',
+            field=models.ForeignKey(db_constraint=False, on_delete=django.db.models.deletion.DO_NOTHING, related_name='changes', to='APIpj.perevaladded', verbose_name='Перевал'),
+        ),
+    ]
@@ -0,0 +1,18 @@
+# Generated by Django 5.2.5 on 2026-10-19 15:45
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('APIpj', '0019_perevalchange_tombstones'),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name='heightband',
+            name='band',
+            field=models.IntegerField(verbose_name='Полоса высот'),
+        ),
+    ]
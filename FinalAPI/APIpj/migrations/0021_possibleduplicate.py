@@ -0,0 +1,30 @@
+# Generated by Django 5.2.5 on 2026-10-19 15:58
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('APIpj', '0020_heightband_band_integer'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='PossibleDuplicate',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('distance_km', models.FloatField(verbose_name='Расстояние, км')),
+                ('similarity', models.FloatField(verbose_name='Похожесть названия')),
+                ('found_at', models.DateTimeField(auto_now_add=True, verbose_name='Найден')),
+                ('duplicate', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='+', to='APIpj.perevaladded', verbose_name='Возможный дубль')),
+                ('pereval', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='duplicate_candidates', to='APIpj.perevaladded', verbose_name='Перевал')),
+            ],
+            options={
+                'verbose_name': 'Возможный дубль',
+                'verbose_name_plural': 'Возможные дубли',
+                'constraints': [models.UniqueConstraint(fields=('pereval', 'duplicate'), name='possibleduplicate_pereval_duplicate')],
+            },
+        ),
+    ]
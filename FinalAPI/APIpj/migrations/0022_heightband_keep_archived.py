@@ -0,0 +1,19 @@
+# Generated by Django 5.2.5 on 2026-10-19 16:00
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('APIpj', '0021_possibleduplicate'),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name='heightband',
+            name='pereval',
+            field=models.ForeignKey(db_constraint=False, on_delete=django.db.models.deletion.DO_NOTHING, related_name='height_bands', to='APIpj.perevaladded', verbose_name='Перевал'),
+        ),
+    ]
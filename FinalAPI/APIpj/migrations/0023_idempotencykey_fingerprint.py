@@ -0,0 +1,18 @@
+# Generated by Django 5.2.5 on 2026-10-19 16:02
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('APIpj', '0022_heightband_keep_archived'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='idempotencykey',
+            name='fingerprint',
+            field=models.CharField(blank=True, default='', max_length=64, verbose_name='Отпечаток запроса'),
+        ),
+    ]
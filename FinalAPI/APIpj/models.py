@@ -1,13 +1,20 @@
-from django.db import models
+from typing import Iterable, Optional
+from django.db import models, transaction
 from django.core.validators import EmailValidator
 from django.contrib.auth.models import AbstractUser
+from django.utils import timezone
+from .contacts import canonical_email, canonical_phone
+from .signals import StatusChange, pereval_status_changed
 
 class User(AbstractUser):
     email = models.EmailField(unique=True, validators=[EmailValidator()])
     first_name = models.CharField(max_length=50, verbose_name='Имя')
     last_name = models.CharField(max_length=50, verbose_name='Фамилия')
     patronymic = models.CharField(max_length=50, blank=True, null=True, verbose_name='Отчество')
-    phone = models.CharField(max_length=16, verbose_name='Телефон', unique=True,)
+    phone = models.CharField(max_length=32, verbose_name='Телефон', unique=True,)
+    # канонический вид для поиска отправителя (APIpj.contacts), заполняется в save()
+    email_canonical = models.CharField(max_length=254, unique=True, null=True, editable=False, verbose_name='Email (канонический)')
+    phone_canonical = models.CharField(max_length=16, unique=True, null=True, editable=False, verbose_name='Телефон (канонический)')
 
     class Meta:
         verbose_name = 'Пользователь'
@@ -15,7 +22,23 @@ class User(AbstractUser):
 
     def __str__(self):
         return f"{self.last_name} {self.first_name} {self.patronymic or ''}"
-    
+
+    def save(self, *args, **kwargs):
+        self.email_canonical = self._free_canonical("email_canonical", canonical_email(self.email))
+        self.phone_canonical = self._free_canonical("phone_canonical", canonical_phone(self.phone))
+        update_fields = kwargs.get("update_fields")
+        if update_fields is not None and {"email", "phone"} & set(update_fields):
+            kwargs["update_fields"] = {*update_fields, "email_canonical", "phone_canonical"}
+        super().save(*args, **kwargs)
+
+    def _free_canonical(self, field: str, value: Optional[str]) -> Optional[str]:
+        # у дубликата, созданного до нормализации (миграция 0017), каноническое значение занято
+        # более ранним пользователем: оставляем NULL, иначе сохранение упрётся в уникальный индекс
+        if self.pk is None or value is None or getattr(self, field) is not None:
+            return value
+        taken = User.objects.filter(**{field: value}).exclude(pk=self.pk).exists()
+        return None if taken else value
+
 
 class Coords(models.Model):
     latitude = models.FloatField(verbose_name='Широта')
@@ -28,7 +51,14 @@ class Coords(models.Model):
 
     def __str__(self):
         return f"Широта: {self.latitude}, Долгота: {self.longitude}, Высота: {self.height}"
-    
+
+    @classmethod
+    def from_db(cls, db, field_names, values):
+        # запоминаем точку из БД: при save() кластеры карты (APIpj.clusters) переносят перевал из старой ячейки
+        instance = super().from_db(db, field_names, values)
+        instance._loaded_point = (instance.__dict__.get("latitude"), instance.__dict__.get("longitude"))
+        return instance
+
 
 class Level(models.Model):
     winter = models.CharField(max_length=10, blank=True, null=True, verbose_name='Зима')
@@ -48,6 +78,12 @@ class Image(models.Model):
     data = models.ImageField(upload_to='pereval_images/', verbose_name='Изображение')
     title = models.CharField(max_length=255, verbose_name='Название')
     date_added = models.DateTimeField(auto_now_add=True, verbose_name='Дата добавления')
+    # метаданные из EXIF (APIpj.exif); width IS NULL — файл ещё не обработан, 0 — прочитать не удалось
+    width = models.PositiveIntegerField(blank=True, null=True, verbose_name='Ширина')
+    height = models.PositiveIntegerField(blank=True, null=True, verbose_name='Высота')
+    taken_at = models.DateTimeField(blank=True, null=True, verbose_name='Дата съёмки')
+    gps_latitude = models.FloatField(blank=True, null=True, verbose_name='Широта съёмки')
+    gps_longitude = models.FloatField(blank=True, null=True, verbose_name='Долгота съёмки')
 
     class Meta:
         verbose_name = 'Изображение'
@@ -68,6 +104,27 @@ class ActivityType(models.Model):
         verbose_name_plural = "Виды активности"
 
 
+class PerevalQuerySet(models.QuerySet):
+    def set_status(self, status: str, sources: Optional[Iterable[str]] = None) -> int:
+        """Меняет статус одним UPDATE, пишет журнал изменений и отправляет pereval_status_changed."""
+        qs = self.exclude(status=status)
+        if sources is not None:
+            qs = qs.filter(status__in=list(sources))
+
+        with transaction.atomic(using=self.db):
+            rows = list(qs.select_for_update().values_list("id", "user_id", "status"))
+            if not rows:
+                return 0
+            self.model.objects.filter(id__in=[r[0] for r in rows]).update(status=status, updated_at=timezone.now())
+            PerevalChange.objects.bulk_create(
+                PerevalChange(pereval_id=pk, user_id=user_id, kind=PerevalChange.Kind.STATUS, status=status)
+                for pk, user_id, _ in rows
+            )
+            changes = [StatusChange(pk, user_id, old, status) for pk, user_id, old in rows]
+            pereval_status_changed.send(sender=self.model, changes=changes)
+        return len(rows)
+
+
 class PerevalAdded(models.Model):
     class StatusChoices(models.TextChoices):
         NEW = 'new', 'Новый'
@@ -81,13 +138,16 @@ class PerevalAdded(models.Model):
     other_titles = models.CharField(max_length=255, blank=True, null=True, verbose_name='Другие названия')
     connect = models.TextField(blank=True, null=True, verbose_name='Что соединяет')
     add_time = models.DateTimeField(auto_now_add=True, verbose_name='Дата добавления')
-    status = models.CharField(max_length=10, choices=StatusChoices, default='new', verbose_name='Статус')
+    updated_at = models.DateTimeField(auto_now=True, db_index=True, verbose_name='Дата изменения')
+    status = models.CharField(max_length=10, choices=StatusChoices, default='new', db_index=True, verbose_name='Статус')
     user = models.ForeignKey(User, on_delete=models.CASCADE, related_name='pereval', verbose_name='Пользователь')
     coords = models.ForeignKey(Coords, on_delete=models.CASCADE, verbose_name='Координаты')
     level = models.ForeignKey(Level, on_delete=models.CASCADE, verbose_name='Уровень сложности')
     images = models.ManyToManyField(Image, through='PerevalImage', verbose_name='Изображения')
     activity_type = models.ForeignKey(ActivityType, on_delete=models.CASCADE, verbose_name='Вид активности')
 
+    objects = PerevalQuerySet.as_manager()
+
     class Meta:
         verbose_name = 'Перевал'
         verbose_name_plural = 'Перевалы'
@@ -95,6 +155,13 @@ class PerevalAdded(models.Model):
     def __str__(self):
         return self.title
 
+    @classmethod
+    def from_db(cls, db, field_names, values):
+        # запоминаем статус из БД, чтобы при save() понять, что он изменился
+        instance = super().from_db(db, field_names, values)
+        instance._loaded_status = instance.__dict__.get("status")
+        return instance
+
 
 class PerevalImage(models.Model):
     pereval = models.ForeignKey(PerevalAdded, on_delete=models.CASCADE)
@@ -104,3 +171,212 @@ class PerevalImage(models.Model):
         verbose_name = 'Изображение перевала'
         verbose_name_plural = 'Изображения перевалов'
 
+
+
+class PerevalChange(models.Model):
+    """
+    Журнал изменений перевалов. id — монотонный курсор для инкрементальной синхронизации клиентов.
+    Записи переживают перевал: перенос в архив и удаление тоже попадают в журнал (archived, deleted).
+    """
+
+    class Kind(models.TextChoices):
+        CREATED = 'created', 'Создан'
+        UPDATED = 'updated', 'Изменён'
+        STATUS = 'status', 'Смена статуса'
+        ARCHIVED = 'archived', 'Перенесён в архив'
+        DELETED = 'deleted', 'Удалён'
+
+    pereval = models.ForeignKey(
+        PerevalAdded, on_delete=models.DO_NOTHING, db_constraint=False, related_name='changes', verbose_name='Перевал'
+    )
+    # дублируем пользователя, чтобы выборка по курсору шла по индексу (user, id) без JOIN
+    user = models.ForeignKey(User, on_delete=models.CASCADE, db_index=False, related_name='+', verbose_name='Пользователь')
+    kind = models.CharField(max_length=10, choices=Kind, verbose_name='Тип изменения')
+    status = models.CharField(max_length=10, choices=PerevalAdded.StatusChoices, verbose_name='Статус')
+    created_at = models.DateTimeField(auto_now_add=True, verbose_name='Дата изменения')
+
+    class Meta:
+        verbose_name = 'Изменение перевала'
+        verbose_name_plural = 'Изменения перевалов'
+        indexes = [models.Index(fields=['user', 'id'], name='perevalchange_user_cursor')]
+
+    def __str__(self):
+        return f"{self.pereval_id}: {self.kind}"
+
+
+class PerevalArchive(models.Model):
+    """
+    Перевал, перенесённый из PerevalAdded командой archive_perevals (APIpj.archive).
+    id совпадает с исходным, координаты и уровень сложности хранятся в той же строке.
+    """
+
+    id = models.BigIntegerField(primary_key=True)
+    beauty_title = models.CharField(max_length=255, verbose_name='Красивое название')
+    title = models.CharField(max_length=255, verbose_name='Название')
+    other_titles = models.CharField(max_length=255, blank=True, null=True, verbose_name='Другие названия')
+    connect = models.TextField(blank=True, null=True, verbose_name='Что соединяет')
+    add_time = models.DateTimeField(verbose_name='Дата добавления')
+    updated_at = models.DateTimeField(verbose_name='Дата изменения')
+    status = models.CharField(max_length=10, choices=PerevalAdded.StatusChoices, verbose_name='Статус')
+    user = models.ForeignKey(User, on_delete=models.CASCADE, related_name='+', verbose_name='Пользователь')
+    activity_type = models.ForeignKey(ActivityType, on_delete=models.CASCADE, related_name='+', verbose_name='Вид активности')
+    latitude = models.FloatField(verbose_name='Широта')
+    longitude = models.FloatField(verbose_name='Долгота')
+    height = models.IntegerField(verbose_name='Высота')
+    winter = models.CharField(max_length=10, blank=True, null=True, verbose_name='Зима')
+    summer = models.CharField(max_length=10, blank=True, null=True, verbose_name='Лето')
+    autumn = models.CharField(max_length=10, blank=True, null=True, verbose_name='Осень')
+    spring = models.CharField(max_length=10, blank=True, null=True, verbose_name='Весна')
+    images = models.ManyToManyField(Image, related_name='+', verbose_name='Изображения')
+    archived_at = models.DateTimeField(auto_now_add=True, verbose_name='Дата архивации')
+
+    class Meta:
+        verbose_name = 'Архивный перевал'
+        verbose_name_plural = 'Архивные перевалы'
+
+    def __str__(self):
+        return self.title
+
+
+class UserPassSummary(models.Model):
+    """
+    Сводка по перевалам пользователя для экрана профиля (APIpj.summaries).
+    Обновляется при создании и удалении перевала и смене статуса; архивные перевалы остаются в счётчиках.
+    """
+
+    user = models.OneToOneField(User, on_delete=models.CASCADE, primary_key=True, related_name='pass_summary', verbose_name='Пользователь')
+    new = models.PositiveIntegerField(default=0, verbose_name='Новые')
+    pending = models.PositiveIntegerField(default=0, verbose_name='В работе')
+    accepted = models.PositiveIntegerField(default=0, verbose_name='Приняты')
+    rejected = models.PositiveIntegerField(default=0, verbose_name='Отклонены')
+    last_submitted_at = models.DateTimeField(blank=True, null=True, verbose_name='Последняя отправка')
+    # последние перевалы в кратком виде: [{"id", "title", "status", "add_time"}, ...], новые первыми
+    recent = models.JSONField(default=list, verbose_name='Последние перевалы')
+
+    class Meta:
+        verbose_name = 'Сводка пользователя'
+        verbose_name_plural = 'Сводки пользователей'
+
+    def __str__(self):
+        return str(self.user_id)
+
+
+class ClusterCell(models.Model):
+    """
+    Агрегат перевалов в ячейке сетки карты (APIpj.clusters): уровень zoom, ячейка (x, y)
+    в сетке тайлов Web Mercator, где каждый тайл делится на CLUSTER_CELLS_PER_TILE² ячеек.
+    """
+
+    zoom = models.PositiveSmallIntegerField(verbose_name='Масштаб')
+    x = models.IntegerField(verbose_name='Ячейка X')
+    y = models.IntegerField(verbose_name='Ячейка Y')
+    count = models.IntegerField(default=0, verbose_name='Перевалов')
+    # суммы координат, центр кластера — sum / count
+    sum_lat = models.FloatField(default=0, verbose_name='Сумма широт')
+    sum_lon = models.FloatField(default=0, verbose_name='Сумма долгот')
+    new = models.IntegerField(default=0, verbose_name='Новые')
+    pending = models.IntegerField(default=0, verbose_name='В работе')
+    accepted = models.IntegerField(default=0, verbose_name='Приняты')
+    rejected = models.IntegerField(default=0, verbose_name='Отклонены')
+
+    class Meta:
+        verbose_name = 'Ячейка карты'
+        verbose_name_plural = 'Ячейки карты'
+        constraints = [models.UniqueConstraint(fields=['zoom', 'x', 'y'], name='clustercell_zoom_x_y')]
+
+    def __str__(self):
+        return f"{self.zoom}/{self.x}/{self.y}"
+
+
+class PossibleDuplicate(models.Model):
+    """
+    Возможный дубль, найденный при отправке перевала (APIpj.duplicates): pereval — новый перевал,
+    duplicate — уже существующий рядом с похожим названием. В админке по ним отмечаются и фильтруются перевалы.
+    """
+
+    pereval = models.ForeignKey(PerevalAdded, on_delete=models.CASCADE, related_name='duplicate_candidates', verbose_name='Перевал')
+    duplicate = models.ForeignKey(PerevalAdded, on_delete=models.CASCADE, related_name='+', verbose_name='Возможный дубль')
+    distance_km = models.FloatField(verbose_name='Расстояние, км')
+    similarity = models.FloatField(verbose_name='Похожесть названия')
+    found_at = models.DateTimeField(auto_now_add=True, verbose_name='Найден')
+
+    class Meta:
+        verbose_name = 'Возможный дубль'
+        verbose_name_plural = 'Возможные дубли'
+        constraints = [models.UniqueConstraint(fields=['pereval', 'duplicate'], name='possibleduplicate_pereval_duplicate')]
+
+    def __str__(self):
+        return f"{self.pereval_id} ~ {self.duplicate_id}"
+
+
+class HeightBand(models.Model):
+    """
+    Индекс перевалов по высоте (APIpj.heights): строка на перевал и сезон с категорией
+    сложности этого сезона и номером полосы высот height // HEIGHT_BAND_SIZE.
+    """
+
+    class Season(models.TextChoices):
+        WINTER = 'winter', 'Зима'
+        SUMMER = 'summer', 'Лето'
+        AUTUMN = 'autumn', 'Осень'
+        SPRING = 'spring', 'Весна'
+
+    # без ограничения FK: строки перенесённых в архив перевалов остаются в индексе (id в архиве тот же),
+    # при удалении перевала их удаляет receivers.remove_from_height_bands
+    pereval = models.ForeignKey(PerevalAdded, on_delete=models.DO_NOTHING, db_constraint=False, related_name='height_bands', verbose_name='Перевал')
+    season = models.CharField(max_length=6, choices=Season.choices, verbose_name='Сезон')
+    # пустая строка — категория для сезона не указана
+    category = models.CharField(max_length=10, blank=True, default='', verbose_name='Категория')
+    band = models.IntegerField(verbose_name='Полоса высот')
+    height = models.IntegerField(verbose_name='Высота')
+
+    class Meta:
+        verbose_name = 'Полоса высот'
+        verbose_name_plural = 'Полосы высот'
+        constraints = [models.UniqueConstraint(fields=['pereval', 'season'], name='heightband_pereval_season')]
+        indexes = [models.Index(fields=['season', 'category', 'band', 'height'], name='heightband_lookup')]
+
+    def __str__(self):
+        return f"{self.pereval_id}: {self.season} {self.category or '—'}, {self.height} м"
+
+
+class PerevalAudit(models.Model):
+    """
+    Журнал правок перевала по полям (APIpj.audit), только добавление. Пишется пачками
+    в фоновом потоке; changed_at — время правки, а не записи. Перевал указан числом,
+    чтобы история оставалась и после переноса перевала в архив.
+    """
+
+    pereval_id = models.BigIntegerField(verbose_name='Перевал')
+    # одна правка (PATCH) — одна ревизия, в ней изменения нескольких полей и моделей
+    revision = models.UUIDField(verbose_name='Ревизия')
+    model = models.CharField(max_length=20, verbose_name='Модель')
+    field = models.CharField(max_length=50, verbose_name='Поле')
+    old_value = models.JSONField(blank=True, null=True, verbose_name='Было')
+    new_value = models.JSONField(blank=True, null=True, verbose_name='Стало')
+    changed_at = models.DateTimeField(verbose_name='Время правки')
+
+    class Meta:
+        verbose_name = 'Правка перевала'
+        verbose_name_plural = 'Журнал правок'
+        indexes = [models.Index(fields=['pereval_id', 'id'], name='perevalaudit_pereval')]
+
+    def __str__(self):
+        return f"#{self.pereval_id} {self.model}.{self.field}"
+
+
+class IdempotencyKey(models.Model):
+    key = models.CharField(max_length=255, unique=True, verbose_name='Ключ')
+    # пока запрос обрабатывается, status_code пустой
+    status_code = models.PositiveSmallIntegerField(blank=True, null=True, verbose_name='Код ответа')
+    response = models.JSONField(blank=True, null=True, verbose_name='Тело ответа')
+    # sha256 тела запроса (APIpj.idempotency.fingerprint); заполняется вместе с ответом
+    fingerprint = models.CharField(max_length=64, blank=True, default='', verbose_name='Отпечаток запроса')
+    created_at = models.DateTimeField(auto_now_add=True, db_index=True, verbose_name='Дата создания')
+
+    class Meta:
+        verbose_name = 'Ключ идемпотентности'
+        verbose_name_plural = 'Ключи идемпотентности'
+
+    def __str__(self):
+        return self.key
@@ -0,0 +1,33 @@
+from django.core.paginator import Paginator
+from django.db import connections
+from django.utils.functional import cached_property
+
+
+class EstimatedCountPaginator(Paginator):
+    """
+    Пагинатор для больших таблиц в админке.
+    Без фильтров число строк берётся из статистики PostgreSQL (pg_class.reltuples) вместо COUNT(*),
+    с фильтрами считается не дальше COUNT_LIMIT строк.
+    """
+
+    COUNT_LIMIT = 10_000
+
+    @cached_property
+    def count(self) -> int:
+        qs = self.object_list
+        if not qs.query.where:
+            estimate = self._estimate(qs)
+            if estimate > self.COUNT_LIMIT:
+                return estimate
+        return qs[: self.COUNT_LIMIT].count()
+
+    @staticmethod
+    def _estimate(qs) -> int:
+        connection = connections[qs.db]
+        if connection.vendor != "postgresql":
+            return -1
+        with connection.cursor() as cursor:
+            cursor.execute("SELECT reltuples::bigint FROM pg_class WHERE relname = %s", [qs.model._meta.db_table])
+            row = cursor.fetchone()
+        # -1 — таблица ещё не анализировалась
+        return int(row[0]) if row else -1
@@ -0,0 +1,188 @@
+import logging
+from typing import List
+
+from django.db import transaction
+from django.db.models.signals import post_delete, post_save
+from django.dispatch import receiver
+from django.utils import timezone
+
+from .archive import is_archiving
+from .events import get_broker
+from .models import ActivityType, Coords, Level, PerevalAdded, PerevalArchive, PerevalChange, User
+from .refdata import refdata
+from . import clusters, heights, metrics, summaries
+from .signals import StatusChange, pereval_status_changed
+
+logger = logging.getLogger(__name__)
+
+
+@receiver(post_save, sender=PerevalAdded, dispatch_uid="pereval_change_log")
+def log_pereval_change(sender, instance: PerevalAdded, created: bool, raw: bool = False, **kwargs) -> None:
+    if raw:
+        return
+
+    old_status = getattr(instance, "_loaded_status", None)
+    if created:
+        kind = PerevalChange.Kind.CREATED
+    elif old_status is not None and old_status != instance.status:
+        kind = PerevalChange.Kind.STATUS
+    else:
+        kind = PerevalChange.Kind.UPDATED
+
+    PerevalChange.objects.create(pereval=instance, user_id=instance.user_id, kind=kind, status=instance.status)
+    instance._loaded_status = instance.status
+
+    if kind == PerevalChange.Kind.STATUS:
+        change = StatusChange(instance.id, instance.user_id, old_status, instance.status)
+        pereval_status_changed.send(sender=PerevalAdded, changes=[change])
+
+
+@receiver(post_delete, sender=PerevalAdded, dispatch_uid="pereval_change_log_deleted")
+def log_pereval_deleted(sender, instance: PerevalAdded, origin=None, **kwargs) -> None:
+    # перенос в архив журнал записывает сам (archive_batch); при удалении пользователя журнал уходит вместе с ним
+    if is_archiving() or isinstance(origin, User) or getattr(origin, "model", None) is User:
+        return
+    PerevalChange.objects.create(
+        pereval_id=instance.id, user_id=instance.user_id, kind=PerevalChange.Kind.DELETED, status=instance.status
+    )
+
+
+@receiver(post_save, sender=PerevalAdded, dispatch_uid="pereval_user_summary")
+def update_user_summary(sender, instance: PerevalAdded, created: bool, raw: bool = False, **kwargs) -> None:
+    if raw:
+        return
+    if created:
+        summaries.record_created(instance)
+    else:
+        summaries.record_updated(instance)
+
+
+@receiver(post_delete, sender=PerevalAdded, dispatch_uid="pereval_user_summary_deleted")
+def remove_from_user_summary(sender, instance: PerevalAdded, origin=None, **kwargs) -> None:
+    # архивные перевалы остаются в сводке; сводка удалённого пользователя удаляется вместе с ним
+    if is_archiving() or isinstance(origin, User) or getattr(origin, "model", None) is User:
+        return
+    summaries.record_deleted(instance)
+
+
+@receiver(post_save, sender=PerevalAdded, dispatch_uid="pereval_map_clusters")
+def update_map_clusters(sender, instance: PerevalAdded, created: bool, raw: bool = False, **kwargs) -> None:
+    if created and not raw:
+        clusters.record_created(instance)
+
+
+@receiver(post_delete, sender=PerevalAdded, dispatch_uid="pereval_map_clusters_deleted")
+def remove_from_map_clusters(sender, instance: PerevalAdded, **kwargs) -> None:
+    # перенесённые в архив перевалы остаются на карте
+    if not is_archiving():
+        clusters.record_deleted(instance)
+
+
+@receiver(post_save, sender=Coords, dispatch_uid="coords_map_clusters")
+def move_in_map_clusters(sender, instance: Coords, created: bool, raw: bool = False, **kwargs) -> None:
+    # правка координат через API и в админке; новые Coords ещё не привязаны к перевалу
+    old_point = getattr(instance, "_loaded_point", None)
+    if created or raw or old_point is None:
+        return
+    clusters.record_moved(instance, *old_point)
+    instance._loaded_point = (instance.latitude, instance.longitude)
+
+
+@receiver(post_save, sender=PerevalAdded, dispatch_uid="pereval_duplicates")
+def flag_possible_duplicates(sender, instance: PerevalAdded, created: bool, raw: bool = False, **kwargs) -> None:
+    if not created or raw:
+        return
+    pereval_id = instance.id
+
+    def check() -> None:
+        # NumPy подгружается при первой проверке, а не при старте воркера
+        from .duplicates import flag_new
+
+        try:
+            flag_new(pereval_id)
+        except Exception:
+            logger.exception("Не удалось проверить перевал %s на дубли", pereval_id)
+            metrics.incr("duplicates.check_failed")
+
+    transaction.on_commit(check)
+
+
+@receiver(post_delete, sender=PerevalAdded, dispatch_uid="pereval_duplicates_deleted")
+def forget_duplicate_candidate(sender, instance: PerevalAdded, **kwargs) -> None:
+    from .duplicates import forget
+
+    pereval_id = instance.id
+    transaction.on_commit(lambda: forget(pereval_id))
+
+
+@receiver(post_save, sender=PerevalAdded, dispatch_uid="pereval_height_bands")
+def index_height_bands(sender, instance: PerevalAdded, created: bool, raw: bool = False, **kwargs) -> None:
+    if created and not raw:
+        heights.record_created(instance)
+
+
+@receiver(post_delete, sender=PerevalAdded, dispatch_uid="pereval_height_bands_deleted")
+def remove_from_height_bands(sender, instance: PerevalAdded, **kwargs) -> None:
+    # перенесённые в архив перевалы остаются в индексе высот, как в сводках и на карте
+    if not is_archiving():
+        heights.record_deleted(instance.id)
+
+
+@receiver(post_delete, sender=PerevalArchive, dispatch_uid="archive_derived_indexes_deleted")
+def remove_archived_from_indexes(sender, instance: PerevalArchive, origin=None, **kwargs) -> None:
+    # архивный перевал удалён — убираем его с карты, из индекса высот и из сводки (она удаляется вместе с пользователем)
+    clusters.record_removed(instance.latitude, instance.longitude, instance.status)
+    heights.record_deleted(instance.id)
+    if not (isinstance(origin, User) or getattr(origin, "model", None) is User):
+        summaries.record_deleted(instance)
+
+
+@receiver(post_save, sender=Coords, dispatch_uid="coords_height_bands")
+def update_height_bands_height(sender, instance: Coords, created: bool, raw: bool = False, **kwargs) -> None:
+    # новые Coords ещё не привязаны к перевалу, строки индекса создаёт index_height_bands
+    if not created and not raw:
+        heights.record_coords(instance)
+
+
+@receiver(post_save, sender=Level, dispatch_uid="level_height_bands")
+def update_height_bands_category(sender, instance: Level, created: bool, raw: bool = False, **kwargs) -> None:
+    if not created and not raw:
+        heights.record_level(instance)
+
+
+@receiver(pereval_status_changed, dispatch_uid="pereval_status_summary")
+def apply_status_to_summaries(sender, changes: List[StatusChange], **kwargs) -> None:
+    summaries.record_status_changes(changes)
+    clusters.record_status_changes(changes)
+
+
+@receiver(pereval_status_changed, dispatch_uid="pereval_status_events")
+def publish_status_events(sender, changes: List[StatusChange], **kwargs) -> None:
+    ts = timezone.now().isoformat()
+    events = [
+        {"type": "status", "id": c.pereval_id, "user_id": c.user_id,
+         "old_status": c.old_status, "status": c.new_status, "ts": ts}
+        for c in changes
+    ]
+
+    def publish() -> None:
+        # статус уже зафиксирован: сбой рассылки не должен превращаться в ошибку запроса
+        try:
+            broker = get_broker()
+            for event in events:
+                broker.publish(event)
+        except Exception:
+            logger.exception("Не удалось разослать смену статуса перевалов")
+            metrics.incr("events.publish_failed")
+
+    # подписчики узнают о смене статуса только после фиксации транзакции
+    transaction.on_commit(publish)
+
+
+@receiver(post_save, sender=ActivityType, dispatch_uid="refdata_activity_type_saved")
+@receiver(post_delete, sender=ActivityType, dispatch_uid="refdata_activity_type_deleted")
+def invalidate_reference_data(sender, **kwargs) -> None:
+    # сбрасываем сразу и ещё раз после commit: другой поток процесса мог перечитать справочник до фиксации.
+    # Остальные воркеры перечитают его сами через REFERENCE_CACHE_CHECK_INTERVAL
+    refdata.invalidate()
+    transaction.on_commit(refdata.invalidate)
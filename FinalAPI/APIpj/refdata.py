@@ -0,0 +1,81 @@
+"""
+Кэш справочников в памяти процесса: виды активности (ActivityType).
+
+Справочники почти не меняются, поэтому сериализаторы берут их отсюда, а не из БД.
+Источник правды — сама таблица: каждый воркер перечитывает её не реже чем раз в
+REFERENCE_CACHE_CHECK_INTERVAL секунд (таблица маленькая, это один лёгкий запрос).
+Согласованность между воркерами не зависит от общего Django cache: с LocMemCache
+каждого процесса удалённый в другом воркере вид активности тоже перестаёт приниматься
+не позже чем через этот интервал. Процесс, в котором справочник изменён, перечитывает
+его сразу (сигналы ActivityType, см. receivers.invalidate_reference_data).
+"""
+import threading
+import time
+from typing import Dict, Optional
+
+from django.conf import settings
+from django.db import DatabaseError
+
+WARM_UP_UID = "refdata_warm_up"
+
+
+class ReferenceData:
+    def __init__(self) -> None:
+        self._lock = threading.Lock()
+        self._activity_types: Dict[int, str] = {}
+        self._loaded_at: Optional[float] = None
+
+    def _ensure_fresh(self) -> None:
+        interval = getattr(settings, "REFERENCE_CACHE_CHECK_INTERVAL", 5)
+        loaded_at = self._loaded_at
+        if loaded_at is None or time.monotonic() - loaded_at >= interval:
+            self.load()
+
+    def load(self) -> None:
+        from .models import ActivityType
+
+        activity_types = dict(ActivityType.objects.values_list("id", "title"))
+        with self._lock:
+            self._activity_types = activity_types
+            self._loaded_at = time.monotonic()
+
+    def invalidate(self) -> None:
+        """Текущий процесс перечитает справочник при следующем обращении."""
+        self._loaded_at = None
+
+    def activity_title(self, pk: Optional[int]) -> Optional[str]:
+        from .models import ActivityType
+
+        self._ensure_fresh()
+        title = self._activity_types.get(pk)
+        if title is None and pk is not None:
+            # запись могла появиться в другом воркере после загрузки — проверяем БД
+            title = ActivityType.objects.filter(pk=pk).values_list("title", flat=True).first()
+            if title is not None:
+                with self._lock:
+                    self._activity_types = {**self._activity_types, pk: title}
+        return title
+
+    def activity_type(self, pk: int):
+        """ActivityType из кэша (без запроса к БД) или None, если такого вида активности нет."""
+        from .models import ActivityType
+
+        title = self.activity_title(pk)
+        if title is None:
+            return None
+        return ActivityType.from_db(None, ["id", "title"], [pk, title])
+
+
+refdata = ReferenceData()
+
+
+def warm_up(**kwargs) -> None:
+    """Прогрев кэша. Подключается в AppConfig.ready() к request_started и срабатывает один раз."""
+    from django.core.signals import request_started
+
+    request_started.disconnect(dispatch_uid=WARM_UP_UID)
+    try:
+        refdata.load()
+    except DatabaseError:
+        # таблиц ещё нет (например, до migrate) — кэш загрузится при первом обращении
+        pass
@@ -0,0 +1,47 @@
+from typing import Any, Optional
+
+from rest_framework import renderers, parsers
+from rest_framework.exceptions import ParseError
+from rest_framework.utils import encoders
+
+try:
+    import orjson
+except ImportError:  # orjson необязателен — без него работает стандартный json
+    orjson = None
+
+
+_ORJSON_OPTIONS = orjson.OPT_NON_STR_KEYS if orjson else 0
+
+
+class ORJSONRenderer(renderers.JSONRenderer):
+    """JSONRenderer на orjson. Если orjson не установлен — ведёт себя как обычный JSONRenderer."""
+
+    def render(self, data: Any, accepted_media_type: Optional[str] = None, renderer_context=None) -> bytes:
+        if orjson is None or data is None:
+            return super().render(data, accepted_media_type, renderer_context)
+
+        # отступы (?indent=) orjson умеет только по 2 пробела, поэтому такие запросы отдаём стандартному рендереру
+        renderer_context = renderer_context or {}
+        if self.get_indent(accepted_media_type or "", renderer_context):
+            return super().render(data, accepted_media_type, renderer_context)
+
+        try:
+            return orjson.dumps(data, default=encoders.JSONEncoder().default, option=_ORJSON_OPTIONS)
+        except TypeError:
+            # типы, которые orjson не понимает (например, большие int) — обрабатываем стандартно
+            return super().render(data, accepted_media_type, renderer_context)
+
+
+class ORJSONParser(parsers.JSONParser):
+    """JSONParser на orjson с откатом на стандартный json."""
+
+    renderer_class = ORJSONRenderer
+
+    def parse(self, stream, media_type=None, parser_context=None) -> Any:
+        if orjson is None:
+            return super().parse(stream, media_type, parser_context)
+
+        try:
+            return orjson.loads(stream.read())
+        except orjson.JSONDecodeError as exc:
+            raise ParseError(f"JSON parse error - {exc}")
@@ -0,0 +1,116 @@
+"""
+OpenAPI-схема, собранная один раз.
+
+`python manage.py build_schema` генерирует схему drf-spectacular в файл settings.API_SCHEMA_FILE
+и сверяет её с вручную поддерживаемой static/FinalAPI.yaml. CachedSpectacularAPIView отдаёт
+готовую схему из памяти процесса с ETag. Если файла нет, схема генерируется при первом запросе.
+"""
+import hashlib
+import threading
+from pathlib import Path
+from typing import Any, Dict, Set, Tuple
+
+import yaml
+from django.conf import settings
+from django.http import HttpResponse, HttpResponseNotModified
+from django.utils.cache import patch_cache_control
+from django.utils.http import parse_etags
+from drf_spectacular.extensions import OpenApiSerializerExtension
+from drf_spectacular.generators import SchemaGenerator
+from drf_spectacular.renderers import OpenApiYamlRenderer
+from drf_spectacular.utils import extend_schema
+from drf_spectacular.views import SCHEMA_KWARGS, SpectacularAPIView
+
+HTTP_METHODS = ("get", "put", "post", "delete", "options", "head", "patch", "trace")
+
+Operations = Set[Tuple[str, str]]
+
+
+class MetricsResponseExtension(OpenApiSerializerExtension):
+    """Счётчики /api/metrics/ — объект {имя: число} без фиксированного набора полей."""
+
+    target_class = "APIpj.serializers.MetricsResponseSerializer"
+
+    def map_serializer(self, auto_schema, direction):
+        return {"type": "object", "additionalProperties": {"type": "number"}}
+
+
+def generate_schema() -> Dict[str, Any]:
+    return SchemaGenerator().get_schema(request=None, public=True)
+
+
+def render_yaml(schema: Dict[str, Any]) -> bytes:
+    return OpenApiYamlRenderer().render(schema, renderer_context={})
+
+
+def load_schema_file(path: Path) -> Dict[str, Any]:
+    with open(path, encoding="utf-8") as f:
+        return yaml.safe_load(f)
+
+
+def operations(schema: Dict[str, Any]) -> Operations:
+    return {
+        (path, method)
+        for path, item in (schema.get("paths") or {}).items()
+        for method in item
+        if method in HTTP_METHODS
+    }
+
+
+def compare_operations(generated: Dict[str, Any], static: Dict[str, Any]) -> Tuple[Operations, Operations]:
+    """Операции, которых нет в статической схеме, и операции статической схемы, которых нет в коде."""
+    gen_ops, static_ops = operations(generated), operations(static)
+    return gen_ops - static_ops, static_ops - gen_ops
+
+
+def schema_language(request) -> str:
+    """
+    Язык схемы из ?lang=, если он есть в settings.LANGUAGES, иначе "" (язык по умолчанию).
+    Неизвестные значения не попадают в ключ кэша: иначе каждое из них собирало бы и хранило свою схему.
+    """
+    lang = request.GET.get("lang", "")
+    return lang if lang in dict(settings.LANGUAGES) else ""
+
+
+class CachedSpectacularAPIView(SpectacularAPIView):
+    """SpectacularAPIView, который строит ответ один раз на формат и дальше отдаёт его из памяти."""
+
+    _cache: Dict[Tuple[str, str], Tuple[bytes, str, str]] = {}
+    _lock = threading.Lock()
+
+    @extend_schema(**SCHEMA_KWARGS)
+    def get(self, request, *args, **kwargs):
+        renderer = request.accepted_renderer
+        lang = schema_language(request)
+        key = (renderer.format, lang)
+        entry = self._cache.get(key)
+        if entry is None:
+            with self._lock:
+                entry = self._cache.get(key) or self._build(request, renderer, lang, *args, **kwargs)
+                self._cache[key] = entry
+        body, content_type, etag = entry
+
+        if etag in parse_etags(request.META.get("HTTP_IF_NONE_MATCH", "")):
+            response = HttpResponseNotModified()
+        else:
+            response = HttpResponse(body, content_type=content_type)
+        response["ETag"] = etag
+        patch_cache_control(response, public=True, max_age=getattr(settings, "API_SCHEMA_MAX_AGE", 3600))
+        return response
+
+    def _build(self, request, renderer, lang: str, *args, **kwargs) -> Tuple[bytes, str, str]:
+        path = Path(settings.API_SCHEMA_FILE)
+        if path.exists() and not lang:
+            schema = load_schema_file(path)
+        else:
+            schema = super().get(request, *args, **kwargs).data
+        body = renderer.render(schema, renderer_context=self.get_renderer_context())
+        content_type = f"{renderer.media_type}; charset={renderer.charset}" if renderer.charset else renderer.media_type
+        etag = '"%s"' % hashlib.sha1(body).hexdigest()
+        return body, content_type, etag
+
+    @classmethod
+    def clear_cache(cls) -> None:
+        with cls._lock:
+            cls._cache.clear()
+
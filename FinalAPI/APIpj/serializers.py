@@ -1,9 +1,17 @@
+import functools
+import operator
 import random
 import string
-from typing import Any, Dict, List, Optional
-from django.db import IntegrityError, transaction
+from typing import Any, Dict, List, Optional, Tuple
+from django.db import transaction
+from django.db.models import Prefetch
 from rest_framework import serializers
-from .models import User, Coords, Level, Image, ActivityType, PerevalAdded, PerevalImage
+from .models import User, Coords, Level, Image, ActivityType, PerevalAdded, PerevalArchive, PerevalImage
+from .uploads import attach_images, delete_stored, store_images
+from .refdata import refdata
+from .contacts import canonical_email, canonical_phone, email_lookup, phone_lookup
+from . import audit
+from .exceptions import Conflict
 
 
 class ActivityTypeSerializer(serializers.ModelSerializer):
@@ -12,15 +20,46 @@ class ActivityTypeSerializer(serializers.ModelSerializer):
         fields = ("title",)
 
 
+class CachedActivityTypeSerializer(ActivityTypeSerializer):
+    """Вывод вида активности из кэша справочников, без JOIN и без запроса на каждую запись."""
+
+    def get_attribute(self, instance: PerevalAdded) -> Optional[int]:
+        return instance.activity_type_id
+
+    def to_representation(self, pk: int) -> Dict[str, Any]:
+        return {"title": refdata.activity_title(pk)}
+
+
+class CachedActivityTypeField(serializers.PrimaryKeyRelatedField):
+    """Проверка activity_type по кэшу справочников вместо запроса ActivityType.objects.get()."""
+
+    def to_internal_value(self, data: Any) -> ActivityType:
+        if isinstance(data, bool):
+            self.fail("incorrect_type", data_type=type(data).__name__)
+        try:
+            pk = int(data)
+        except (TypeError, ValueError):
+            self.fail("incorrect_type", data_type=type(data).__name__)
+        instance = refdata.activity_type(pk)
+        if instance is None:
+            self.fail("does_not_exist", pk_value=data)
+        return instance
+
+
 class UserCreateSerializer(serializers.ModelSerializer):
     email = serializers.EmailField()
-    phone = serializers.CharField()
+    phone = serializers.CharField(max_length=32)
 
     class Meta:
         model = User
         fields = ("email", "first_name", "last_name", "patronymic", "phone")
         extra_kwargs = {"first_name": {"required": True}, "last_name": {"required": True}}
 
+    def validate_phone(self, value: str) -> str:
+        if canonical_phone(value) is None:
+            raise serializers.ValidationError("Введите номер телефона: от 1 до 15 цифр.", code="invalid_phone")
+        return value
+
 
 class UserOutputSerializer(serializers.ModelSerializer):
     class Meta:
@@ -32,6 +71,8 @@ class CoordsSerializer(serializers.ModelSerializer):
     class Meta:
         model = Coords
         fields = ("latitude", "longitude", "height")
+        # высота над уровнем моря, м: от впадин суши до вершин с запасом
+        extra_kwargs = {"height": {"min_value": -500, "max_value": 9000}}
 
 
 class LevelSerializer(serializers.ModelSerializer):
@@ -60,7 +101,7 @@ class PerevalCreateSerializer(serializers.ModelSerializer):
     user = UserCreateSerializer()
     coords = CoordsSerializer()
     level = LevelSerializer()
-    activity_type = serializers.PrimaryKeyRelatedField(queryset=ActivityType.objects.all())
+    activity_type = CachedActivityTypeField(queryset=ActivityType.objects.all())
     images = ImageSerializer(many=True, required=False)
 
     class Meta:
@@ -77,7 +118,6 @@ class PerevalCreateSerializer(serializers.ModelSerializer):
             "images",
         )
 
-    @transaction.atomic
     def create(self, validated_data: Dict[str, Any]) -> PerevalAdded:
         # Берём вложенные части payload и удаляем их из validated_data,чтобы не передавать лишние поля в конструктор PerevalAdded
         user_data: Dict[str, Any] = validated_data.pop("user")
@@ -87,85 +127,112 @@ class PerevalCreateSerializer(serializers.ModelSerializer):
 
         # извлекаем картинку если существует, прежде чем пробрасывать validated_data в модель PerevalAdded
         images_data: Optional[List[Dict[str, Any]]] = validated_data.pop("images", None)
- 
+
+        # пользователь создаётся отдельным коротким INSERT ... ON CONFLICT, вне основной транзакции
+        user = self.get_or_create_user(user_data)
+
+        # файлы пишем в storage до транзакции, чтобы не держать соединение и блокировки во время записи на диск
+        stored = store_images(images_data)
+        try:
+            with transaction.atomic():
+                coords = Coords.objects.create(**coords_data)
+                level = Level.objects.create(**level_data)
+
+                # создаём запись PerevalAdded без картинки
+                pereval = PerevalAdded.objects.create(
+                    user=user,
+                    coords=coords,
+                    level=level,
+                    activity_type=activity,
+                    **validated_data,
+                )
+                # теперь создаём связанные изображения (если были)
+                attach_images(pereval, stored)
+        except Exception:
+            delete_stored(stored)
+            raise
+        return pereval
+
+    @staticmethod
+    def get_or_create_user(user_data: Dict[str, Any]) -> User:
         # ПОлучаем email/phone для поиска существующего пользователя или создания нового
         email = (user_data or {}).get("email")
         phone = (user_data or {}).get("phone")
+        email_key, phone_key = canonical_email(email), canonical_phone(phone)
 
         # миинимальная валидация
-        if not email and not phone:
+        if not email_key and not phone_key:
             raise serializers.ValidationError({"user": "Email или номер телефона уже зарегистрированы."})
 
-        # поиск пользователя по email и по телефону
-        user_by_email = User.objects.filter(email=email).first() if email else None
-        user_by_phone = User.objects.filter(phone=phone).first() if phone else None
-
-        if user_by_email and user_by_phone and user_by_email.id != user_by_phone.id:
-            raise serializers.ValidationError(
-                {"user": "Email и номер телефона уже зарегистрированы."}
+        # поиск по каноническим email и телефону одним запросом по уникальным индексам:
+        # регистр email и оформление номера (+7 (900) ..., 8900...) не плодят новых пользователей
+        lookups = [q for q in (email_lookup(email), phone_lookup(phone)) if q is not None]
+        lookup = functools.reduce(operator.or_, lookups)
+
+        keys = [
+            (field, value.strip(), key)
+            for field, value, key in (("email", email, email_key), ("phone", phone, phone_key)) if key
+        ]
+
+        def matches(user: User) -> Tuple[int, int]:
+            # сколько контактов указывают на пользователя и сколько из них совпали точно, а не только канонически
+            matched = exact = 0
+            for field, value, key in keys:
+                if getattr(user, field) == value:
+                    matched, exact = matched + 1, exact + 1
+                elif getattr(user, f"{field}_canonical") == key:
+                    matched += 1
+            return matched, exact
+
+        def find() -> Optional[User]:
+            scored = [(matches(user), user) for user in User.objects.filter(lookup)[:4]]
+            if not scored:
+                return None
+            best = max(score for score, _ in scored)
+            # email и телефон разных пользователей — конфликт. Если же все контакты указывают на нескольких
+            # (дубликаты одного человека до нормализации), выбираем совпавшего точно
+            found = [user for (matched, exact), user in scored
+                     if matched == best[0] and (exact == best[1] or matched < len(keys))]
+            if len(found) > 1:
+                raise serializers.ValidationError(
+                    {"user": "Email и номер телефона уже зарегистрированы."}
+                )
+            return found[0]
+
+        # Если найден — используем его
+        user = find()
+        if user is not None:
+            return user
+
+        base = (email.split("@", 1)[0] if email else "user").strip() or "user"
+        candidate = "".join(ch for ch in base if ch.isalnum() or ch in ("-", "_")).lower()[:150]
+        if not candidate:
+            candidate = "user"
+
+        username = candidate
+        defaults = {k: v for k, v in user_data.items() if k not in ("email", "phone")}
+        for _ in range(3):
+            # INSERT ... ON CONFLICT DO NOTHING: параллельный запрос с тем же email/phone не даёт IntegrityError,
+            # а созданного им пользователя находим следующим запросом
+            User.objects.bulk_create(
+                [User(email=email, phone=phone, email_canonical=email_key, phone_canonical=phone_key,
+                      **{**defaults, "username": username})],
+                ignore_conflicts=True,
             )
+            user = find()
+            if user is not None:
+                return user
+            # конфликт только по username — для нового пользователя добавляем случайный суффикс
+            suffix = "".join(random.choices(string.ascii_lowercase + string.digits, k=6))
+            username = f"{candidate[:143]}_{suffix}"
+        raise Conflict(f"Не удалось создать пользователя {email or phone}")
 
-        # Если найден хотя бы один — используем его
-        user = user_by_email or user_by_phone
-
-        if user is None:
-            base = (email.split("@", 1)[0] if email else "user").strip() or "user"
-            candidate = "".join(ch for ch in base if ch.isalnum() or ch in ("-", "_")).lower()[:150]
-            if not candidate:
-                candidate = "user"
-
-            attempt = 0
-            # получаем уникальное имя пользователя
-            username = candidate
-            while User.objects.filter(username=username).exists() and attempt < 5:
-                attempt += 1
-                username = f"{candidate[:140]}{attempt}"
-            # если полдьзователь существует, то для нового добавляем случайный символ для регистрации
-            if User.objects.filter(username=username).exists():
-                suffix = "".join(random.choices(string.ascii_lowercase + string.digits, k=6))
-                username = f"{candidate[:143]}_{suffix}"
-
-            defaults = {k: v for k, v in user_data.items() if k not in ("email", "phone")}
-            defaults["username"] = username
-            
-            #проверка наличия аналогичных данных в БД. Если нет - создается user, иначе подставляется имебщейся
-            try:
-                user = User.objects.create(email=email, phone=phone, **defaults)
-            except IntegrityError:
-                user = None
-                if email:
-                    user = User.objects.filter(email=email).first()
-                if user is None and phone:
-                    user = User.objects.filter(phone=phone).first()
-                if user is None:
-                    raise
-
-        coords = Coords.objects.create(**coords_data)
-        level = Level.objects.create(**level_data)
-
-        # создаём запись PerevalAdded без картинки
-        pereval = PerevalAdded.objects.create(
-            user=user,
-            coords=coords,
-            level=level,
-            activity_type=activity,
-            **validated_data,
-        )
 
-        # теперь создаём связанные изображения (если были)
-        if images_data:
-            for img in images_data:
-                file_obj = img.get("data")
-                title = img.get("title") or getattr(file_obj, "name", "")
-                image_obj = Image.objects.create(data=file_obj, title=title)
-                PerevalImage.objects.create(pereval=pereval, image=image_obj)
-        return pereval
-    
 class PerevalDetailSerializer(serializers.ModelSerializer):
     user = UserOutputSerializer()
     coords = CoordsSerializer()
     level = LevelSerializer()
-    activity_type = ActivityTypeSerializer()
+    activity_type = CachedActivityTypeSerializer()
     # используем SerializerMethodField, потому что в модели изображения связаны через PerevalImage
     images = serializers.SerializerMethodField()
 
@@ -187,14 +254,43 @@ class PerevalDetailSerializer(serializers.ModelSerializer):
         )
         read_only_fields = ("id", "add_time", "status")
 
+    @staticmethod
+    def eager(queryset):
+        """Связанные объекты для списка одним JOIN и одним запросом на изображения всех перевалов."""
+        images = PerevalImage.objects.select_related("image").order_by("id")
+        return queryset.select_related("user", "coords", "level").prefetch_related(
+            Prefetch("perevalimage_set", queryset=images, to_attr="prefetched_images")
+        )
+
     def get_images(self, obj: PerevalAdded) -> List[Dict[str, Any]]:
-        qs = PerevalImage.objects.filter(pereval=obj).select_related("image").order_by("id")
+        qs = getattr(obj, "prefetched_images", None)
+        if qs is None:
+            qs = PerevalImage.objects.filter(pereval=obj).select_related("image").order_by("id")
         return [ImageSerializer(pi.image, context=self.context).data for pi in qs]
     
+class PerevalArchiveSerializer(serializers.ModelSerializer):
+    """Архивный перевал в том же формате, что и PerevalDetailSerializer."""
+    user = UserOutputSerializer()
+    # координаты и уровень сложности лежат в самой строке архива
+    coords = CoordsSerializer(source="*")
+    level = LevelSerializer(source="*")
+    activity_type = CachedActivityTypeSerializer()
+    images = ImageSerializer(many=True)
+
+    class Meta:
+        model = PerevalArchive
+        fields = PerevalDetailSerializer.Meta.fields
+        read_only_fields = fields
+
+    @staticmethod
+    def eager(queryset):
+        return queryset.select_related("user").prefetch_related("images")
+
+
 class PerevalUpdateSerializer(serializers.ModelSerializer):
     coords = CoordsSerializer(required=False)
     level = LevelSerializer(required=False)
-    activity_type = serializers.PrimaryKeyRelatedField(queryset=ActivityType.objects.all(), required=False)
+    activity_type = CachedActivityTypeField(queryset=ActivityType.objects.all(), required=False)
     images = ImageSerializer(many=True, required=False)
 
     class Meta:
@@ -210,8 +306,20 @@ class PerevalUpdateSerializer(serializers.ModelSerializer):
             "images",
         )
 
-    @transaction.atomic
     def update(self, instance, validated_data):
+        images_data = validated_data.pop("images", None)
+        stored = store_images(images_data)
+        try:
+            with transaction.atomic():
+                before = audit.capture(instance, images=images_data is not None)
+                instance = self._update(instance, validated_data, images_data is not None, stored)
+                audit.record(instance, before)
+                return instance
+        except Exception:
+            delete_stored(stored)
+            raise
+
+    def _update(self, instance, validated_data, replace_images: bool, stored):
         coords_data = validated_data.pop("coords", None)
         if coords_data:
             coords_ser = CoordsSerializer(instance.coords, data=coords_data, partial=True)
@@ -224,17 +332,79 @@ class PerevalUpdateSerializer(serializers.ModelSerializer):
             level_ser.is_valid(raise_exception=True)
             level_ser.save()
 
-        images_data = validated_data.pop("images", None)
-        if images_data is not None:
+        if replace_images:
             PerevalImage.objects.filter(pereval=instance).delete()
-            for img in images_data:
-                file_obj = img.get("data")
-                title = img.get("title") or getattr(file_obj, "name", "")
-                image_obj = Image.objects.create(data=file_obj, title=title)
-                PerevalImage.objects.create(pereval=instance, image=image_obj)
+            attach_images(instance, stored)
 
         for attr, value in validated_data.items():
             setattr(instance, attr, value)
 
         instance.save()
-        return instance
\ No newline at end of file
+        return instance
+
+# Ответы APIView, которые собираются во view без сериализатора. Классы описывают формат ответа
+# для OpenAPI-схемы (drf-spectacular берёт serializer_class view) и в обработке запроса не участвуют.
+
+class PerevalChangesResponseSerializer(serializers.Serializer):
+    cursor = serializers.IntegerField(help_text="id последнего изменения в ответе — курсор следующего запроса")
+    has_more = serializers.BooleanField()
+    # рабочие и перенесённые в архив перевалы в одном формате
+    results = PerevalDetailSerializer(many=True)
+    deleted = serializers.ListField(child=serializers.IntegerField(), help_text="id удалённых перевалов")
+
+
+class PassSummaryEntrySerializer(serializers.Serializer):
+    id = serializers.IntegerField()
+    title = serializers.CharField()
+    status = serializers.ChoiceField(choices=PerevalAdded.StatusChoices.choices)
+    add_time = serializers.DateTimeField()
+
+
+class PassSummaryResponseSerializer(serializers.Serializer):
+    counts = serializers.DictField(child=serializers.IntegerField(), help_text="Число перевалов по статусам")
+    total = serializers.IntegerField()
+    last_submitted_at = serializers.DateTimeField(allow_null=True)
+    recent = PassSummaryEntrySerializer(many=True)
+
+
+class MapClusterSerializer(serializers.Serializer):
+    count = serializers.IntegerField()
+    lat = serializers.FloatField(help_text="Центр кластера")
+    lon = serializers.FloatField()
+    statuses = serializers.DictField(child=serializers.IntegerField(), help_text="Число перевалов по статусам")
+
+
+class MapTileResponseSerializer(serializers.Serializer):
+    z = serializers.IntegerField()
+    x = serializers.IntegerField()
+    y = serializers.IntegerField()
+    clusters = MapClusterSerializer(many=True)
+
+
+class HeightBucketSerializer(serializers.Serializer):
+    # from — ключевое слово Python, поле с таким именем добавляем в get_fields
+    to = serializers.IntegerField()
+    count = serializers.IntegerField()
+
+    def get_fields(self):
+        return {"from": serializers.IntegerField(), **super().get_fields()}
+
+
+class HeightPassSerializer(serializers.Serializer):
+    id = serializers.IntegerField()
+    title = serializers.CharField()
+    status = serializers.ChoiceField(choices=PerevalAdded.StatusChoices.choices)
+    height = serializers.IntegerField()
+    category = serializers.CharField(allow_null=True)
+
+
+class HeightBandsResponseSerializer(serializers.Serializer):
+    season = serializers.CharField()
+    category = serializers.CharField(allow_null=True)
+    count = serializers.IntegerField()
+    histogram = HeightBucketSerializer(many=True)
+    results = HeightPassSerializer(many=True)
+
+
+class MetricsResponseSerializer(serializers.Serializer):
+    """Счётчики процесса {имя: значение}; набор имён зависит от включённых подсистем."""
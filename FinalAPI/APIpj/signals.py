@@ -0,0 +1,15 @@
+from typing import NamedTuple, Optional
+
+from django.dispatch import Signal
+
+
+class StatusChange(NamedTuple):
+    pereval_id: int
+    user_id: int
+    old_status: Optional[str]
+    new_status: str
+
+
+# Отправляется после смены статуса перевалов (через save() или PerevalAdded.objects.set_status()).
+# Аргументы: changes — список StatusChange.
+pereval_status_changed = Signal()
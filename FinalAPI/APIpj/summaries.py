@@ -0,0 +1,137 @@
+"""
+Сводки по перевалам пользователей (UserPassSummary) для GET /api/submitData/summary/.
+
+Сводка обновляется в той же транзакции, что и сам перевал: при создании (post_save),
+удалении (post_delete; перенос в архив сводку не меняет) и при смене статуса
+(pereval_status_changed, в том числе массовой из админки).
+Строка сводки блокируется SELECT ... FOR UPDATE, поэтому параллельные отправки одного
+пользователя не теряют счётчики. Полный пересчёт — `python manage.py rebuild_user_summaries`.
+"""
+from collections import defaultdict
+from typing import Any, Dict, Iterable, List, Optional
+
+from django.conf import settings
+from django.db import transaction
+from django.db.models import Count, Max
+from django.utils import timezone
+
+from .models import PerevalAdded, PerevalArchive, UserPassSummary
+from .signals import StatusChange
+
+STATUSES = tuple(PerevalAdded.StatusChoices.values)
+
+
+def recent_size() -> int:
+    return getattr(settings, "USER_SUMMARY_RECENT", 10)
+
+
+def compact(pereval) -> Dict[str, Any]:
+    return {
+        "id": pereval.id,
+        "title": pereval.title,
+        "status": pereval.status,
+        "add_time": timezone.localtime(pereval.add_time).isoformat(),
+    }
+
+
+def _locked(user_ids: Iterable[int]) -> Dict[int, UserPassSummary]:
+    user_ids = list(user_ids)
+    UserPassSummary.objects.bulk_create([UserPassSummary(user_id=pk) for pk in user_ids], ignore_conflicts=True)
+    return {s.user_id: s for s in UserPassSummary.objects.select_for_update().filter(user_id__in=user_ids)}
+
+
+@transaction.atomic
+def record_created(pereval) -> None:
+    summary = _locked([pereval.user_id])[pereval.user_id]
+    setattr(summary, pereval.status, getattr(summary, pereval.status) + 1)
+    if summary.last_submitted_at is None or pereval.add_time > summary.last_submitted_at:
+        summary.last_submitted_at = pereval.add_time
+    summary.recent = [compact(pereval)] + [e for e in summary.recent if e["id"] != pereval.id]
+    summary.recent = summary.recent[: recent_size()]
+    summary.save()
+
+
+@transaction.atomic
+def record_updated(pereval) -> None:
+    """Название перевала могло измениться — обновляем запись в списке последних, если она там есть."""
+    summary = _locked([pereval.user_id])[pereval.user_id]
+    entry = compact(pereval)
+    recent = [entry if e["id"] == pereval.id else e for e in summary.recent]
+    if recent != summary.recent:
+        summary.recent = recent
+        summary.save(update_fields=["recent"])
+
+
+@transaction.atomic
+def record_deleted(pereval) -> None:
+    summary = _locked([pereval.user_id])[pereval.user_id]
+    if pereval.status in STATUSES:
+        setattr(summary, pereval.status, max(0, getattr(summary, pereval.status) - 1))
+    if any(e["id"] == pereval.id for e in summary.recent) or summary.last_submitted_at == pereval.add_time:
+        # дочитываем список последних и дату последней отправки из рабочей и архивной таблиц
+        n = recent_size()
+        latest, last_submitted = [], []
+        for model in (PerevalAdded, PerevalArchive):
+            qs = model.objects.filter(user_id=pereval.user_id).exclude(id=pereval.id)
+            latest += qs.only("id", "title", "status", "add_time").order_by("-id")[:n]
+            last_submitted.append(qs.aggregate(last=Max("add_time"))["last"])
+        summary.recent = [compact(p) for p in sorted(latest, key=lambda p: p.id, reverse=True)[:n]]
+        summary.last_submitted_at = max((t for t in last_submitted if t is not None), default=None)
+    summary.save()
+
+
+@transaction.atomic
+def record_status_changes(changes: List[StatusChange]) -> None:
+    by_user: Dict[int, List[StatusChange]] = defaultdict(list)
+    for change in changes:
+        by_user[change.user_id].append(change)
+    summaries = _locked(by_user)
+    for user_id, user_changes in by_user.items():
+        summary = summaries[user_id]
+        statuses = {}
+        for change in user_changes:
+            if change.old_status in STATUSES:
+                setattr(summary, change.old_status, max(0, getattr(summary, change.old_status) - 1))
+            setattr(summary, change.new_status, getattr(summary, change.new_status) + 1)
+            statuses[change.pereval_id] = change.new_status
+        summary.recent = [dict(e, status=statuses.get(e["id"], e["status"])) for e in summary.recent]
+    UserPassSummary.objects.bulk_update(summaries.values(), [*STATUSES, "recent"])
+
+
+def rebuild(user_ids: Optional[Iterable[int]] = None) -> int:
+    """Пересчитывает сводки по рабочей и архивной таблицам. Возвращает число сводок."""
+    n = recent_size()
+    summaries: Dict[int, UserPassSummary] = {}
+
+    def get(user_id: int) -> UserPassSummary:
+        if user_id not in summaries:
+            summaries[user_id] = UserPassSummary(user_id=user_id, recent=[])
+        return summaries[user_id]
+
+    for model in (PerevalAdded, PerevalArchive):
+        qs = model.objects.all()
+        if user_ids is not None:
+            qs = qs.filter(user_id__in=list(user_ids))
+        for user_id, status, count in qs.values_list("user_id", "status").annotate(n=Count("id")).order_by():
+            summary = get(user_id)
+            setattr(summary, status, getattr(summary, status) + count)
+        # последние перевалы: идём по убыванию id и берём первые n на пользователя из каждой таблицы
+        taken: Dict[int, int] = defaultdict(int)
+        for pereval in qs.only("id", "user_id", "title", "status", "add_time").order_by("-id").iterator(chunk_size=2000):
+            summary = get(pereval.user_id)
+            if summary.last_submitted_at is None or pereval.add_time > summary.last_submitted_at:
+                summary.last_submitted_at = pereval.add_time
+            if taken[pereval.user_id] < n:
+                taken[pereval.user_id] += 1
+                summary.recent.append(compact(pereval))
+
+    for summary in summaries.values():
+        summary.recent = sorted(summary.recent, key=lambda e: e["id"], reverse=True)[:n]
+
+    with transaction.atomic():
+        stale = UserPassSummary.objects.all()
+        if user_ids is not None:
+            stale = stale.filter(user_id__in=list(user_ids))
+        stale.delete()
+        UserPassSummary.objects.bulk_create(summaries.values(), batch_size=1000)
+    return len(summaries)
@@ -1,12 +1,87 @@
-from django.test import TestCase
+import asyncio
+import gzip
+import itertools
+import json
+import os
+import tempfile
+from unittest import skipIf
+
+from django.conf import settings
+from django.db import connection
+from django.test import TestCase, TransactionTestCase, override_settings
 from django.contrib.auth import get_user_model
-from rest_framework.test import APITestCase
+from rest_framework.test import APIClient, APITestCase
 from rest_framework import status
+from rest_framework.exceptions import ValidationError
 
 from .models import Coords, Level, ActivityType, PerevalAdded
 
 User = get_user_model()
 
+_seq = itertools.count(1)
+
+
+def make_user(**fields):
+    """Отправитель с уникальными username, email и телефоном, если они не заданы явно."""
+    n = next(_seq)
+    defaults = {"username": f"user{n}", "email": f"user{n}@mail.ru", "phone": f"+7{n:010d}"}
+    return User.objects.create(**{**defaults, **fields})
+
+
+def make_pereval(user, activity_type, *, lat=43.1, lon=42.2, height=3000, level=None, images=0, **fields):
+    """Перевал с координатами, уровнем сложности (по умолчанию летняя 1А) и `images` фотографиями."""
+    from django.core.files.base import ContentFile
+    from .models import Image, PerevalImage
+
+    pereval = PerevalAdded.objects.create(
+        **{"beauty_title": "пер.", "title": "Перевал", **fields},
+        user=user, activity_type=activity_type,
+        coords=Coords.objects.create(latitude=lat, longitude=lon, height=height),
+        level=Level.objects.create(**(level or {"summer": "1А"})),
+    )
+    for i in range(images):
+        image = Image.objects.create(data=ContentFile(_jpeg_with_exif(lat, lon), name="photo.jpg"), title=f"фото {i}")
+        PerevalImage.objects.create(pereval=pereval, image=image)
+    return pereval
+
+
+class PassFixtures:
+    """
+    Общие данные класса тестов: вид активности, пользователь и PASSES его перевалов
+    по IMAGES фото у каждого. Создаются один раз на класс в setUpTestData, каждый тест
+    работает внутри своей транзакции и видит их нетронутыми.
+    """
+    PASSES = 3
+    IMAGES = 0
+
+    @classmethod
+    def setUpTestData(cls):
+        super().setUpTestData()
+        cls.hiking = ActivityType.objects.create(title="Хайкинг")
+        cls.user = make_user()
+        cls.perevals = [
+            make_pereval(cls.user, cls.hiking, title=f"Перевал {i}", images=cls.IMAGES) for i in range(cls.PASSES)
+        ]
+
+    def setUp(self):
+        from .refdata import warm_up
+
+        super().setUp()
+        # первый запрос процесса загружает справочники (refdata.warm_up); загружаем заранее,
+        # чтобы число запросов в тестах не зависело от порядка тестов и их распределения по процессам
+        warm_up()
+
+
+def media_on_disk(test) -> str:
+    """Файлы изображений на диске во временном каталоге вместо InMemoryStorage тестового профиля."""
+    tmp = tempfile.TemporaryDirectory()
+    test.addCleanup(tmp.cleanup)
+    storages = dict(settings.STORAGES, default={"BACKEND": "django.core.files.storage.FileSystemStorage"})
+    media = test.settings(MEDIA_ROOT=tmp.name, STORAGES=storages)
+    media.enable()
+    test.addCleanup(media.disable)
+    return tmp.name
+
 
 class TestDatabaseModel(TestCase):
     def test_create_pereval(self):
@@ -43,11 +118,12 @@ class TestDatabaseModel(TestCase):
 
 
 class TestSubmitDataAPI(APITestCase):
-    def setUp(self):
-        self.hiking = ActivityType.objects.create(title="Спортивная ходьба")
-        self.list_url = "/api/submitData/"
+    list_url = "/api/submitData/"
 
-        self.user = User.objects.create_user(
+    @classmethod
+    def setUpTestData(cls):
+        cls.hiking = ActivityType.objects.create(title="Спортивная ходьба")
+        cls.user = User.objects.create_user(
             username="Alex",
             email="Alex@mail.ru",
             first_name="Алексей",
@@ -57,18 +133,17 @@ class TestSubmitDataAPI(APITestCase):
         )
         coords = Coords.objects.create(latitude=43.57, longitude=42.456, height=1000)
         level = Level.objects.create(winter="4Д", summer="3C", autumn="2Б", spring="1А")
-        self.p = PerevalAdded.objects.create(
+        cls.p = PerevalAdded.objects.create(
             beauty_title="Самый большой перевал",
             title="Перевалище",
             other_titles="Биг перевал",
             connect="Описание перевала...",
-            user=self.user,
+            user=cls.user,
             coords=coords,
             level=level,
-            activity_type=self.hiking,
+            activity_type=cls.hiking,
             status="new",
         )
-        self.detail_url = f"/api/submitData/{self.p.id}/"
 
     def test_post_then_get_detail(self):
         payload = {
@@ -111,4 +186,1523 @@ class TestSubmitDataAPI(APITestCase):
             items = resp_filtered.data
         self.assertIsInstance(items, list)
         self.assertTrue(all(item["user"]["email"] == self.user.email for item in items))
-        self.assertTrue(any(item["id"] == self.p.id for item in items))
\ No newline at end of file
+        self.assertTrue(any(item["id"] == self.p.id for item in items))
+
+class TestRenderingAndCompression(PassFixtures, APITestCase):
+    PASSES = 0
+
+    @classmethod
+    def setUpTestData(cls):
+        super().setUpTestData()
+        for i in range(20):
+            make_pereval(
+                cls.user, cls.hiking, height=3000 + i,
+                title=f"Перевал {i}", other_titles="Другое", connect="Описание " * 10,
+            )
+        cls.url = f"/api/submitData/?user__email={cls.user.email}"
+
+    def test_orjson_renderer_matches_stdlib(self):
+        from rest_framework.renderers import JSONRenderer
+        from .renderers import ORJSONRenderer
+
+        data = {"title": "Эльбрус", "height": 5642, "items": [1.5, None, True]}
+        self.assertEqual(json.loads(ORJSONRenderer().render(data)), json.loads(JSONRenderer().render(data)))
+
+    def test_large_response_is_gzipped(self):
+        resp = self.client.get(self.url, HTTP_ACCEPT_ENCODING="gzip")
+        self.assertEqual(resp.status_code, status.HTTP_200_OK)
+        self.assertEqual(resp["Content-Encoding"], "gzip")
+        self.assertIn("Accept-Encoding", resp["Vary"])
+        body = json.loads(gzip.decompress(resp.content))
+        self.assertEqual(body["count"], 20)
+
+    def test_no_compression_without_accept_encoding(self):
+        resp = self.client.get(self.url)
+        self.assertFalse(resp.has_header("Content-Encoding"))
+
+    def test_only_allowed_types_are_compressed(self):
+        from django.http import HttpResponse, StreamingHttpResponse
+        from django.test import RequestFactory
+        from .middleware import CompressionMiddleware
+
+        request = RequestFactory().get("/", HTTP_ACCEPT_ENCODING="gzip")
+        body = b"x" * 4096
+
+        def compress(response):
+            return CompressionMiddleware(lambda r: response)(request)
+
+        self.assertEqual(compress(HttpResponse(body, content_type="text/plain; charset=utf-8"))["Content-Encoding"], "gzip")
+        self.assertEqual(compress(HttpResponse(body, content_type="application/problem+json"))["Content-Encoding"], "gzip")
+        self.assertFalse(compress(HttpResponse(body, content_type="image/jpeg")).has_header("Content-Encoding"))
+        self.assertFalse(compress(HttpResponse(body, content_type="text/event-stream")).has_header("Content-Encoding"))
+        streaming = StreamingHttpResponse(iter([body]), content_type="text/event-stream")
+        self.assertFalse(compress(streaming).has_header("Content-Encoding"))
+        no_transform = HttpResponse(body, content_type="application/json")
+        no_transform["Cache-Control"] = "private, no-transform"
+        self.assertFalse(compress(no_transform).has_header("Content-Encoding"))
+
+
+class TestIdempotencyKey(APITestCase):
+    def setUp(self):
+        self.hiking = ActivityType.objects.create(title="Хайкинг")
+        self.url = "/api/submitData/"
+        self.payload = {
+            "beauty_title": "пер.",
+            "title": "Семинский",
+            "user": {"email": "Ivan@example.com", "first_name": "Иван", "last_name": "Туев", "phone": "+79998887700"},
+            "coords": {"latitude": 51, "longitude": 85, "height": 1717},
+            "level": {"winter": "2А", "summer": "1А"},
+            "activity_type": self.hiking.id,
+        }
+
+    def test_retry_returns_stored_response(self):
+        first = self.client.post(self.url, data=self.payload, format="json", HTTP_IDEMPOTENCY_KEY="abc-1")
+        self.assertEqual(first.status_code, status.HTTP_200_OK, first.data)
+
+        # порядок ключей JSON на отпечаток не влияет
+        reordered = dict(reversed(list(self.payload.items())))
+        retry = self.client.post(self.url, data=reordered, format="json", HTTP_IDEMPOTENCY_KEY="abc-1")
+        self.assertEqual(retry.status_code, status.HTTP_200_OK)
+        self.assertEqual(retry.json()["id"], first.data["id"])
+        self.assertEqual(PerevalAdded.objects.count(), 1)
+
+    def test_reused_key_with_other_body_returns_422(self):
+        first = self.client.post(self.url, data=self.payload, format="json", HTTP_IDEMPOTENCY_KEY="abc-3")
+        self.assertEqual(first.status_code, status.HTTP_200_OK, first.data)
+
+        other = dict(self.payload, title="Чике-Таман")
+        resp = self.client.post(self.url, data=other, format="json", HTTP_IDEMPOTENCY_KEY="abc-3")
+        self.assertEqual(resp.status_code, 422)
+        self.assertEqual(resp.json()["code"], "idempotency_key_reused")
+        self.assertEqual(PerevalAdded.objects.count(), 1)
+
+    def test_retry_with_other_image_returns_422(self):
+        from django.core.files.uploadedfile import SimpleUploadedFile
+
+        def photo(taken):
+            return SimpleUploadedFile("a.jpg", _jpeg_with_exif(taken=taken))
+
+        data = {"title": "Семинский", "beauty_title": "пер.", "activity_type": self.hiking.id,
+                "user.email": "ivan@example.com", "user.first_name": "Иван", "user.last_name": "Туев",
+                "user.phone": "+79998887700", "coords.latitude": "51", "coords.longitude": "85",
+                "coords.height": "1717", "level.summer": "1А"}
+        first = self.client.post(self.url, data={**data, "images": [photo("2024:07:01 10:30:00")]},
+                                 format="multipart", HTTP_IDEMPOTENCY_KEY="abc-4")
+        self.assertEqual(first.status_code, status.HTTP_200_OK, first.data)
+
+        same = self.client.post(self.url, data={**data, "images": [photo("2024:07:01 10:30:00")]},
+                                format="multipart", HTTP_IDEMPOTENCY_KEY="abc-4")
+        self.assertEqual(same.status_code, status.HTTP_200_OK)
+        self.assertEqual(same.json()["id"], first.data["id"])
+
+        other = self.client.post(self.url, data={**data, "images": [photo("2024:07:02 10:30:00")]},
+                                 format="multipart", HTTP_IDEMPOTENCY_KEY="abc-4")
+        self.assertEqual(other.status_code, 422)
+        self.assertEqual(PerevalAdded.objects.count(), 1)
+
+    def test_key_in_progress_returns_conflict(self):
+        from datetime import timedelta
+        from django.utils import timezone
+        from .models import IdempotencyKey
+
+        IdempotencyKey.objects.create(key="abc-2")
+        resp = self.client.post(self.url, data=self.payload, format="json", HTTP_IDEMPOTENCY_KEY="abc-2")
+        self.assertEqual(resp.status_code, status.HTTP_409_CONFLICT)
+        self.assertEqual(PerevalAdded.objects.count(), 0)
+
+        # долгая обработка (медленная загрузка фотографий) резерв не снимает
+        IdempotencyKey.objects.filter(key="abc-2").update(created_at=timezone.now() - timedelta(minutes=30))
+        resp = self.client.post(self.url, data=self.payload, format="json", HTTP_IDEMPOTENCY_KEY="abc-2")
+        self.assertEqual(resp.status_code, status.HTTP_409_CONFLICT)
+        self.assertEqual(PerevalAdded.objects.count(), 0)
+
+
+class TestThrottling(APITestCase):
+    rates = {
+        "BACKEND": "APIpj.throttling.LocalBucketBackend",
+        "RATES": {"ip": "2/min", "email": "1/min"},
+        "UPLOAD_CONCURRENCY": 1,
+        "UPLOAD_RETRY_AFTER": 7,
+    }
+
+    def test_ip_bucket_returns_429_with_retry_after(self):
+        with self.settings(API_THROTTLE=self.rates):
+            for _ in range(2):
+                self.assertEqual(self.client.get("/api/submitData/").status_code, status.HTTP_200_OK)
+            resp = self.client.get("/api/submitData/")
+        self.assertEqual(resp.status_code, status.HTTP_429_TOO_MANY_REQUESTS)
+        self.assertTrue(int(resp["Retry-After"]) > 0)
+
+    def test_submitter_email_bucket_on_post(self):
+        rates = dict(self.rates, RATES={"email": "1/min"})
+        payload = {"title": "x", "user": {"email": "Spam@mail.ru"}}
+        with self.settings(API_THROTTLE=rates):
+            self.assertEqual(self.client.post("/api/submitData/", payload, format="json").status_code, 400)
+            # тот же email в другом регистре попадает в ту же корзину
+            payload["user"]["email"] = "spam@mail.ru"
+            resp = self.client.post("/api/submitData/", payload, format="json")
+        self.assertEqual(resp.status_code, status.HTTP_429_TOO_MANY_REQUESTS)
+
+    def test_sqlite_backend_shares_buckets(self):
+        import os
+        import tempfile
+        from .throttling import SQLiteBucketBackend
+
+        with tempfile.TemporaryDirectory() as tmp:
+            path = os.path.join(tmp, "buckets.sqlite3")
+            first, second = SQLiteBucketBackend(path=path), SQLiteBucketBackend(path=path)
+            self.assertEqual(first.consume("ip:1", 1, 1 / 60), 0)
+            self.assertGreater(second.consume("ip:1", 1, 1 / 60), 0)
+
+    def test_ip_bucket_ignores_forwarded_for(self):
+        with self.settings(API_THROTTLE=self.rates):
+            statuses = [
+                self.client.get("/api/submitData/", HTTP_X_FORWARDED_FOR=f"10.0.0.{i}").status_code for i in range(3)
+            ]
+        self.assertEqual(statuses[-1], status.HTTP_429_TOO_MANY_REQUESTS)
+
+    def test_local_backend_evicts_refilled_and_least_recent_buckets(self):
+        from unittest import mock
+        from .throttling import LocalBucketBackend
+
+        backend = LocalBucketBackend(max_keys=2)
+        with mock.patch("APIpj.throttling.time.monotonic", return_value=100.0):
+            for key in ("a", "b", "c"):
+                backend.consume(key, 2, 1.0)
+        self.assertEqual(list(backend._buckets), ["b", "c"])
+        # через секунду корзины снова полные и удаляются при следующем обращении
+        with mock.patch("APIpj.throttling.time.monotonic", return_value=101.0):
+            self.assertEqual(backend.consume("d", 2, 1.0), 0)
+        self.assertEqual(list(backend._buckets), ["d"])
+
+    def test_upload_concurrency_limit_returns_503(self):
+        from .throttling import acquire_upload_slot, release_upload_slot
+        from . import metrics
+
+        with self.settings(API_THROTTLE=self.rates):
+            self.assertTrue(acquire_upload_slot())
+            try:
+                resp = self.client.post("/api/submitData/", {"title": "x"}, format="multipart")
+            finally:
+                release_upload_slot()
+        self.assertEqual(resp.status_code, status.HTTP_503_SERVICE_UNAVAILABLE)
+        self.assertEqual(resp["Retry-After"], "7")
+        self.assertGreaterEqual(metrics.snapshot()["uploads.rejected"], 1)
+        self.assertIn("uploads.in_flight", metrics.snapshot())
+
+    def test_token_bucket_throttle_is_abstract(self):
+        from .throttling import TokenBucketThrottle
+
+        with self.assertRaises(TypeError):
+            TokenBucketThrottle()
+
+    def test_metrics_require_admin(self):
+        self.assertEqual(self.client.get("/api/metrics/").status_code, status.HTTP_401_UNAUTHORIZED)
+        with self.settings(API_METRICS_PUBLIC=True):
+            self.assertEqual(self.client.get("/api/metrics/").status_code, status.HTTP_200_OK)
+        self.client.force_authenticate(User.objects.create_superuser(username="admin", email="admin@mail.ru", password="1"))
+        self.assertIn("uploads.in_flight", self.client.get("/api/metrics/").json())
+
+
+class TestModerationAdmin(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.admin = User.objects.create_superuser(
+            username="admin", email="admin@mail.ru", password="1", phone="+70000000009",
+        )
+        hiking = ActivityType.objects.create(title="Хайкинг")
+        cls.perevals = [
+            PerevalAdded.objects.create(
+                beauty_title="пер.", title=f"Перевал {i}", user=cls.admin,
+                coords=Coords.objects.create(latitude=43.1, longitude=42.2, height=3000),
+                level=Level.objects.create(summer="1А"), activity_type=hiking,
+                status="accepted" if i == 0 else "new",
+            )
+            for i in range(5)
+        ]
+
+    def setUp(self):
+        self.client.force_login(self.admin)
+
+    def test_changelist_query_count_does_not_grow_with_rows(self):
+        url = "/admin/APIpj/perevaladded/"
+        with self.assertNumQueries(5):
+            resp = self.client.get(url)
+        self.assertEqual(resp.status_code, 200)
+        self.assertContains(resp, "Перевал 4")
+
+    def test_change_form_renders(self):
+        resp = self.client.get(f"/admin/APIpj/perevaladded/{self.perevals[1].id}/change/")
+        self.assertEqual(resp.status_code, 200)
+
+    def test_bulk_reject_skips_already_moderated(self):
+        ids = [p.id for p in self.perevals]
+        resp = self.client.post(
+            "/admin/APIpj/perevaladded/",
+            {"action": "make_rejected", "_selected_action": ids},
+        )
+        self.assertEqual(resp.status_code, 302)
+        statuses = dict(PerevalAdded.objects.values_list("id", "status"))
+        self.assertEqual(statuses[ids[0]], "accepted")
+        self.assertTrue(all(statuses[i] == "rejected" for i in ids[1:]))
+
+    def test_bulk_accept_skips_already_moderated(self):
+        PerevalAdded.objects.filter(id=self.perevals[1].id).set_status("rejected")
+        ids = [p.id for p in self.perevals]
+        self.client.post("/admin/APIpj/perevaladded/", {"action": "make_accepted", "_selected_action": ids})
+        statuses = dict(PerevalAdded.objects.values_list("id", "status"))
+        self.assertEqual(statuses[ids[1]], "rejected")
+        self.assertTrue(all(statuses[i] == "accepted" for i in ids[:1] + ids[2:]))
+
+    def test_thumbnails_are_generated_in_background(self):
+        from django.core.files.base import ContentFile
+        from django.core.files.storage import default_storage
+        from . import thumbnails
+        from .models import Image
+
+        image = Image.objects.create(data=ContentFile(_jpeg_with_exif(size=(400, 300)), name="big.jpg"), title="фото")
+        # превью ещё нет: страница отдаёт оригинал и не ждёт Pillow
+        self.assertEqual(thumbnails.thumbnail_url(image.data.name), default_storage.url(image.data.name))
+        self.assertEqual(thumbnails.schedule(image.data.name).result(timeout=10),
+                         default_storage.url(thumbnails.thumbnail_name(image.data.name)))
+        self.assertEqual(thumbnails.thumbnail_url(image.data.name),
+                         default_storage.url(thumbnails.thumbnail_name(image.data.name)))
+        self.assertEqual(thumbnails.thumbnail_url("missing.jpg"), "")
+
+
+class TestChangeFeed(PassFixtures, APITestCase):
+    def setUp(self):
+        super().setUp()
+        self.url = f"/api/submitData/changes/?user__email={self.user.email}"
+
+    def test_initial_sync_then_only_deltas(self):
+        first = self.client.get(self.url).json()
+        self.assertEqual([p["id"] for p in first["results"]], [p.id for p in self.perevals])
+
+        # после курсора ничего не менялось
+        idle = self.client.get(f"{self.url}&cursor={first['cursor']}").json()
+        self.assertEqual(idle["results"], [])
+        self.assertEqual(idle["cursor"], first["cursor"])
+
+        PerevalAdded.objects.filter(id=self.perevals[1].id).set_status("pending")
+        delta = self.client.get(f"{self.url}&cursor={first['cursor']}").json()
+        self.assertEqual([p["id"] for p in delta["results"]], [self.perevals[1].id])
+        self.assertEqual(delta["results"][0]["status"], "pending")
+
+    def test_save_with_new_status_is_logged_as_status_change(self):
+        from .models import PerevalChange
+
+        pereval = PerevalAdded.objects.get(id=self.perevals[0].id)
+        pereval.status = "accepted"
+        pereval.save()
+        last = PerevalChange.objects.filter(pereval=pereval).latest("id")
+        self.assertEqual((last.kind, last.status), ("status", "accepted"))
+
+    def test_limit_sets_has_more(self):
+        resp = self.client.get(f"{self.url}&limit=2").json()
+        self.assertTrue(resp["has_more"])
+        self.assertEqual(len(resp["results"]), 2)
+
+    def test_deleted_and_archived_passes_are_reported(self):
+        from .archive import archive_batch
+
+        cursor = self.client.get(self.url).json()["cursor"]
+        PerevalAdded.objects.filter(id=self.perevals[0].id).delete()
+        PerevalAdded.objects.filter(id=self.perevals[1].id).set_status("accepted")
+        archive_batch([self.perevals[1].id])
+
+        delta = self.client.get(f"{self.url}&cursor={cursor}").json()
+        self.assertEqual(delta["deleted"], [self.perevals[0].id])
+        self.assertEqual([(p["id"], p["status"]) for p in delta["results"]], [(self.perevals[1].id, "accepted")])
+
+    def test_deleting_user_leaves_no_tombstones(self):
+        from .models import PerevalChange
+
+        user = make_user()
+        make_pereval(user, self.hiking)
+        user.delete()
+        self.assertFalse(PerevalChange.objects.filter(user_id=user.id).exists())
+
+    def test_recent_changes_wait_for_safety_lag(self):
+        cursor = self.client.get(self.url).json()["cursor"]
+        PerevalAdded.objects.filter(id=self.perevals[2].id).set_status("pending")
+        with self.settings(API_CHANGES_SAFETY_LAG=60):
+            delta = self.client.get(f"{self.url}&cursor={cursor}").json()
+        self.assertEqual((delta["results"], delta["cursor"]), ([], cursor))
+
+
+class TestStatusEvents(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = User.objects.create_user(
+            username="Sse", email="sse@mail.ru", first_name="С", last_name="С", phone="+70000000012", password="1",
+        )
+        cls.url = f"/api/submitData/events/?user__email={cls.user.email}"
+
+    async def test_stream_delivers_status_event(self):
+        from .events import get_broker
+
+        resp = await self.async_client.get(self.url)
+        self.assertEqual(resp["Content-Type"], "text/event-stream")
+        chunks = aiter(resp.streaming_content)
+        self.assertIn(b"retry:", await anext(chunks))
+
+        get_broker().publish({"type": "status", "id": 7, "user_id": self.user.id,
+                              "old_status": "new", "status": "pending", "ts": "t"})
+        chunk = await asyncio.wait_for(anext(chunks), timeout=2)
+        self.assertTrue(chunk.startswith(b"event: status"))
+        self.assertEqual(json.loads(chunk.split(b"data: ")[1])["status"], "pending")
+
+    async def test_slow_subscriber_gets_resync(self):
+        from .events import RESYNC, Subscription
+
+        sub = Subscription(self.user.id, maxsize=2)
+        for i in range(3):
+            sub.push({"id": i})
+        self.assertEqual(sub.queue.qsize(), 1)
+        self.assertIs(await sub.queue.get(), RESYNC)
+
+    def test_postgres_listener_reconnects_and_resyncs(self):
+        from unittest import mock
+        from .events import RESYNC, PostgresNotifyBackend
+
+        class Stop(BaseException):
+            pass
+
+        backend = PostgresNotifyBackend(reconnect_delay=1, max_reconnect_delay=3)
+        dispatched = []
+        # соединение, обрыв, две неудачные попытки, снова соединение
+        connects = [mock.Mock(), OSError("down"), OSError("down"), mock.Mock()]
+        with (
+            mock.patch.object(backend, "_connect", side_effect=connects),
+            mock.patch.object(backend, "_serve", side_effect=[OSError("connection lost"), Stop()]),
+            mock.patch("APIpj.events.time.sleep") as sleep,
+            self.assertLogs("APIpj.events", "WARNING"),
+            self.assertRaises(Stop),
+        ):
+            backend._listen(dispatched.append)
+        self.assertEqual([c.args[0] for c in sleep.call_args_list], [1, 2, 3])
+        self.assertEqual(dispatched, [RESYNC])
+
+    async def test_resync_reaches_every_subscriber(self):
+        from .events import RESYNC, EventBroker, LocalBackend
+
+        broker = EventBroker(LocalBackend(), queue_size=10)
+        subs = [broker.subscribe(user_id) for user_id in (1, 2)]
+        broker.dispatch(RESYNC)
+        for sub in subs:
+            self.assertIs(await asyncio.wait_for(sub.queue.get(), timeout=2), RESYNC)
+
+    def test_status_change_is_published_on_commit(self):
+        from unittest import mock
+
+        hiking = ActivityType.objects.create(title="Хайкинг")
+        pereval = PerevalAdded.objects.create(
+            beauty_title="пер.", title="Перевал", user=self.user,
+            coords=Coords.objects.create(latitude=43.1, longitude=42.2, height=3000),
+            level=Level.objects.create(summer="1А"), activity_type=hiking,
+        )
+        with mock.patch("APIpj.events.EventBroker.publish") as publish:
+            with self.captureOnCommitCallbacks(execute=True):
+                PerevalAdded.objects.filter(id=pereval.id).set_status("accepted")
+        event = publish.call_args.args[0]
+        self.assertEqual((event["id"], event["old_status"], event["status"]), (pereval.id, "new", "accepted"))
+
+    def test_publish_failure_does_not_fail_request(self):
+        from unittest import mock
+        from . import metrics
+
+        pereval = make_pereval(self.user, ActivityType.objects.create(title="Хайкинг"))
+        with mock.patch("APIpj.events.EventBroker.publish", side_effect=RuntimeError("pg_notify")):
+            with self.assertLogs("APIpj.receivers", "ERROR"), self.captureOnCommitCallbacks(execute=True):
+                PerevalAdded.objects.filter(id=pereval.id).set_status("pending")
+        self.assertEqual(PerevalAdded.objects.get(id=pereval.id).status, "pending")
+        self.assertEqual(metrics.snapshot()["events.publish_failed"], 1)
+
+    def test_notify_uses_configured_database(self):
+        from unittest import mock
+        from .events import PostgresNotifyBackend
+
+        with mock.patch("APIpj.events.connections") as connections:
+            PostgresNotifyBackend(database="events").publish({"type": "status"})
+        connections.__getitem__.assert_called_once_with("events")
+
+    def test_wsgi_request_is_rejected(self):
+        self.assertEqual(self.client.get(self.url).status_code, 501)
+
+
+@override_settings(DUPLICATE_DETECTOR=dict(settings.DUPLICATE_DETECTOR, REFRESH_INTERVAL=0))
+class TestDuplicateDetector(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = User.objects.create_superuser(
+            username="Dup", email="dup@mail.ru", password="1", phone="+70000000013",
+        )
+        hiking = ActivityType.objects.create(title="Хайкинг")
+
+        def make(title, lat, lon):
+            return PerevalAdded.objects.create(
+                beauty_title="пер.", title=title, user=cls.user,
+                coords=Coords.objects.create(latitude=lat, longitude=lon, height=3000),
+                level=Level.objects.create(summer="1А"), activity_type=hiking,
+            )
+
+        cls.original = make("Семинский", 51.04, 85.60)
+        cls.duplicate = make("пер. Семинский", 51.05, 85.61)
+        cls.far = make("Семинский", 45.00, 80.00)
+        cls.other = make("Чике-Таман", 51.03, 85.59)
+
+    def test_finds_near_pass_with_similar_title(self):
+        from .duplicates import DuplicateDetector
+
+        detector = DuplicateDetector()
+        detector.refresh(force=True)
+        found = detector.check(51.04, 85.60, "Семинский", exclude_id=self.original.id)
+        self.assertEqual([d.id for d in found], [self.duplicate.id])
+        self.assertLess(found[0].distance_km, 3)
+
+    def test_incremental_refresh_picks_up_moved_pass(self):
+        from .duplicates import DuplicateDetector
+
+        detector = DuplicateDetector()
+        detector.refresh(force=True)
+        Coords.objects.filter(id=self.far.coords_id).update(latitude=51.041, longitude=85.601)
+        PerevalAdded.objects.get(id=self.far.id).save()
+        detector.refresh()
+        found = detector.check(51.04, 85.60, "Семинский", exclude_id=self.original.id)
+        self.assertIn(self.far.id, [d.id for d in found])
+
+    def test_incremental_refresh_picks_up_late_commit(self):
+        from datetime import timedelta
+        from django.utils import timezone
+        from .duplicates import DuplicateDetector
+
+        detector = DuplicateDetector()
+        detector.refresh(force=True)
+        # правка получила updated_at до прошлой синхронизации, но зафиксирована после неё
+        Coords.objects.filter(id=self.far.coords_id).update(latitude=51.041, longitude=85.601)
+        PerevalAdded.objects.filter(id=self.far.id).update(updated_at=timezone.now() - timedelta(seconds=10))
+        detector.refresh()
+        found = detector.check(51.04, 85.60, "Семинский", exclude_id=self.original.id)
+        self.assertIn(self.far.id, [d.id for d in found])
+
+    def test_incremental_refresh_drops_deleted_pass(self):
+        from .duplicates import DuplicateDetector
+
+        detector = DuplicateDetector()
+        detector.refresh(force=True)
+        # удаление в другом процессе: индекс узнаёт о нём из журнала изменений
+        PerevalAdded.objects.get(id=self.duplicate.id).delete()
+        detector.refresh()
+        self.assertNotIn(self.duplicate.id, detector._ids)
+
+    def test_concurrent_refresh_is_skipped(self):
+        from unittest import mock
+        from .duplicates import DuplicateDetector
+
+        detector = DuplicateDetector()
+        detector.refresh(force=True)
+        with detector._refresh_lock, mock.patch.object(detector, "_refresh") as scan:
+            detector.refresh()
+        scan.assert_not_called()
+
+    def test_new_submission_is_flagged_in_changelist(self):
+        from . import duplicates
+        from .models import PossibleDuplicate
+
+        duplicates._detector = None
+        self.addCleanup(setattr, duplicates, "_detector", None)
+        with self.captureOnCommitCallbacks(execute=True):
+            new = PerevalAdded.objects.create(
+                beauty_title="пер.", title="Семинский перевал", user=self.user,
+                coords=Coords.objects.create(latitude=51.041, longitude=85.601, height=3000),
+                level=Level.objects.create(summer="1А"), activity_type=self.original.activity_type,
+            )
+        self.assertEqual(
+            set(PossibleDuplicate.objects.filter(pereval=new).values_list("duplicate_id", flat=True)),
+            {self.original.id, self.duplicate.id},
+        )
+        self.client.force_login(self.user)
+        resp = self.client.get("/admin/APIpj/perevaladded/", {"duplicates": "yes"})
+        self.assertEqual([p.id for p in resp.context["cl"].result_list], [new.id])
+
+    def test_admin_shows_possible_duplicates(self):
+        self.client.force_login(self.user)
+        resp = self.client.get(f"/admin/APIpj/perevaladded/{self.original.id}/change/")
+        self.assertContains(resp, f"#{self.duplicate.id}</a>")
+
+
+class TestReferenceDataCache(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.hiking = ActivityType.objects.create(title="Хайкинг")
+
+    def test_activity_type_validation_uses_cache(self):
+        from .refdata import refdata
+        from .serializers import CachedActivityTypeField
+
+        refdata.load()
+        field = CachedActivityTypeField(queryset=ActivityType.objects.all())
+        with self.assertNumQueries(0):
+            self.assertEqual(field.to_internal_value(self.hiking.id).title, "Хайкинг")
+
+        with self.assertRaises(ValidationError):
+            field.to_internal_value(10**9)
+
+    def test_save_reloads_current_process(self):
+        from .refdata import refdata
+
+        refdata.load()
+        ActivityType.objects.filter(id=self.hiking.id).update(title="Пеший")
+        self.assertEqual(refdata.activity_title(self.hiking.id), "Хайкинг")
+        ActivityType.objects.get(id=self.hiking.id).save()
+        self.assertEqual(refdata.activity_title(self.hiking.id), "Пеший")
+
+    def test_other_worker_changes_seen_after_interval(self):
+        from .refdata import refdata
+
+        refdata.load()
+        # правка в другом воркере: сигналы этого процесса не срабатывают, общего кэша нет
+        ActivityType.objects.filter(id=self.hiking.id).update(title="Пеший")
+        with self.settings(REFERENCE_CACHE_CHECK_INTERVAL=0):
+            self.assertEqual(refdata.activity_title(self.hiking.id), "Пеший")
+            ActivityType.objects.filter(id=self.hiking.id)._raw_delete(ActivityType.objects.db)
+            self.assertIsNone(refdata.activity_type(self.hiking.id))
+
+
+class TestStartupBenchmark(TestCase):
+    def test_parse_importtime_counts_outermost_import(self):
+        from .benchmarks import parse_importtime
+
+        stderr = "\n".join([
+            "import time: self [us] | cumulative | imported package",
+            "import time:       100 |        100 |     numpy.core",
+            "import time:       500 |        600 |   numpy",
+            "import time:        50 |        650 | APIpj.duplicates",
+        ])
+        self.assertEqual(parse_importtime(stderr), [(650, "APIpj"), (600, "numpy")])
+
+
+class TestSchemaCache(APITestCase):
+    def setUp(self):
+        from .schema import CachedSpectacularAPIView
+
+        CachedSpectacularAPIView.clear_cache()
+        self.addCleanup(CachedSpectacularAPIView.clear_cache)
+
+    @override_settings(API_SCHEMA_FILE=settings.BASE_DIR / "static" / "missing.yaml")
+    def test_schema_served_with_etag(self):
+        response = self.client.get("/swagger/schema/")
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertIn("/api/submitData/", response.content.decode())
+        self.assertIn("max-age", response["Cache-Control"])
+
+        again = self.client.get("/swagger/schema/", HTTP_IF_NONE_MATCH=response["ETag"])
+        self.assertEqual(again.status_code, status.HTTP_304_NOT_MODIFIED)
+
+    def test_unknown_lang_shares_default_entry(self):
+        from .schema import CachedSpectacularAPIView
+
+        for lang in ("", "xx", "zz-evil", "ru"):
+            response = self.client.get("/swagger/schema/", {"lang": lang})
+            self.assertEqual(response.status_code, status.HTTP_200_OK)
+        # неизвестные языки не добавляют записей в кэш: "" и "ru"
+        self.assertEqual({lang for _, lang in CachedSpectacularAPIView._cache}, {"", "ru"})
+
+    def test_static_schema_matches_code(self):
+        from .schema import compare_operations, generate_schema, load_schema_file
+
+        missing, stale = compare_operations(generate_schema(), load_schema_file(settings.API_STATIC_SCHEMA_FILE))
+        self.assertEqual((missing, stale), (set(), set()))
+
+    def test_apiviews_document_response_bodies(self):
+        from .schema import generate_schema
+
+        schema = generate_schema()
+        for path in ("/api/submitData/changes/", "/api/submitData/summary/", "/api/heights/",
+                     "/api/map/tiles/{z}/{x}/{y}/", "/api/metrics/"):
+            response = schema["paths"][path]["get"]["responses"]["200"]
+            self.assertIn("$ref", response["content"]["application/json"]["schema"], path)
+
+
+def _jpeg_with_exif(lat=None, lon=None, taken="2024:07:01 10:30:00", size=(40, 30)) -> bytes:
+    from io import BytesIO
+    from PIL import Image as PILImage
+
+    exif = PILImage.Exif()
+    exif.get_ifd(0x8769)[0x9003] = taken
+    if lat is not None:
+        gps = exif.get_ifd(0x8825)
+        gps.update({1: "N" if lat >= 0 else "S", 2: (abs(lat), 0.0, 0.0), 3: "E" if lon >= 0 else "W", 4: (abs(lon), 0.0, 0.0)})
+    buf = BytesIO()
+    PILImage.new("RGB", size, "white").save(buf, "JPEG", exif=exif)
+    return buf.getvalue()
+
+
+class TestImageExif(TestCase):
+    def setUp(self):
+        # backfill_exif читает файлы по пути, InMemoryStorage для него не подходит
+        media_on_disk(self)
+
+    def _pereval_with_photo(self, lat, lon, photo):
+        from django.core.files.base import ContentFile
+        from .models import Image, PerevalImage
+
+        user = User.objects.create(username=f"u{lat}", email=f"{lat}@mail.ru", phone=f"+7{int(lat * 1000)}")
+        pereval = PerevalAdded.objects.create(
+            beauty_title="пер.", title="Перевал", user=user,
+            coords=Coords.objects.create(latitude=lat, longitude=lon, height=3000),
+            level=Level.objects.create(), activity_type=ActivityType.objects.create(title="Хайкинг"),
+        )
+        image = Image.objects.create(data=ContentFile(photo, name="photo.jpg"), title="фото")
+        PerevalImage.objects.create(pereval=pereval, image=image)
+        return pereval, image
+
+    def test_read_exif_parses_gps_time_and_size(self):
+        from io import BytesIO
+        from .exif import read_exif
+
+        data = read_exif(BytesIO(_jpeg_with_exif(lat=-43.5, lon=42.25)))
+        self.assertEqual((data.width, data.height), (40, 30))
+        self.assertEqual((data.gps_latitude, data.gps_longitude), (-43.5, 42.25))
+        self.assertEqual(data.taken_at.isoformat(), "2024-07-01T10:30:00")
+        self.assertEqual(read_exif(BytesIO(b"not an image")).width, 0)
+
+    def test_backfill_fills_columns_and_reports_far_photo(self):
+        from io import StringIO
+        from django.core.management import call_command
+        from .exif import gps_mismatches
+
+        near, near_image = self._pereval_with_photo(43.1, 42.2, _jpeg_with_exif(lat=43.11, lon=42.2))
+        far, far_image = self._pereval_with_photo(44.0, 42.2, _jpeg_with_exif(lat=43.0, lon=42.2))
+
+        out = StringIO()
+        # workers=0 — без пула процессов: воркер `manage.py test --parallel` не может запускать дочерние
+        call_command("backfill_exif", workers=0, batch_size=1, report=True, stdout=out)
+        far_image.refresh_from_db()
+        self.assertEqual((far_image.width, far_image.gps_latitude), (40, 43.0))
+        self.assertEqual(gps_mismatches(near), [])
+        self.assertEqual([pk for pk, _ in gps_mismatches(far)], [far_image.id])
+        self.assertIn(f"перевал #{far.id}", out.getvalue())
+        self.assertNotIn(f"перевал #{near.id}", out.getvalue())
+
+    def test_admin_filter_far_photos(self):
+        from .models import Image
+
+        near, near_image = self._pereval_with_photo(43.1, 42.2, _jpeg_with_exif())
+        far, far_image = self._pereval_with_photo(44.0, 42.2, _jpeg_with_exif())
+        Image.objects.filter(id=near_image.id).update(gps_latitude=43.11, gps_longitude=42.2)
+        Image.objects.filter(id=far_image.id).update(gps_latitude=43.0, gps_longitude=42.2)
+
+        self.client.force_login(User.objects.create_superuser(username="admin", email="admin@mail.ru", password="1"))
+        resp = self.client.get("/admin/APIpj/perevaladded/", {"photo_gps": "far"})
+        self.assertEqual([p.id for p in resp.context["cl"].result_list], [far.id])
+
+
+class TestArchive(PassFixtures, APITestCase):
+    PASSES = 0
+
+    @classmethod
+    def setUpTestData(cls):
+        from datetime import timedelta
+        from django.utils import timezone
+
+        super().setUpTestData()
+        cls.old, cls.fresh = [
+            make_pereval(cls.user, cls.hiking, title=title, status=status)
+            for title, status in (("Старый", "accepted"), ("Свежий", "new"))
+        ]
+        PerevalAdded.objects.update(add_time=timezone.now() - timedelta(days=800))
+
+    def test_archives_only_old_moderated_passes(self):
+        from io import StringIO
+        from django.core.management import call_command
+        from .models import PerevalArchive, PerevalChange
+
+        call_command("archive_perevals", batch_size=1, stdout=StringIO())
+        self.assertEqual(list(PerevalArchive.objects.values_list("id", flat=True)), [self.old.id])
+        self.assertEqual(list(PerevalAdded.objects.values_list("id", flat=True)), [self.fresh.id])
+        self.assertFalse(Coords.objects.filter(id=self.old.coords_id).exists())
+        self.assertEqual(list(PerevalChange.objects.filter(pereval_id=self.old.id).values_list("kind", flat=True)), ["archived"])
+
+    def test_detail_falls_back_to_archive(self):
+        from .archive import archive_batch
+
+        expected = self.client.get(f"/api/submitData/{self.old.id}/").json()
+        archive_batch([self.old.id])
+        resp = self.client.get(f"/api/submitData/{self.old.id}/")
+        self.assertEqual(resp.status_code, status.HTTP_200_OK)
+        self.assertEqual(resp.json(), expected)
+        self.assertEqual(self.client.get("/api/submitData/999999/").status_code, status.HTTP_404_NOT_FOUND)
+
+    def test_list_includes_archived_passes(self):
+        from .archive import archive_batch
+
+        url = f"/api/submitData/?user__email={self.user.email}"
+        expected = self.client.get(url).json()
+        etag = self.client.get(url)["ETag"]
+        archive_batch([self.old.id])
+        resp = self.client.get(url)
+        self.assertEqual(resp.json(), expected)
+        self.assertEqual([p["id"] for p in resp.json()["results"]], [self.old.id, self.fresh.id])
+        self.assertEqual(self.client.get(url, HTTP_IF_NONE_MATCH=etag).status_code, status.HTTP_304_NOT_MODIFIED)
+        page = self.client.get("/api/submitData/", {"user__email": self.user.email, "limit": 1, "offset": 1}).json()
+        self.assertEqual((page["count"], [p["id"] for p in page["results"]]), (2, [self.fresh.id]))
+
+    def test_archived_passes_stay_in_every_derived_index(self):
+        from . import clusters, heights, summaries
+        from .archive import archive_batch
+        from .models import ClusterCell, HeightBand, PerevalArchive, UserPassSummary
+
+        def snapshot():
+            return (
+                set(ClusterCell.objects.filter(count__gt=0).values_list("zoom", "x", "y", "count", "accepted", "new")),
+                set(HeightBand.objects.values_list("pereval_id", "season", "category", "band", "height")),
+                UserPassSummary.objects.values("new", "accepted", "recent").get(user=self.user),
+            )
+
+        def rebuilt():
+            clusters.rebuild()
+            heights.rebuild()
+            summaries.rebuild()
+            return snapshot()
+
+        before = rebuilt()
+        with self.captureOnCommitCallbacks(execute=True):
+            archive_batch([self.old.id])
+        # перенос в архив не меняет ни карту, ни индекс высот, ни сводку
+        self.assertEqual(snapshot(), before)
+        self.assertEqual(rebuilt(), before)
+        heights_ids = [p["id"] for p in self.client.get("/api/heights/", {"season": "summer"}).json()["results"]]
+        self.assertIn(self.old.id, heights_ids)
+
+        # удаление из архива убирает перевал отовсюду
+        with self.captureOnCommitCallbacks(execute=True):
+            PerevalArchive.objects.get(id=self.old.id).delete()
+        after = snapshot()
+        self.assertNotIn(self.old.id, {row[0] for row in after[1]})
+        self.assertEqual(after[2]["accepted"], 0)
+        self.assertEqual(rebuilt(), after)
+
+
+class TestConcurrentSubmissions(TransactionTestCase):
+    client_class = APIClient
+
+    def setUp(self):
+        self.hiking = ActivityType.objects.create(title="Хайкинг")
+
+    def _payload(self, i):
+        return {
+            "beauty_title": "пер.", "title": f"Перевал {i}", "activity_type": self.hiking.id,
+            "user": {"email": "same@mail.ru", "phone": "+70000000055", "first_name": "Иван", "last_name": "Иванов"},
+            "coords": {"latitude": 43.1, "longitude": 42.2, "height": 3000},
+            "level": {"summer": "1А"},
+        }
+
+    # SQLite в памяти (shared cache) не ждёт блокировку, а сразу отвечает "table is locked"
+    @skipIf(connection.vendor == "sqlite", "нужна БД с блокировками строк (PostgreSQL)")
+    def test_parallel_submissions_for_new_user(self):
+        import threading
+        from concurrent.futures import ThreadPoolExecutor
+
+        workers = 4
+        barrier = threading.Barrier(workers)
+
+        def submit(i):
+            try:
+                barrier.wait()
+                return APIClient().post("/api/submitData/", self._payload(i), format="json").status_code
+            finally:
+                connection.close()
+
+        with ThreadPoolExecutor(workers) as pool:
+            codes = list(pool.map(submit, range(workers)))
+        self.assertEqual(codes, [200] * workers)
+        self.assertEqual(User.objects.filter(email="same@mail.ru").count(), 1)
+        self.assertEqual(PerevalAdded.objects.filter(user__email="same@mail.ru").count(), workers)
+
+    def test_repeated_submission_reuses_user_and_detects_conflicts(self):
+        for i in range(2):
+            self.assertEqual(self.client.post("/api/submitData/", self._payload(i), format="json").status_code, 200)
+        self.assertEqual(User.objects.filter(email="same@mail.ru").count(), 1)
+
+        User.objects.create(username="other", email="other@mail.ru", phone="+70000000066")
+        payload = self._payload(2)
+        payload["user"]["phone"] = "+70000000066"
+        resp = self.client.post("/api/submitData/", payload, format="json")
+        self.assertEqual(resp.status_code, status.HTTP_400_BAD_REQUEST)
+        self.assertEqual(resp.json()["code"], "invalid")
+        self.assertIn("user", resp.json()["errors"])
+        self.assertEqual(User.objects.count(), 2)
+
+    def test_rolled_back_create_removes_written_files(self):
+        from unittest import mock
+        from django.core.files.uploadedfile import SimpleUploadedFile
+        from .serializers import PerevalCreateSerializer
+
+        media = media_on_disk(self)
+        payload = dict(self._payload(0), images=[{"data": SimpleUploadedFile("p.jpg", _jpeg_with_exif()), "title": "p"}])
+        serializer = PerevalCreateSerializer(data=payload)
+        self.assertTrue(serializer.is_valid(), serializer.errors)
+        with mock.patch("APIpj.serializers.attach_images", side_effect=RuntimeError("boom")):
+            with self.assertRaises(RuntimeError):
+                serializer.save()
+        self.assertEqual(os.listdir(os.path.join(media, "pereval_images")), [])
+        self.assertFalse(PerevalAdded.objects.exists())
+
+
+class TestUserSummary(PassFixtures, APITestCase):
+
+    def test_summary_tracks_inserts_and_status_changes(self):
+        PerevalAdded.objects.filter(id=self.perevals[0].id).set_status("accepted")
+        pereval = PerevalAdded.objects.get(id=self.perevals[1].id)
+        pereval.status = "rejected"
+        pereval.save()
+
+        with self.assertNumQueries(1):
+            resp = self.client.get("/api/submitData/summary/", {"user__email": self.user.email})
+        data = resp.json()
+        self.assertEqual(data["counts"], {"new": 1, "pending": 0, "accepted": 1, "rejected": 1})
+        self.assertEqual(data["total"], 3)
+        self.assertEqual(
+            [(e["id"], e["status"]) for e in data["recent"]],
+            [(self.perevals[2].id, "new"), (self.perevals[1].id, "rejected"), (self.perevals[0].id, "accepted")],
+        )
+
+    def test_rebuild_matches_incremental(self):
+        from .models import UserPassSummary
+        from .summaries import rebuild
+
+        PerevalAdded.objects.filter(id=self.perevals[0].id).set_status("pending")
+        incremental = UserPassSummary.objects.values().get(user=self.user)
+        rebuild()
+        self.assertEqual(UserPassSummary.objects.values().get(user=self.user), incremental)
+
+    @override_settings(USER_SUMMARY_RECENT=2)
+    def test_delete_decrements_and_refills_recent(self):
+        from .models import UserPassSummary
+        from .summaries import rebuild
+
+        PerevalAdded.objects.filter(id=self.perevals[0].id).set_status("accepted")
+        PerevalAdded.objects.get(id=self.perevals[2].id).delete()
+        summary = UserPassSummary.objects.values().get(user=self.user)
+        self.assertEqual((summary["new"], summary["accepted"]), (1, 1))
+        self.assertEqual([e["id"] for e in summary["recent"]], [self.perevals[1].id, self.perevals[0].id])
+        rebuild()
+        self.assertEqual(UserPassSummary.objects.values().get(user=self.user), summary)
+
+
+class TestMapClusters(PassFixtures, APITestCase):
+    PASSES = 0
+
+    @classmethod
+    def setUpTestData(cls):
+        super().setUpTestData()
+        points = [(43.1 + i * 0.01, 42.2) for i in range(3)] + [(-33.9, 18.4)]
+        # дельты кластеров применяются после commit
+        with cls.captureOnCommitCallbacks(execute=True):
+            cls.perevals = [make_pereval(cls.user, cls.hiking, lat=lat, lon=lon) for lat, lon in points]
+
+    def setUp(self):
+        from django.core.cache import cache
+
+        cache.clear()
+        super().setUp()
+
+    def test_world_tile_and_status_mix(self):
+        from django.test.utils import CaptureQueriesContext
+
+        with self.captureOnCommitCallbacks(execute=True):
+            PerevalAdded.objects.filter(id=self.perevals[0].id).set_status("accepted")
+        resp = self.client.get("/api/map/tiles/0/0/0/")
+        self.assertEqual(resp.status_code, status.HTTP_200_OK)
+        self.assertIn("max-age", resp["Cache-Control"])
+        clusters = sorted(resp.json()["clusters"], key=lambda c: c["count"])
+        self.assertEqual([c["count"] for c in clusters], [1, 3])
+        self.assertAlmostEqual(clusters[1]["lat"], 43.11, places=5)
+        self.assertEqual(clusters[1]["statuses"], {"new": 2, "pending": 0, "accepted": 1, "rejected": 0})
+
+        # повторный запрос тайла отдаётся из кэша
+        with CaptureQueriesContext(connection) as queries:
+            self.client.get("/api/map/tiles/0/0/0/")
+        self.assertFalse([q for q in queries.captured_queries if "clustercell" in q["sql"].lower()])
+
+    def test_incremental_matches_rebuild(self):
+        from .clusters import rebuild
+        from .models import ClusterCell
+
+        with self.captureOnCommitCallbacks(execute=True):
+            PerevalAdded.objects.filter(id__in=[p.id for p in self.perevals[:2]]).set_status("rejected")
+        fields = ("zoom", "x", "y", "count", "new", "pending", "accepted", "rejected")
+        incremental = set(ClusterCell.objects.filter(count__gt=0).values_list(*fields))
+        rebuild()
+        self.assertEqual(set(ClusterCell.objects.values_list(*fields)), incremental)
+
+    def test_deep_zoom_tile_and_invalid_tile(self):
+        from .geo import mercator_cell
+
+        z = 18
+        x, y = mercator_cell(-33.9, 18.4, z)
+        clusters = self.client.get(f"/api/map/tiles/{z}/{x}/{y}/").json()["clusters"]
+        self.assertEqual([c["count"] for c in clusters], [1])
+        self.assertEqual(self.client.get("/api/map/tiles/1/2/0/").status_code, status.HTTP_404_NOT_FOUND)
+
+    def test_admin_coords_edit_and_delete(self):
+        from .clusters import rebuild
+        from .models import ClusterCell
+
+        # правка координат в обход API (админка) и удаление перевала
+        coords = Coords.objects.get(id=self.perevals[0].coords_id)
+        coords.latitude, coords.longitude = 55.7, 37.6
+        with self.captureOnCommitCallbacks(execute=True):
+            coords.save()
+            PerevalAdded.objects.get(id=self.perevals[1].id).delete()
+        fields = ("zoom", "x", "y", "count", "sum_lat", "sum_lon", "new", "pending", "accepted", "rejected")
+        incremental = {row[:3]: row[3:] for row in ClusterCell.objects.filter(count__gt=0).values_list(*fields)}
+        rebuild()
+        rebuilt = {row[:3]: row[3:] for row in ClusterCell.objects.values_list(*fields)}
+        self.assertEqual(incremental.keys(), rebuilt.keys())
+        for key, values in rebuilt.items():
+            for a, b in zip(values, incremental[key]):
+                self.assertAlmostEqual(a, b, places=6)
+
+    def test_stale_tile_not_served_after_commit(self):
+        from django.core.cache import cache
+        from .clusters import tile, tile_key, tile_version
+
+        # запрос прочитал тайл до commit и положил его в кэш уже после инвалидации
+        stale_key = tile_key(0, 0, 0, tile_version(0, 0, 0))
+        with self.captureOnCommitCallbacks(execute=True):
+            make_pereval(self.user, self.hiking, lat=43.2, lon=42.2)
+            cache.set(stale_key, [], 60)
+        self.assertNotEqual(tile_key(0, 0, 0, tile_version(0, 0, 0)), stale_key)
+        self.assertEqual(sum(c["count"] for c in tile(0, 0, 0)), 5)
+
+    def test_create_transaction_does_not_touch_shared_cells(self):
+        from django.test.utils import CaptureQueriesContext
+        from .models import ClusterCell
+
+        # общие ячейки мелких зумов не блокируются транзакцией создания — дельты применяются после commit
+        with self.captureOnCommitCallbacks() as callbacks, CaptureQueriesContext(connection) as queries:
+            make_pereval(self.user, self.hiking, lat=43.2, lon=42.2)
+        self.assertFalse([q for q in queries.captured_queries if "clustercell" in q["sql"].lower()])
+        world = ClusterCell.objects.filter(zoom=0)
+        self.assertEqual(sum(world.values_list("count", flat=True)), 4)
+        for callback in callbacks:
+            callback()
+        self.assertEqual(sum(world.values_list("count", flat=True)), 5)
+
+    def test_failed_apply_is_logged_not_raised(self):
+        from unittest import mock
+        from . import metrics
+
+        with mock.patch("APIpj.clusters.apply", side_effect=RuntimeError("deadlock")):
+            with self.assertLogs("APIpj.clusters", "ERROR"), self.captureOnCommitCallbacks(execute=True):
+                make_pereval(self.user, self.hiking, lat=43.2, lon=42.2)
+        self.assertEqual(metrics.snapshot()["clusters.apply_failed"], 1)
+
+
+
+class TestQueryCounts(PassFixtures, APITestCase):
+    """
+    Число запросов к БД на каждый эндпоинт. Для списков оно не должно расти с числом
+    перевалов и фото: если тест упал, скорее всего, в сериализаторе появился N+1.
+    """
+    IMAGES = 2
+
+    def setUp(self):
+        from django.core.cache import cache
+        from .refdata import refdata
+
+        cache.clear()
+        super().setUp()
+        refdata.activity_title(self.hiking.id)
+
+    def _payload(self, **user):
+        return {
+            "beauty_title": "пер.", "title": "Новый", "activity_type": self.hiking.id,
+            "user": {"email": self.user.email, "phone": self.user.phone, "first_name": "И", "last_name": "И", **user},
+            "coords": {"latitude": 43.1, "longitude": 42.2, "height": 3000},
+            "level": {"summer": "1А"},
+        }
+
+    def _assert_list_queries(self, url, expected):
+        # COUNT/курсор, перевалы с user/coords/level одним JOIN и изображения одним запросом
+        with self.assertNumQueries(expected):
+            self.assertEqual(self.client.get(url).status_code, status.HTTP_200_OK)
+        for i in range(5):
+            make_pereval(self.user, self.hiking, title=f"Ещё {i}", images=3)
+        with self.assertNumQueries(expected):
+            self.assertEqual(self.client.get(url).status_code, status.HTTP_200_OK)
+
+    def test_list(self):
+        # отпечаток (id, updated_at, status) рабочей таблицы и архива одним UNION — он же даёт count и id страницы
+        self._assert_list_queries(f"/api/submitData/?user__email={self.user.email}", 3)
+
+    def test_changes(self):
+        self._assert_list_queries(f"/api/submitData/changes/?user__email={self.user.email}", 4)
+
+    def test_detail(self):
+        with self.assertNumQueries(2):
+            resp = self.client.get(f"/api/submitData/{self.perevals[0].id}/")
+        self.assertEqual(len(resp.json()["images"]), 2)
+
+    def test_not_modified(self):
+        # 304 отвечается по одному запросу отпечатка, без загрузки перевалов и фото
+        for url in (f"/api/submitData/?user__email={self.user.email}", f"/api/submitData/{self.perevals[0].id}/"):
+            etag = self.client.get(url)["ETag"]
+            with self.assertNumQueries(1):
+                self.assertEqual(self.client.get(url, HTTP_IF_NONE_MATCH=etag).status_code, status.HTTP_304_NOT_MODIFIED)
+
+    def test_archived_detail(self):
+        from .archive import archive_batch
+
+        PerevalAdded.objects.filter(id=self.perevals[0].id).set_status("accepted")
+        archive_batch([self.perevals[0].id])
+        # промах по рабочей таблице, затем архив с пользователем и изображениями
+        with self.assertNumQueries(3):
+            resp = self.client.get(f"/api/submitData/{self.perevals[0].id}/")
+        self.assertEqual(len(resp.json()["images"]), 2)
+
+    def test_summary_tile_heights_and_metrics(self):
+        with self.assertNumQueries(1):
+            self.client.get("/api/submitData/summary/", {"user__email": self.user.email})
+        # гистограмма, страница индекса и названия перевалов страницы
+        with self.assertNumQueries(3):
+            self.client.get("/api/heights/", {"min_height": 1000, "max_height": 5000})
+        with self.assertNumQueries(1):
+            self.client.get("/api/map/tiles/0/0/0/")
+        with self.assertNumQueries(0), self.settings(API_METRICS_PUBLIC=True):
+            self.client.get("/api/map/tiles/0/0/0/")
+            self.client.get("/api/metrics/")
+
+    def test_create(self):
+        # кластеры карты обновляются после commit и сюда не входят
+        with self.assertNumQueries(13):
+            resp = self.client.post("/api/submitData/", self._payload(), format="json")
+        self.assertEqual(resp.status_code, status.HTTP_200_OK, resp.data)
+        # новый пользователь: поиск по каноническим email/телефону, INSERT ... ON CONFLICT и повторный поиск
+        with self.assertNumQueries(15):
+            self.client.post("/api/submitData/", self._payload(email="new@mail.ru", phone="+79990000000"), format="json")
+
+    def test_create_with_images(self):
+        from django.core.files.uploadedfile import SimpleUploadedFile
+        from .serializers import PerevalCreateSerializer
+
+        payload = self._payload()
+        payload["images"] = [{"data": SimpleUploadedFile(f"{i}.jpg", _jpeg_with_exif()), "title": str(i)} for i in range(3)]
+        # изображения добавляют два bulk INSERT независимо от их числа
+        with self.assertNumQueries(15):
+            serializer = PerevalCreateSerializer(data=payload)
+            self.assertTrue(serializer.is_valid(), serializer.errors)
+            serializer.save()
+
+    def test_patch(self):
+        url = f"/api/submitData/{self.perevals[0].id}/"
+        # строка сводки пользователя блокируется SELECT ... FOR UPDATE, как при создании и смене статуса
+        with self.assertNumQueries(10):
+            resp = self.client.patch(url, {"title": "Новое название"}, format="json")
+        self.assertEqual(resp.status_code, status.HTTP_200_OK)
+        # смена координат: в транзакции — только выборка статусов перевалов с этими Coords для дельт кластеров
+        with self.assertNumQueries(12):
+            self.client.patch(url, {"coords": {"latitude": 43.5, "longitude": 42.2, "height": 3100}}, format="json")
+
+
+class TestHttpCache(PassFixtures, APITestCase):
+    PASSES = 2
+
+    def detail_url(self, pereval):
+        return f"/api/submitData/{pereval.id}/"
+
+    def test_detail_revalidates_until_changed(self):
+        url = self.detail_url(self.perevals[0])
+        resp = self.client.get(url)
+        self.assertIn("no-cache", resp["Cache-Control"])
+        self.assertIn("Last-Modified", resp)
+
+        again = self.client.get(url, HTTP_IF_NONE_MATCH=resp["ETag"])
+        self.assertEqual(again.status_code, status.HTTP_304_NOT_MODIFIED)
+        self.assertEqual(again["ETag"], resp["ETag"])
+        self.assertEqual(again.content, b"")
+        since = self.client.get(url, HTTP_IF_MODIFIED_SINCE=resp["Last-Modified"])
+        self.assertEqual(since.status_code, status.HTTP_304_NOT_MODIFIED)
+
+        self.client.patch(url, {"title": "Новое название"}, format="json")
+        changed = self.client.get(url, HTTP_IF_NONE_MATCH=resp["ETag"])
+        self.assertEqual(changed.status_code, status.HTTP_200_OK)
+        self.assertNotEqual(changed["ETag"], resp["ETag"])
+        self.assertEqual(changed.json()["title"], "Новое название")
+
+    def test_moderated_pass_is_cached_long(self):
+        pereval = self.perevals[1]
+        PerevalAdded.objects.filter(id=pereval.id).set_status("accepted")
+        resp = self.client.get(self.detail_url(pereval))
+        self.assertIn("public", resp["Cache-Control"])
+        self.assertIn(f"max-age={settings.API_HTTP_CACHE['MAX_AGE']['accepted']}", resp["Cache-Control"])
+
+        from .archive import archive_batch
+
+        archive_batch([pereval.id])
+        archived = self.client.get(self.detail_url(pereval))
+        self.assertEqual(archived.status_code, status.HTTP_200_OK)
+        self.assertIn("public", archived["Cache-Control"])
+        again = self.client.get(self.detail_url(pereval), HTTP_IF_NONE_MATCH=archived["ETag"])
+        self.assertEqual(again.status_code, status.HTTP_304_NOT_MODIFIED)
+
+    def test_list_etag_follows_status_and_new_passes(self):
+        url = f"/api/submitData/?user__email={self.user.email}"
+        etag = self.client.get(url)["ETag"]
+        self.assertEqual(self.client.get(url, HTTP_IF_NONE_MATCH=etag).status_code, status.HTTP_304_NOT_MODIFIED)
+
+        PerevalAdded.objects.filter(id=self.perevals[0].id).set_status("pending")
+        resp = self.client.get(url, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(resp.status_code, status.HTTP_200_OK)
+        self.assertIn("no-cache", resp["Cache-Control"])
+
+        make_pereval(self.user, self.hiking)
+        self.assertNotEqual(self.client.get(url, HTTP_IF_NONE_MATCH=resp["ETag"]).status_code,
+                            status.HTTP_304_NOT_MODIFIED)
+
+    def test_admin_edit_of_coords_changes_etag(self):
+        pereval = self.perevals[0]
+        etag = self.client.get(self.detail_url(pereval))["ETag"]
+        admin_user = User.objects.create_superuser(username="admin", email="admin@mail.ru", password="1")
+        self.client.force_login(admin_user)
+        self.client.post(
+            f"/admin/APIpj/coords/{pereval.coords_id}/change/",
+            {"latitude": 44.0, "longitude": 42.2, "height": 3300},
+        )
+        self.client.logout()
+        resp = self.client.get(self.detail_url(pereval), HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(resp.status_code, status.HTTP_200_OK)
+        self.assertEqual(resp.json()["coords"]["height"], 3300)
+
+
+class TestErrorHandling(PassFixtures, APITestCase):
+    PASSES = 2
+
+    def setUp(self):
+        from . import metrics
+
+        super().setUp()
+        metrics.reset()
+
+    def test_validation_error_is_structured(self):
+        from . import metrics
+
+        resp = self.client.post("/api/submitData/", {"title": "Без координат", "user": {"email": "x@mail.ru"}}, format="json")
+        self.assertEqual(resp.status_code, status.HTTP_400_BAD_REQUEST)
+        body = resp.json()
+        self.assertEqual((body["status"], body["id"], body["code"]), (400, None, "invalid"))
+        self.assertTrue(body["message"].startswith("Validation error: "))
+        self.assertEqual(body["errors"]["coords"], [{"message": "Обязательное поле.", "code": "required"}])
+        self.assertEqual(body["errors"]["user"]["phone"][0]["code"], "required")
+        self.assertEqual(metrics.snapshot()["errors.invalid"], 1)
+
+    def test_patch_errors_keep_state_envelope(self):
+        url = f"/api/submitData/{self.perevals[0].id}/"
+        resp = self.client.patch(url, {"coords": {"height": "высоко"}}, format="json")
+        self.assertEqual(resp.status_code, status.HTTP_400_BAD_REQUEST)
+        self.assertEqual(resp.json()["state"], 0)
+        self.assertIn("coords.height: ", resp.json()["message"])
+
+        resp = self.client.patch(url, {"user": {"email": "new@mail.ru"}}, format="json")
+        self.assertEqual(resp.json()["code"], "user_readonly")
+
+        PerevalAdded.objects.filter(id=self.perevals[1].id).set_status("accepted")
+        resp = self.client.patch(f"/api/submitData/{self.perevals[1].id}/", {"title": "x"}, format="json")
+        self.assertEqual(resp.status_code, status.HTTP_400_BAD_REQUEST)
+        self.assertEqual((resp.json()["state"], resp.json()["code"]), (0, "not_editable"))
+
+        # раньше обработчик падал на неопределённой переменной и отдавал 500
+        resp = self.client.patch("/api/submitData/999999/", {"title": "x"}, format="json")
+        self.assertEqual(resp.status_code, status.HTTP_404_NOT_FOUND)
+        self.assertEqual((resp.json()["state"], resp.json()["code"]), (0, "not_found"))
+
+    def test_unexpected_error_is_logged_and_not_leaked(self):
+        from unittest import mock
+        from . import metrics
+
+        payload = {
+            "beauty_title": "пер.", "title": "Новый", "activity_type": self.hiking.id,
+            "user": {"email": self.user.email, "phone": self.user.phone, "first_name": "И", "last_name": "И"},
+            "coords": {"latitude": 43.1, "longitude": 42.2, "height": 3000},
+            "level": {"summer": "1А"},
+        }
+        with mock.patch("APIpj.serializers.attach_images", side_effect=RuntimeError("секрет в тексте ошибки")):
+            with self.assertLogs("APIpj.exceptions", "ERROR"):
+                resp = self.client.post("/api/submitData/", payload, format="json")
+        self.assertEqual(resp.status_code, status.HTTP_500_INTERNAL_SERVER_ERROR)
+        self.assertEqual(resp.json(), {"status": 500, "message": "Внутренняя ошибка сервера", "id": None, "code": "server_error"})
+        self.assertEqual(PerevalAdded.objects.count(), 2)
+        self.assertEqual(metrics.snapshot()["errors.server_error"], 1)
+
+    def test_integrity_errors(self):
+        from unittest import mock
+
+        payload = {
+            "beauty_title": "пер.", "title": "Новый", "activity_type": self.hiking.id,
+            "user": {"email": self.user.email, "phone": self.user.phone, "first_name": "И", "last_name": "И"},
+            "coords": {"latitude": 43.1, "longitude": 42.2, "height": 3000},
+            "level": {"summer": "1А"},
+        }
+
+        def duplicate_username(*args):
+            User.objects.create(username=self.user.username, email="other@mail.ru", phone="+70000000099")
+
+        def missing_latitude(*args):
+            Coords.objects.create(latitude=None, longitude=42.2, height=3000)
+
+        # гонка за уникальное значение — конфликт с данными клиента
+        with mock.patch("APIpj.serializers.attach_images", side_effect=duplicate_username):
+            with self.assertLogs("APIpj.exceptions", "WARNING"):
+                resp = self.client.post("/api/submitData/", payload, format="json")
+        self.assertEqual((resp.status_code, resp.json()["code"]), (409, "conflict"))
+
+        # остальные нарушения ограничений — ошибка сервера
+        with mock.patch("APIpj.serializers.attach_images", side_effect=missing_latitude):
+            with self.assertLogs("APIpj.exceptions", "ERROR"):
+                resp = self.client.post("/api/submitData/", payload, format="json")
+        self.assertEqual((resp.status_code, resp.json()["code"]), (500, "server_error"))
+
+    def test_view_errors_have_codes(self):
+        self.assertEqual(self.client.get("/api/heights/", {"season": "лето"}).json()["code"], "invalid_season")
+        self.assertEqual(self.client.get("/api/submitData/changes/").json()["code"], "missing_email")
+        resp = self.client.get("/api/submitData/999999/")
+        self.assertEqual((resp.status_code, resp.json()["code"]), (404, "not_found"))
+
+
+class TestCanonicalContacts(PassFixtures, APITestCase):
+    PASSES = 1
+
+    @classmethod
+    def setUpTestData(cls):
+        super().setUpTestData()
+        cls.user.email, cls.user.phone = "Alex@Mail.ru", "+7 (900) 123-45-67"
+        cls.user.save(update_fields=["email", "phone"])
+
+    def _payload(self, email, phone):
+        return {
+            "beauty_title": "пер.", "title": "Новый", "activity_type": self.hiking.id,
+            "user": {"email": email, "phone": phone, "first_name": "И", "last_name": "И"},
+            "coords": {"latitude": 43.1, "longitude": 42.2, "height": 3000},
+            "level": {"summer": "1А"},
+        }
+
+    def test_canonical_forms(self):
+        from .contacts import canonical_email, canonical_phone
+
+        self.assertEqual(canonical_email("  Alex@Mail.RU "), "alex@mail.ru")
+        self.assertIsNone(canonical_email(" "))
+        for phone in ("+7 (900) 123-45-67", "8 900 123 45 67", "79001234567", "+79001234567"):
+            self.assertEqual(canonical_phone(phone), "+79001234567")
+        self.assertIsNone(canonical_phone("нет"))
+        self.assertEqual(
+            (self.user.email_canonical, self.user.phone_canonical), ("alex@mail.ru", "+79001234567")
+        )
+
+    def test_submission_reuses_user_whatever_the_spelling(self):
+        for email, phone in (("ALEX@mail.ru", "89001234567"), ("alex@mail.ru", "+7 900 1234567")):
+            resp = self.client.post("/api/submitData/", self._payload(email, phone), format="json")
+            self.assertEqual(resp.status_code, status.HTTP_200_OK, resp.data)
+        self.assertEqual(User.objects.count(), 1)
+        self.assertEqual(PerevalAdded.objects.filter(user=self.user).count(), 3)
+
+        resp = self.client.get("/api/submitData/", {"user__email": "ALEX@MAIL.RU"})
+        self.assertEqual(resp.json()["count"], 3)
+        summary = self.client.get("/api/submitData/summary/", {"user__email": "alex@mail.ru"}).json()
+        self.assertEqual(summary["total"], 3)
+
+    def test_canonical_columns_are_unique(self):
+        from django.db import IntegrityError, transaction
+
+        with self.assertRaises(IntegrityError), transaction.atomic():
+            make_user(email="alex@mail.ru")
+        with self.assertRaises(IntegrityError), transaction.atomic():
+            make_user(phone="89001234567")
+        resp = self.client.post("/api/submitData/", self._payload("new@mail.ru", "телефон"), format="json")
+        self.assertEqual(resp.json()["errors"]["user"]["phone"][0]["code"], "invalid_phone")
+
+    def test_blank_email_matches_nobody(self):
+        # у администратора без email канонического значения нет (NULL): пробельный email не должен его находить
+        admin = make_user(email="", phone="+70000000999")
+        self.assertIsNone(admin.email_canonical)
+        make_pereval(admin, self.hiking)
+
+        resp = self.client.get("/api/submitData/", {"user__email": "   "})
+        self.assertEqual(resp.json()["count"], 0)
+        for url in ("/api/submitData/changes/", "/api/submitData/summary/"):
+            resp = self.client.get(url, {"user__email": "   "})
+            self.assertEqual(resp.status_code, status.HTTP_400_BAD_REQUEST)
+            self.assertEqual(resp.json()["code"], "missing_email")
+
+    def test_legacy_duplicate_is_found_by_exact_contacts(self):
+        # дубликат до нормализации: миграция 0017 оставила ему NULL, значения заняты self.user
+        legacy = make_user()
+        User.objects.filter(pk=legacy.pk).update(
+            email="ALEX@mail.ru", phone="8 900 123-45-67", email_canonical=None, phone_canonical=None
+        )
+        legacy.refresh_from_db()
+        make_pereval(legacy, self.hiking, title="Старый")
+
+        legacy.first_name = "Алексей"
+        legacy.save()
+        legacy.refresh_from_db()
+        self.assertIsNone(legacy.email_canonical)
+
+        resp = self.client.get("/api/submitData/", {"user__email": "ALEX@mail.ru"})
+        self.assertEqual(resp.json()["count"], 2)
+        resp = self.client.get("/api/submitData/", {"user__email": "alex@mail.ru"})
+        self.assertEqual(resp.json()["count"], 1)
+        summary = self.client.get("/api/submitData/summary/", {"user__email": "ALEX@mail.ru"}).json()
+        self.assertEqual(summary["total"], 2)
+
+        # точные email и телефон дубликата указывают на него, а не на канонического пользователя
+        resp = self.client.post("/api/submitData/", self._payload("ALEX@mail.ru", "8 900 123-45-67"), format="json")
+        self.assertEqual(resp.status_code, status.HTTP_200_OK, resp.data)
+        self.assertEqual(PerevalAdded.objects.get(id=resp.data["id"]).user_id, legacy.pk)
+
+
+class TestHeightBands(PassFixtures, APITestCase):
+    PASSES = 0
+    url = "/api/heights/"
+
+    @classmethod
+    def setUpTestData(cls):
+        super().setUpTestData()
+        cls.perevals = [
+            make_pereval(cls.user, cls.hiking, height=height, level={"summer": summer, "winter": "2А"})
+            for height, summer in ((2950, "1А"), (3000, "1А"), (3480, "1Б"), (3550, "1А"), (4000, "1А"), (4010, "1А"))
+        ]
+
+    def test_band_query_and_histogram(self):
+        # гистограмма, страница индекса и названия перевалов страницы
+        with self.assertNumQueries(3):
+            data = self.client.get(self.url, {"category": "1А", "min_height": 3000, "max_height": 4000}).json()
+        self.assertEqual(data["count"], 3)
+        self.assertEqual([p["height"] for p in data["results"]], [3000, 3550, 4000])
+        self.assertEqual(
+            data["histogram"],
+            [{"from": 3000, "to": 3100, "count": 1}, {"from": 3500, "to": 3600, "count": 1}, {"from": 4000, "to": 4100, "count": 1}],
+        )
+
+        coarse = self.client.get(self.url, {"season": "winter", "step": 1000}).json()
+        self.assertEqual(coarse["histogram"], [{"from": 2000, "to": 3000, "count": 1}, {"from": 3000, "to": 4000, "count": 3},
+                                               {"from": 4000, "to": 5000, "count": 2}])
+        self.assertEqual(self.client.get(self.url, {"season": "monsoon"}).status_code, status.HTTP_400_BAD_REQUEST)
+        self.assertEqual(self.client.get(self.url, {"min_height": "high"}).status_code, status.HTTP_400_BAD_REQUEST)
+
+    def test_edits_update_index_and_match_rebuild(self):
+        from .heights import rebuild
+        from .models import HeightBand
+
+        pereval = self.perevals[2]
+        resp = self.client.patch(
+            f"/api/submitData/{pereval.id}/",
+            {"coords": {"latitude": 43.1, "longitude": 42.2, "height": 3720}, "level": {"summer": "1А"}},
+            format="json",
+        )
+        self.assertEqual(resp.status_code, status.HTTP_200_OK)
+        data = self.client.get(self.url, {"category": "1А", "min_height": 3700, "max_height": 3799}).json()
+        self.assertEqual([p["id"] for p in data["results"]], [pereval.id])
+
+        fields = ("pereval_id", "season", "category", "band", "height")
+        incremental = set(HeightBand.objects.values_list(*fields))
+        self.assertEqual(rebuild(), len(self.perevals))
+        self.assertEqual(set(HeightBand.objects.values_list(*fields)), incremental)
+
+    def test_implausible_height_is_rejected(self):
+        resp = self.client.patch(
+            f"/api/submitData/{self.perevals[0].id}/",
+            {"coords": {"latitude": 43.1, "longitude": 42.2, "height": 3_300_000}},
+            format="json",
+        )
+        self.assertEqual(resp.status_code, status.HTTP_400_BAD_REQUEST)
+        self.assertEqual(resp.json()["code"], "invalid")
+
+
+class TestAuditLog(PassFixtures, APITestCase):
+    IMAGES = 1
+
+    def test_patch_writes_field_diffs_after_commit(self):
+        from django.core.files.uploadedfile import SimpleUploadedFile
+        from .models import PerevalAudit, PerevalImage
+
+        pereval = self.perevals[0]
+        old_images = list(PerevalImage.objects.filter(pereval=pereval).values_list("image_id", flat=True))
+        with self.captureOnCommitCallbacks(execute=True):
+            resp = self.client.patch(
+                f"/api/submitData/{pereval.id}/",
+                {
+                    "title": "Новое название",
+                    "coords.height": 3100,
+                    "level.summer": "2А",
+                    "images": [SimpleUploadedFile("new.jpg", _jpeg_with_exif())],
+                },
+                format="multipart",
+            )
+        self.assertEqual(resp.status_code, status.HTTP_200_OK, resp.data)
+
+        entries = list(PerevalAudit.objects.filter(pereval_id=pereval.id).order_by("id"))
+        self.assertEqual(len({e.revision for e in entries}), 1)
+        changes = {(e.model, e.field): (e.old_value, e.new_value) for e in entries}
+        new_images = list(PerevalImage.objects.filter(pereval=pereval).values_list("image_id", flat=True))
+        self.assertEqual(changes, {
+            ("PerevalAdded", "title"): ("Перевал 0", "Новое название"),
+            ("Coords", "height"): (3000, 3100),
+            ("Level", "summer"): ("1А", "2А"),
+            ("PerevalImage", "images"): (old_images, new_images),
+        })
+
+    def test_rejected_edit_is_not_logged(self):
+        from .models import PerevalAudit
+
+        PerevalAdded.objects.filter(id=self.perevals[1].id).set_status("accepted")
+        with self.captureOnCommitCallbacks(execute=True):
+            resp = self.client.patch(f"/api/submitData/{self.perevals[1].id}/", {"title": "X"}, format="json")
+        self.assertEqual(resp.status_code, status.HTTP_400_BAD_REQUEST)
+        self.assertFalse(PerevalAudit.objects.exists())
+
+    def test_writer_drops_entries_when_buffer_is_full(self):
+        from uuid import uuid4
+        from django.utils import timezone
+        from . import metrics
+        from .audit import AuditWriter
+        from .models import PerevalAudit
+
+        def entries(n):
+            now = timezone.now()
+            return [
+                PerevalAudit(pereval_id=1, revision=uuid4(), model="PerevalAdded", field="title", changed_at=now)
+                for _ in range(n)
+            ]
+
+        # фоновый поток спит дольше теста: запись происходит только в stop()
+        writer = AuditWriter(batch_size=10, flush_interval=3600, max_buffer=3)
+        self.addCleanup(writer.stop)
+        overflow = metrics.snapshot().get("audit.overflow", 0)
+        writer.add(entries(2))
+        self.assertEqual((len(writer), PerevalAudit.objects.count()), (2, 0))
+
+        # правка, не поместившаяся в буфер, отбрасывается: запрос в БД не пишет
+        writer.add(entries(2))
+        self.assertEqual((len(writer), PerevalAudit.objects.count()), (2, 0))
+        self.assertEqual(metrics.snapshot()["audit.overflow"] - overflow, 2)
+
+        writer.add(entries(1))
+        writer.stop()
+        self.assertEqual((len(writer), PerevalAudit.objects.count()), (0, 3))
+
+    def test_writer_registers_atexit_once(self):
+        from unittest import mock
+        from .audit import AuditWriter
+
+        writer = AuditWriter(flush_interval=3600)
+        self.addCleanup(writer.stop)
+        with mock.patch("APIpj.audit.atexit.register") as register:
+            writer._ensure_thread()
+            # как после fork: поток пересоздаётся, обработчик atexit — нет
+            writer._pid = -1
+            writer._ensure_thread()
+        register.assert_called_once_with(writer.stop)
+
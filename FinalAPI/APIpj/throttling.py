@@ -0,0 +1,221 @@
+"""
+Ограничение частоты запросов по token bucket: по IP клиента и по email отправителя.
+
+Состояние корзин хранится в подключаемом бэкенде (settings.API_THROTTLE["BACKEND"]):
+- LocalBucketBackend — словарь в памяти процесса;
+- SQLiteBucketBackend — общий файл SQLite для нескольких воркеров на одной машине.
+Полностью пополнившаяся корзина ничем не отличается от отсутствующей, поэтому бэкенды
+её удаляют: число корзин ограничено активными клиентами, а не всеми, кто когда-либо заходил.
+
+IP клиента — REMOTE_ADDR; X-Forwarded-For учитывается только за доверенными прокси
+(REST_FRAMEWORK["NUM_PROXIES"], переменная API_NUM_PROXIES), иначе его подделывает любой клиент.
+"""
+import abc
+import os
+import sqlite3
+import tempfile
+import threading
+import time
+from collections import OrderedDict
+from typing import Any, Dict, Optional, Tuple
+
+from django.conf import settings
+from django.core.signals import setting_changed
+from django.utils.module_loading import import_string
+from rest_framework.throttling import BaseThrottle
+
+from . import metrics
+from .contacts import canonical_email
+
+_DURATIONS = {"s": 1, "m": 60, "h": 60 * 60, "d": 24 * 60 * 60}
+
+
+def parse_rate(rate: str) -> Tuple[int, int]:
+    # "60/min" -> (60, 60): ёмкость корзины и период её полного пополнения в секундах
+    num, period = rate.split("/")
+    return int(num), _DURATIONS[period.strip()[0]]
+
+
+class LocalBucketBackend:
+    """
+    Корзины в памяти процесса в порядке последнего обращения: (токены, время, когда корзина будет полной).
+    Пополнившиеся корзины удаляются с начала очереди, сверх max_keys — самые давние (LRU).
+    """
+
+    def __init__(self, max_keys: int = 100_000, **options: Any) -> None:
+        self.max_keys = max_keys
+        self._buckets: "OrderedDict[str, Tuple[float, float, float]]" = OrderedDict()
+        self._lock = threading.Lock()
+
+    def consume(self, key: str, capacity: int, refill_rate: float) -> float:
+        """Забирает один токен. Возвращает 0, если запрос разрешён, иначе сколько секунд ждать."""
+        now = time.monotonic()
+        with self._lock:
+            tokens, updated, _ = self._buckets.pop(key, (float(capacity), now, now))
+            tokens = min(float(capacity), tokens + (now - updated) * refill_rate)
+            wait = 0.0 if tokens >= 1 else (1 - tokens) / refill_rate
+            if not wait:
+                tokens -= 1
+            self._buckets[key] = (tokens, now, now + (capacity - tokens) / refill_rate)
+            self._evict(now)
+            return wait
+
+    def _evict(self, now: float) -> None:
+        buckets = self._buckets
+        while buckets and (len(buckets) > self.max_keys or next(iter(buckets.values()))[2] <= now):
+            buckets.popitem(last=False)
+
+
+class SQLiteBucketBackend:
+    # раз в PRUNE_EVERY запросов соединение удаляет корзины, простоявшие дольше idle_ttl:
+    # за сутки (самый длинный период в rate) любая корзина пополняется полностью
+    PRUNE_EVERY = 1000
+
+    def __init__(self, path: Optional[str] = None, idle_ttl: float = _DURATIONS["d"], **options: Any) -> None:
+        self.path = path or os.path.join(tempfile.gettempdir(), "finalapi_throttle.sqlite3")
+        self.idle_ttl = idle_ttl
+        self._local = threading.local()
+
+    def _connection(self) -> sqlite3.Connection:
+        conn = getattr(self._local, "conn", None)
+        if conn is None:
+            conn = sqlite3.connect(self.path, timeout=5, isolation_level=None)
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute(
+                "CREATE TABLE IF NOT EXISTS buckets (key TEXT PRIMARY KEY, tokens REAL NOT NULL, updated REAL NOT NULL)"
+            )
+            self._local.conn = conn
+            self._local.calls = 0
+        return conn
+
+    def consume(self, key: str, capacity: int, refill_rate: float) -> float:
+        # time.time(), а не monotonic: время должно совпадать во всех процессах
+        now = time.time()
+        conn = self._connection()
+        conn.execute("BEGIN IMMEDIATE")
+        try:
+            row = conn.execute("SELECT tokens, updated FROM buckets WHERE key = ?", (key,)).fetchone()
+            tokens, updated = row if row else (float(capacity), now)
+            tokens = min(float(capacity), tokens + max(0.0, now - updated) * refill_rate)
+            wait = 0.0 if tokens >= 1 else (1 - tokens) / refill_rate
+            if not wait:
+                tokens -= 1
+            conn.execute(
+                "INSERT INTO buckets (key, tokens, updated) VALUES (?, ?, ?) "
+                "ON CONFLICT(key) DO UPDATE SET tokens = excluded.tokens, updated = excluded.updated",
+                (key, tokens, now),
+            )
+            conn.execute("COMMIT")
+        except Exception:
+            conn.execute("ROLLBACK")
+            raise
+        self._local.calls += 1
+        if self._local.calls % self.PRUNE_EVERY == 0:
+            conn.execute("DELETE FROM buckets WHERE updated < ?", (now - self.idle_ttl,))
+        return wait
+
+
+_backend = None
+
+
+def get_backend():
+    global _backend
+    if _backend is None:
+        config = settings.API_THROTTLE
+        _backend = import_string(config["BACKEND"])(**config.get("OPTIONS", {}))
+    return _backend
+
+
+class TokenBucketThrottle(BaseThrottle, metaclass=abc.ABCMeta):
+    scope: str = ""
+
+    def __init__(self) -> None:
+        self._wait = 0.0
+
+    @abc.abstractmethod
+    def get_cache_key(self, request, view) -> Optional[str]:
+        """Ключ корзины для запроса; None — запрос не ограничивается."""
+
+    def allow_key(self, key: Optional[str]) -> bool:
+        rate = settings.API_THROTTLE.get("RATES", {}).get(self.scope)
+        if not rate or not key:
+            return True
+        capacity, duration = parse_rate(rate)
+        self._wait = get_backend().consume(f"{self.scope}:{key}", capacity, capacity / duration)
+        if self._wait:
+            metrics.incr(f"throttle.{self.scope}.rejected")
+            return False
+        return True
+
+    def allow_request(self, request, view) -> bool:
+        return self.allow_key(self.get_cache_key(request, view))
+
+    def wait(self) -> Optional[float]:
+        return self._wait or None
+
+
+class IPTokenBucketThrottle(TokenBucketThrottle):
+    scope = "ip"
+
+    def get_cache_key(self, request, view) -> Optional[str]:
+        return self.get_ident(request)
+
+
+class SubmitterEmailThrottle(TokenBucketThrottle):
+    """
+    Корзина на email отправителя. Для GET email берётся из ?user__email=,
+    для POST проверка делается во view после разбора тела (см. SubmitDataCreateAPIView.create).
+    """
+    scope = "email"
+
+    def get_cache_key(self, request, view) -> Optional[str]:
+        if request.method != "GET":
+            return None
+        return self.normalize(request.query_params.get("user__email"))
+
+    @staticmethod
+    def normalize(email: Optional[str]) -> Optional[str]:
+        return canonical_email(email)
+
+
+_upload_slots: Optional[threading.BoundedSemaphore] = None
+_upload_slots_lock = threading.Lock()
+_uploads_in_flight = 0
+
+
+def _get_upload_slots() -> threading.BoundedSemaphore:
+    global _upload_slots
+    with _upload_slots_lock:
+        if _upload_slots is None:
+            _upload_slots = threading.BoundedSemaphore(settings.API_THROTTLE.get("UPLOAD_CONCURRENCY", 8))
+        return _upload_slots
+
+
+def acquire_upload_slot() -> bool:
+    """Занимает слот загрузки без ожидания: под ASGI sync-middleware не должно блокировать поток исполнителя."""
+    global _uploads_in_flight
+    if not _get_upload_slots().acquire(blocking=False):
+        metrics.incr("uploads.rejected")
+        return False
+    with _upload_slots_lock:
+        _uploads_in_flight += 1
+    metrics.incr("uploads.started")
+    return True
+
+
+def release_upload_slot() -> None:
+    global _uploads_in_flight
+    with _upload_slots_lock:
+        _uploads_in_flight -= 1
+    _get_upload_slots().release()
+
+
+def _reset_throttle_state(*, setting: str, **kwargs: Any) -> None:
+    global _backend, _upload_slots
+    if setting == "API_THROTTLE":
+        _backend = None
+        _upload_slots = None
+
+
+setting_changed.connect(_reset_throttle_state)
+metrics.register_gauge("uploads.in_flight", lambda: _uploads_in_flight)
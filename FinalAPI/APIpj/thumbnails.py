@@ -0,0 +1,110 @@
+"""
+Превью изображений для админки. Уменьшенная копия хранится в storage рядом с оригиналами
+(thumbnails/<W>x<H>/...) и создаётся в фоновом потоке: после commit загрузки через API
+(APIpj.uploads) или при первом показе старого файла в админке. Пока превью не готово,
+админка показывает оригинал, уменьшенный браузером, — страница не ждёт Pillow.
+"""
+import logging
+import os
+import threading
+from collections import OrderedDict
+from concurrent.futures import Future, ThreadPoolExecutor
+from io import BytesIO
+from typing import Dict, Optional, Tuple
+
+from django.core.files.base import ContentFile
+from django.core.files.storage import default_storage
+
+logger = logging.getLogger(__name__)
+
+THUMBNAIL_SIZE: Tuple[int, int] = (120, 120)
+# сколько готовых URL превью помнит процесс (LRU)
+URL_CACHE_SIZE = 10_000
+
+Key = Tuple[str, Tuple[int, int]]
+
+_lock = threading.Lock()
+_urls: "OrderedDict[Key, str]" = OrderedDict()
+_pending: Dict[Key, Future] = {}
+_executor: Optional[ThreadPoolExecutor] = None
+
+
+def thumbnail_name(name: str, size: Tuple[int, int] = THUMBNAIL_SIZE) -> str:
+    root, _ = os.path.splitext(name)
+    return f"thumbnails/{size[0]}x{size[1]}/{root}.jpg"
+
+
+def _remember(key: Key, url: str) -> str:
+    with _lock:
+        _urls[key] = url
+        _urls.move_to_end(key)
+        while len(_urls) > URL_CACHE_SIZE:
+            _urls.popitem(last=False)
+    return url
+
+
+def generate(name: str, size: Tuple[int, int] = THUMBNAIL_SIZE) -> str:
+    """Создаёт превью, если его ещё нет, и возвращает его URL. Пустая строка, если исходника нет."""
+    thumb = thumbnail_name(name, size)
+    if not default_storage.exists(thumb):
+        if not default_storage.exists(name):
+            return ""
+        # Pillow импортируем только при генерации превью
+        from PIL import Image as PILImage
+
+        with default_storage.open(name, "rb") as src:
+            img = PILImage.open(src)
+            img.draft("RGB", size)  # для JPEG декодирует сразу в уменьшенном масштабе
+            img = img.convert("RGB")
+            img.thumbnail(size)
+            buf = BytesIO()
+            img.save(buf, "JPEG", quality=80)
+        default_storage.save(thumb, ContentFile(buf.getvalue()))
+    return _remember((name, size), default_storage.url(thumb))
+
+
+def _run(key: Key) -> str:
+    try:
+        return generate(*key)
+    except Exception:
+        logger.warning("Не удалось создать превью %s", key[0], exc_info=True)
+        return ""
+    finally:
+        with _lock:
+            _pending.pop(key, None)
+
+
+def schedule(name: str, size: Tuple[int, int] = THUMBNAIL_SIZE) -> Future:
+    """Ставит создание превью в фоновую очередь; повторный вызов для того же файла не дублирует работу."""
+    global _executor
+    key = (name, size)
+    with _lock:
+        future = _pending.get(key)
+        if future is None:
+            if _executor is None:
+                _executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix="thumbnails")
+            future = _pending[key] = _executor.submit(_run, key)
+    return future
+
+
+def thumbnail_url(name: str, size: Tuple[int, int] = THUMBNAIL_SIZE) -> str:
+    """
+    URL превью для файла name из default_storage. Если превью ещё нет — ставит его в очередь
+    и возвращает URL оригинала. Пустая строка, если исходника нет.
+    """
+    if not name:
+        return ""
+    key = (name, size)
+    with _lock:
+        cached = _urls.get(key)
+        if cached is not None:
+            _urls.move_to_end(key)
+            return cached
+
+    thumb = thumbnail_name(name, size)
+    if default_storage.exists(thumb):
+        return _remember(key, default_storage.url(thumb))
+    if not default_storage.exists(name):
+        return ""
+    schedule(name, size)
+    return default_storage.url(name)
@@ -0,0 +1,63 @@
+"""
+Сохранение загруженных изображений вне транзакции БД.
+
+Файлы записываются в storage до открытия транзакции, чтобы соединение и блокировки строк
+не удерживались на время записи на диск. Внутри транзакции создаются только строки Image
+и PerevalImage со ссылкой на уже сохранённый файл. Если транзакция откатилась, вызывающий код
+удаляет записанные файлы через delete_stored(); после commit превью для админки создаются
+в фоне (APIpj.thumbnails).
+"""
+from typing import Any, Dict, Iterable, List, NamedTuple, Optional
+
+from django.db import transaction
+
+from . import thumbnails
+from .exif import read_uploaded
+from .models import Image, PerevalImage
+
+
+class StoredImage(NamedTuple):
+    name: str
+    title: str
+    # метаданные EXIF для колонок Image
+    fields: Dict[str, Any]
+
+
+def store_images(images_data: Optional[Iterable[Dict[str, Any]]]) -> List[StoredImage]:
+    field = Image._meta.get_field("data")
+    stored: List[StoredImage] = []
+    try:
+        for img in images_data or ():
+            file_obj = img.get("data")
+            title = img.get("title") or getattr(file_obj, "name", "")
+            name, fields = "", {}
+            if file_obj is not None:
+                fields = read_uploaded(file_obj)
+                name = field.storage.save(field.generate_filename(None, file_obj.name), file_obj)
+            stored.append(StoredImage(name, title, fields))
+    except Exception:
+        delete_stored(stored)
+        raise
+    return stored
+
+
+def delete_stored(stored: Iterable[StoredImage]) -> None:
+    storage = Image._meta.get_field("data").storage
+    for item in stored:
+        if item.name:
+            storage.delete(item.name)
+
+
+def attach_images(pereval, stored: List[StoredImage]) -> None:
+    """Строки Image и PerevalImage для уже сохранённых файлов: два INSERT на все изображения."""
+    if not stored:
+        return
+    images = Image.objects.bulk_create(Image(data=item.name, title=item.title, **item.fields) for item in stored)
+    PerevalImage.objects.bulk_create(PerevalImage(pereval=pereval, image=image) for image in images)
+    names = [item.name for item in stored if item.name]
+
+    def schedule_thumbnails() -> None:
+        for name in names:
+            thumbnails.schedule(name)
+
+    transaction.on_commit(schedule_thumbnails)
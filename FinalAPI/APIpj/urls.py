@@ -1,7 +1,20 @@
 from django.urls import path
-from .views import SubmitDataCreateAPIView, SubmitDataRetrieveAPIView
+from .views import (SubmitDataCreateAPIView,
+                    SubmitDataRetrieveAPIView,
+                    SubmitDataChangesAPIView,
+                    SubmitDataSummaryAPIView,
+                    MetricsAPIView,
+                    MapTileAPIView,
+                    HeightBandsAPIView,
+                    submit_data_events)
 
 urlpatterns = [
     path('submitData/', SubmitDataCreateAPIView.as_view(), name='submit-data'),
+    path("submitData/changes/", SubmitDataChangesAPIView.as_view(), name="submit_changes"),
+    path("submitData/summary/", SubmitDataSummaryAPIView.as_view(), name="submit_summary"),
+    path("submitData/events/", submit_data_events, name="submit_events"),
     path("submitData/<int:id>/", SubmitDataRetrieveAPIView.as_view(), name="submit_detail"),
+    path("map/tiles/<int:z>/<int:x>/<int:y>/", MapTileAPIView.as_view(), name="map_tile"),
+    path("heights/", HeightBandsAPIView.as_view(), name="heights"),
+    path("metrics/", MetricsAPIView.as_view(), name="metrics"),
 ]
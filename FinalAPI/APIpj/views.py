@@ -1,10 +1,29 @@
+import asyncio
+import json
 import re
-from typing import Any, Dict, List
-from django.http import HttpRequest
+from datetime import timedelta
+from typing import Any, AsyncIterator, Dict, List
+from django.conf import settings
+from django.core.handlers.asgi import ASGIRequest
+from django.http import Http404, HttpRequest, StreamingHttpResponse
+from django.utils import timezone
+from django.utils.cache import patch_cache_control
 from rest_framework import parsers, permissions, generics
 from rest_framework.response import Response
-from .serializers import PerevalCreateSerializer, PerevalDetailSerializer, PerevalUpdateSerializer
-from .models import PerevalAdded
+from rest_framework.views import APIView
+from .serializers import (
+    HeightBandsResponseSerializer, MapTileResponseSerializer, MetricsResponseSerializer, PassSummaryResponseSerializer,
+    PerevalArchiveSerializer, PerevalChangesResponseSerializer, PerevalCreateSerializer, PerevalDetailSerializer,
+    PerevalUpdateSerializer,
+)
+from .models import PerevalAdded, PerevalArchive, PerevalChange, User, UserPassSummary
+from .renderers import ORJSONParser
+from .throttling import SubmitterEmailThrottle
+from .events import RESYNC, get_broker
+from .contacts import canonical_email, email_lookup
+from .exceptions import ApiError, json_error
+from . import clusters, heights, http_cache, idempotency, metrics, summaries
+import django_filters
 from django_filters.rest_framework import DjangoFilterBackend
 
 # Регулярки для ключей вида images
@@ -74,95 +93,382 @@ def _normalize_payload(request: HttpRequest) -> Dict[str, Any]:
     return payload
 
 
+class PerevalFilter(django_filters.FilterSet):
+    user__email = django_filters.CharFilter(method="filter_user_email", label="Email для поиска.")
+
+    class Meta:
+        model = PerevalAdded
+        fields = ["user__email"]
+
+    def filter_user_email(self, queryset, name, value):
+        # по каноническому email (APIpj.contacts): регистр и пробелы по краям не важны.
+        # Пустой email не ищем: по NULL совпали бы все пользователи без канонического email
+        lookup = email_lookup(value, "user__")
+        if lookup is None:
+            return queryset.none()
+        return queryset.filter(lookup)
+
+
 class SubmitDataCreateAPIView(generics.ListCreateAPIView):
     queryset = PerevalAdded.objects.all()
     permission_classes = [permissions.AllowAny]
-    parser_classes = [parsers.MultiPartParser, parsers.FormParser, parsers.JSONParser]
+    parser_classes = [parsers.MultiPartParser, parsers.FormParser, ORJSONParser]
     filter_backends = [DjangoFilterBackend]
-    filterset_fields = ["user__email"]
+    filterset_class = PerevalFilter
 
 
     def get_queryset(self):
         # Скрыл отображение спискка при POST запрсое
         if self.request.method == "GET":
-            email = self.request.query_params.get("user__email")
-            if not email:
+            if canonical_email(self.request.query_params.get("user__email")) is None:
                 return PerevalAdded.objects.none()
-            return self.queryset.filter(user__email=email)
+            return PerevalDetailSerializer.eager(self.queryset)
         return super().get_queryset()
     
     def get_serializer_class(self):
         return PerevalCreateSerializer if self.request.method == "POST" else PerevalDetailSerializer
 
+    def list(self, request, *args, **kwargs):
+        lookup = email_lookup(request.query_params.get("user__email"), "user__")
+        if lookup is None:
+            return super().list(request, *args, **kwargs)
+        # рабочие и архивные (APIpj.archive) перевалы пользователя — один список по id. Отпечаток всех
+        # перевалов одним запросом: по нему ETag (при совпадении — 304 без загрузки), count и id страницы
+        rows = http_cache.list_rows(self.filter_queryset(self.queryset), PerevalArchive.objects.filter(lookup))
+        validators = http_cache.for_list(request, rows)
+        not_modified = validators.not_modified(request)
+        if not_modified is not None:
+            return not_modified
+        page = self.paginate_queryset(rows)
+        return validators.apply(self.get_paginated_response(self._page_data(page)))
+
+    def _page_data(self, page) -> List[Dict[str, Any]]:
+        # перевалы страницы: рабочие (source 0) и архивные (source 1), каждая таблица одним запросом
+        context = self.get_serializer_context()
+        data: Dict[int, Dict[str, Any]] = {}
+        for source, serializer_class, model in (
+            (0, PerevalDetailSerializer, PerevalAdded),
+            (1, PerevalArchiveSerializer, PerevalArchive),
+        ):
+            ids = [row[0] for row in page if row[3] == source]
+            if ids:
+                queryset = serializer_class.eager(model.objects.filter(id__in=ids))
+                data.update((item["id"], item) for item in serializer_class(queryset, many=True, context=context).data)
+        return [data[row[0]] for row in page if row[0] in data]
+
     def create(self, request, *args, **kwargs):
+        key = idempotency.get_key(request)
+        if key and len(key) > idempotency.MAX_KEY_LENGTH:
+            raise ApiError(f"Idempotency-Key длиннее {idempotency.MAX_KEY_LENGTH} символов", "invalid_idempotency_key")
+
+        # пока первый запрос с этим ключом обрабатывается, повтор получает 409 до разбора тела запроса
+        stored = idempotency.reserve(key) if key else None
+        if stored is not None and stored.fingerprint is None:
+            return Response(stored.response, status=stored.status_code)
+
         try:
             payload = _normalize_payload(request)
             # извлекаем картинки и кладём их в payload ывиде списка
             images = _extract_images(request)
+            request_fingerprint = idempotency.fingerprint(payload, images) if key else ""
+            if stored is not None:
+                # повтор завершённого запроса: тот же ответ, если тело совпадает, иначе 422
+                status_code, body = idempotency.replay(stored, request_fingerprint)
+                return Response(body, status=status_code)
+
+            self.check_submitter_throttle(request, payload)
             if images:
                 payload["images"] = images
 
-            # валидируем и создаём объект через сериализатор
+            # валидируем и создаём объект через сериализатор; ошибки оформляет APIpj.exceptions
             serializer = self.get_serializer(data=payload)
-            #Проверка на ошибки
-            if not serializer.is_valid():
-                errors = serializer.errors
-                message = f"Validation error: {errors}"
-                return Response({"status": 400, "message": message, "id": None}, status=400)
-
+            serializer.is_valid(raise_exception=True)
             instance = serializer.save()
-            return Response({"status": 200, "message": None, "id": instance.id}, status=200)
+        except Exception:
+            # ключ освобождается при любой ошибке: исправленный запрос можно повторить с тем же ключом
+            if key:
+                idempotency.release(key)
+            raise
+
+        body = {"status": 200, "message": None, "id": instance.id}
+        if key:
+            idempotency.store(key, body["status"], body, request_fingerprint)
+        return Response(body, status=body["status"])
+
+    def check_submitter_throttle(self, request, payload: Dict[str, Any]) -> None:
+        # корзина по email отправителя: email известен только после разбора тела
+        user_data = payload.get("user")
+        email = user_data.get("email") if isinstance(user_data, dict) else None
+        throttle = SubmitterEmailThrottle()
+        if not throttle.allow_key(throttle.normalize(email)):
+            self.throttled(request, throttle.wait())
+
 
-        except Exception as exc:
-            message = str(exc)
-            return Response({"status": 500, "message": message, "id": None}, status=500)
-        
 class SubmitDataRetrieveAPIView(generics.RetrieveUpdateAPIView):
     queryset = PerevalAdded.objects.all()
     permission_classes = [permissions.AllowAny]
-    parser_classes = [parsers.MultiPartParser, parsers.FormParser, parsers.JSONParser]
+    parser_classes = [parsers.MultiPartParser, parsers.FormParser, ORJSONParser]
 
     # используем параметр id, поэтому указываем lookup_url_kwarg='id'.
     lookup_field = "id"
     lookup_url_kwarg = "id"
+    # ошибки правки отдаются в конверте {"state": 0, "message": ...} (APIpj.exceptions)
+    state_envelope_methods = ("PUT", "PATCH")
+
+    def get_queryset(self):
+        if self.request.method == "GET":
+            return PerevalDetailSerializer.eager(self.queryset)
+        # координаты и уровень нужны правке и журналу правок (APIpj.audit)
+        return self.queryset.select_related("coords", "level")
 
     def get_serializer_class(self):
         return PerevalUpdateSerializer if self.request.method in ("PUT", "PATCH") else PerevalDetailSerializer
 
-    def partial_update(self, request, *args, **kwargs):
+    def retrieve(self, request, *args, **kwargs):
+        # с If-None-Match/If-Modified-Since сначала сверяем отпечаток перевала: при совпадении — 304 без загрузки
+        if http_cache.is_conditional(request):
+            validators = http_cache.for_pereval(request, kwargs[self.lookup_url_kwarg])
+            if validators is not None:
+                not_modified = validators.not_modified(request)
+                if not_modified is not None:
+                    return not_modified
         try:
             instance = self.get_object()
-            if instance.status != "new":
-                return Response(
-                    {"state": 0, "message": f"Запись со статусом '{instance.get_status_display()}' не может изменяться. Только 'New' "},
-                    status=400,
-                )
+            data = self.get_serializer(instance).data
+        except Http404:
+            # старые промодерированные перевалы перенесены в архив (APIpj.archive)
+            archived = PerevalArchive.objects.filter(id=kwargs[self.lookup_url_kwarg])
+            instance = PerevalArchiveSerializer.eager(archived).first()
+            if instance is None:
+                raise
+            data = PerevalArchiveSerializer(instance, context=self.get_serializer_context()).data
+        return http_cache.for_instance(request, instance).apply(Response(data))
 
-            payload = _normalize_payload(request)
+    def partial_update(self, request, *args, **kwargs):
+        instance = self.get_object()
+        if instance.status != "new":
+            raise ApiError(
+                f"Запись со статусом '{instance.get_status_display()}' не может изменяться. Только 'New' ",
+                "not_editable",
+            )
 
-            # запрещаем изменять данные пользователя
-            user_data = payload.get("user", {})
-            if user_data:
-                forbidden = ["first_name", "last_name", "patronymic", "email", "phone"]
-                touched = [f for f in forbidden if f in user_data]
-                if touched:
-                    return Response(
-                        {"state": 0, "message": f"Данные пользователя изменять нельзя: {', '.join(touched)}"},
-                        status=400,
-                    )
+        payload = _normalize_payload(request)
 
-            images = _extract_images(request)
-            if images:
-                payload["images"] = images
+        # запрещаем изменять данные пользователя
+        user_data = payload.get("user", {})
+        if user_data:
+            forbidden = ["first_name", "last_name", "patronymic", "email", "phone"]
+            touched = [f for f in forbidden if f in user_data]
+            if touched:
+                raise ApiError(f"Данные пользователя изменять нельзя: {', '.join(touched)}", "user_readonly")
 
-            serializer = self.get_serializer(instance, data=payload, partial=True)
-            if not serializer.is_valid():
-                errors = serializer.errors
-                message = f"Validation error: {errors}"
-                return Response({"state": 0, "message": message}, status=400)
+        images = _extract_images(request)
+        if images:
+            payload["images"] = images
 
-            serializer.save()
-            return Response({"state": 1, "message": None}, status=200)
+        serializer = self.get_serializer(instance, data=payload, partial=True)
+        serializer.is_valid(raise_exception=True)
+        serializer.save()
+        return Response({"state": 1, "message": None}, status=200)
+
+
+class MetricsAPIView(APIView):
+    """Счётчики процесса. Доступны администраторам или всем при API_METRICS_PUBLIC; троттлинг общий."""
+    serializer_class = MetricsResponseSerializer
+
+    def get_permissions(self):
+        if settings.API_METRICS_PUBLIC:
+            return [permissions.AllowAny()]
+        return [permissions.IsAdminUser()]
+
+    def get(self, request, *args, **kwargs):
+        return Response(metrics.snapshot())
+
+
+class SubmitDataChangesAPIView(APIView):
+    """
+    Инкрементальная синхронизация: перевалы пользователя, созданные или изменённые после курсора
+    (results, в том числе перенесённые в архив), и id удалённых (deleted).
+    GET /api/submitData/changes/?user__email=<email>&cursor=<id>&limit=<n>
+    """
+    permission_classes = [permissions.AllowAny]
+    serializer_class = PerevalChangesResponseSerializer
+    default_limit = 100
+    max_limit = 500
+
+    def _int_param(self, name: str, default: int) -> int:
+        try:
+            return max(0, int(self.request.query_params.get(name, default)))
+        except (TypeError, ValueError):
+            return default
+
+    def get(self, request, *args, **kwargs):
+        lookup = email_lookup(request.query_params.get("user__email"))
+        if lookup is None:
+            raise ApiError("Не указан user__email", "missing_email")
+
+        cursor = self._int_param("cursor", 0)
+        limit = min(self._int_param("limit", self.default_limit) or self.default_limit, self.max_limit)
+
+        # несколько id — дубликаты одного email, созданные до нормализации (APIpj.contacts)
+        user_ids = list(User.objects.filter(lookup).values_list("id", flat=True))
+        if not user_ids:
+            return Response({"cursor": cursor, "has_more": False, "results": [], "deleted": []})
+
+        # id выдаются при INSERT, а видны после COMMIT: запись с меньшим id может появиться позже большей.
+        # Отдаём только записи старше API_CHANGES_SAFETY_LAG — к этому времени более ранние транзакции зафиксированы
+        visible_before = timezone.now() - timedelta(seconds=settings.API_CHANGES_SAFETY_LAG)
+        changes = list(
+            PerevalChange.objects.filter(user_id__in=user_ids, id__gt=cursor, created_at__lte=visible_before)
+            .order_by("id")
+            .values_list("id", "pereval_id", "kind")[: limit + 1]
+        )
+        has_more = len(changes) > limit
+        changes = changes[:limit]
+        if not changes:
+            return Response({"cursor": cursor, "has_more": False, "results": [], "deleted": []})
+
+        # несколько изменений одного перевала отдаём одной актуальной записью; удалённые — только id
+        last_kind = {pk: kind for _, pk, kind in changes}
+        deleted = sorted(pk for pk, kind in last_kind.items() if kind == PerevalChange.Kind.DELETED)
+        pereval_ids = sorted(pk for pk, kind in last_kind.items() if kind != PerevalChange.Kind.DELETED)
+        context = {"request": request}
+        results = PerevalDetailSerializer(
+            PerevalDetailSerializer.eager(PerevalAdded.objects.filter(id__in=pereval_ids)).order_by("id"),
+            many=True, context=context,
+        ).data
+        # перенесённые в архив (APIpj.archive) — из архива
+        missing = set(pereval_ids) - {item["id"] for item in results}
+        if missing:
+            archived = PerevalArchiveSerializer.eager(PerevalArchive.objects.filter(id__in=missing))
+            results = [*results, *PerevalArchiveSerializer(archived, many=True, context=context).data]
+            results.sort(key=lambda item: item["id"])
+        return Response({"cursor": changes[-1][0], "has_more": has_more, "results": results, "deleted": deleted})
+
+
+class SubmitDataSummaryAPIView(APIView):
+    """
+    Сводка для экрана профиля: число перевалов по статусам, время последней отправки
+    и последние перевалы в кратком виде. Один запрос к UserPassSummary.
+    GET /api/submitData/summary/?user__email=<email>
+    """
+    permission_classes = [permissions.AllowAny]
+    serializer_class = PassSummaryResponseSerializer
+
+    def get(self, request, *args, **kwargs):
+        lookup = email_lookup(request.query_params.get("user__email"), "user__")
+        if lookup is None:
+            raise ApiError("Не указан user__email", "missing_email")
+
+        statuses = PerevalAdded.StatusChoices.values
+        # обычно одна строка; несколько — у дубликатов одного email, созданных до нормализации
+        rows = list(UserPassSummary.objects.filter(lookup).values(*statuses, "last_submitted_at", "recent"))
+        counts = {s: sum(row[s] for row in rows) for s in statuses}
+        recent = sorted((e for row in rows for e in row["recent"]), key=lambda e: e["id"], reverse=True)
+        return Response({
+            "counts": counts,
+            "total": sum(counts.values()),
+            "last_submitted_at": max((row["last_submitted_at"] for row in rows if row["last_submitted_at"]), default=None),
+            "recent": recent[: summaries.recent_size()],
+        })
+
+
+class MapTileAPIView(APIView):
+    """
+    Кластеры маркеров перевалов в тайле карты z/x/y (схема тайлов Web Mercator / OSM).
+    GET /api/map/tiles/<z>/<x>/<y>/
+    """
+    permission_classes = [permissions.AllowAny]
+    serializer_class = MapTileResponseSerializer
+    max_zoom = 22
+
+    def get(self, request, z: int, x: int, y: int, *args, **kwargs):
+        if z > self.max_zoom or x >= 1 << z or y >= 1 << z:
+            raise ApiError("Нет такого тайла", "not_found", status_code=404)
+        response = Response({"z": z, "x": x, "y": y, "clusters": clusters.tile(z, x, y)})
+        patch_cache_control(response, public=True, max_age=settings.MAP_CLUSTERS["CACHE_TTL"])
+        return response
+
+
+class HeightBandsAPIView(APIView):
+    """
+    Перевалы в диапазоне высот с категорией сложности сезона и гистограмма по высотам.
+    GET /api/heights/?season=summer&category=1А&min_height=3000&max_height=4000&step=500&limit=&offset=
+    """
+    permission_classes = [permissions.AllowAny]
+    serializer_class = HeightBandsResponseSerializer
+    default_limit = 100
+    max_limit = 500
+
+    def get(self, request, *args, **kwargs):
+        season = request.query_params.get("season", "summer")
+        if season not in heights.SEASONS:
+            raise ApiError(f"season должен быть одним из: {', '.join(heights.SEASONS)}", "invalid_season")
+        params: Dict[str, Any] = {}
+        for name in ("min_height", "max_height", "step", "limit", "offset"):
+            raw = request.query_params.get(name)
+            try:
+                params[name] = int(raw) if raw not in (None, "") else None
+            except ValueError:
+                raise ApiError(f"{name}: ожидается целое число", "invalid_param")
+        if params["step"] is not None and params["step"] <= 0:
+            raise ApiError("step должен быть больше нуля", "invalid_param")
+
+        category = request.query_params.get("category") or None
+        limit = min(max(params["limit"] or self.default_limit, 1), self.max_limit)
+        offset = max(params["offset"] or 0, 0)
+
+        qs = heights.search(season, category, params["min_height"], params["max_height"])
+        histogram = heights.histogram(qs, params["step"])
+        return Response({
+            "season": season,
+            "category": category,
+            "count": sum(b["count"] for b in histogram),
+            "histogram": histogram,
+            "results": heights.page(qs, offset, limit),
+        })
+
+
+async def submit_data_events(request: HttpRequest):
+    """
+    Поток Server-Sent Events со сменами статуса перевалов пользователя.
+    GET /api/submitData/events/?user__email=<email>. Работает только под ASGI (FinalAPI.asgi).
+    """
+    if request.method != "GET":
+        return json_error(405, "Метод не поддерживается", "method_not_allowed")
+    if not isinstance(request, ASGIRequest):
+        return json_error(501, "Поток событий доступен только под ASGI", "asgi_required")
+
+    lookup = email_lookup(request.GET.get("user__email"))
+    if lookup is None:
+        return json_error(400, "Не указан user__email", "missing_email")
+    user_id = await User.objects.filter(lookup).values_list("id", flat=True).afirst()
+    if user_id is None:
+        return json_error(404, "Пользователь не найден", "not_found")
+
+    broker = get_broker()
+    heartbeat = settings.API_EVENTS.get("HEARTBEAT", 15)
+
+    async def stream() -> AsyncIterator[str]:
+        # подписываемся внутри генератора: он выполняется в event loop сервера
+        subscription = broker.subscribe(user_id)
+        try:
+            yield "retry: 5000\n\n"
+            while True:
+                try:
+                    event = await asyncio.wait_for(subscription.queue.get(), timeout=heartbeat)
+                except asyncio.TimeoutError:
+                    yield ": keep-alive\n\n"
+                    continue
+                if event is RESYNC:
+                    yield "event: resync\ndata: {}\n\n"
+                    continue
+                data = json.dumps({k: event[k] for k in ("id", "old_status", "status", "ts")})
+                yield f"event: status\ndata: {data}\n\n"
+        finally:
+            broker.unsubscribe(subscription)
 
-        except Exception as exc:
-            return Response({"state": 0, "message": message}, status=500)
\ No newline at end of file
+    response = StreamingHttpResponse(stream(), content_type="text/event-stream")
+    response["Cache-Control"] = "no-cache"
+    response["X-Accel-Buffering"] = "no"
+    return response
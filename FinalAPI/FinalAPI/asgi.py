@@ -2,6 +2,8 @@
 ASGI config for FinalAPI project.
 
 It exposes the ASGI callable as a module-level variable named ``application``.
+The SSE stream /api/submitData/events/ is only served through this entry point
+(e.g. ``uvicorn FinalAPI.asgi:application``).
 
 For more information on this file, see
 https://docs.djangoproject.com/en/5.2/howto/deployment/asgi/
@@ -12,10 +12,17 @@ https://docs.djangoproject.com/en/5.2/ref/settings/
 
 from pathlib import Path
 import os
-from dotenv import load_dotenv
+
+# Профиль запуска: development (по умолчанию) или production.
+# В production .env не читается, DEBUG выключен, документация (swagger/redoc) не подключается.
+API_PROFILE = os.getenv("API_PROFILE", "development")
+PRODUCTION = API_PROFILE == "production"
+
+if os.getenv("LOAD_DOTENV", "0" if PRODUCTION else "1") == "1":
+    from dotenv import load_dotenv
+    load_dotenv()
 
 # Build paths inside the project like this: BASE_DIR / 'subdir'.
-load_dotenv()
 BASE_DIR = Path(__file__).resolve().parent.parent
 STATICFILES_DIRS = [BASE_DIR / 'static']
 
@@ -26,9 +33,12 @@ STATICFILES_DIRS = [BASE_DIR / 'static']
 SECRET_KEY = os.getenv("SECRET_KEY")
 
 # SECURITY WARNING: don't run with debug turned on in production!
-DEBUG = True
+DEBUG = not PRODUCTION
+
+ALLOWED_HOSTS = [h for h in os.getenv("ALLOWED_HOSTS", "").split(",") if h]
 
-ALLOWED_HOSTS = []
+# Приложения документации API нужны только маршрутам /swagger/
+API_DOCS_ENABLED = os.getenv("API_DOCS_ENABLED", "0" if PRODUCTION else "1") == "1"
 
 
 # Application definition
@@ -41,16 +51,24 @@ INSTALLED_APPS = [
     'django.contrib.messages',
     'django.contrib.staticfiles',
     'rest_framework',
-    'rest_framework_swagger',
     'APIpj',
     "django_filters",
+]
+
+DOCS_APPS = [
+    'rest_framework_swagger',
     "drf_yasg",
     'drf_spectacular',
     'drf_spectacular_sidecar',
 ]
 
+if API_DOCS_ENABLED:
+    INSTALLED_APPS += DOCS_APPS
+
 MIDDLEWARE = [
     'django.middleware.security.SecurityMiddleware',
+    'APIpj.middleware.CompressionMiddleware',
+    'APIpj.middleware.UploadConcurrencyMiddleware',
     'django.contrib.sessions.middleware.SessionMiddleware',
     'django.middleware.common.CommonMiddleware',
     'django.middleware.csrf.CsrfViewMiddleware',
@@ -94,6 +112,16 @@ DATABASES = {
     }
 }
 
+# Кэш тайлов карты (APIpj.clusters). Общий для воркеров кэш (например
+# CACHE_BACKEND=django.core.cache.backends.redis.RedisCache, CACHE_LOCATION=redis://...) избавляет
+# каждый процесс от повторной сборки тайлов; на корректность ответов не влияет.
+CACHES = {
+    "default": {
+        "BACKEND": os.getenv("CACHE_BACKEND", "django.core.cache.backends.locmem.LocMemCache"),
+        "LOCATION": os.getenv("CACHE_LOCATION", ""),
+    }
+}
+
 # Password validation
 # https://docs.djangoproject.com/en/5.2/ref/settings/#auth-password-validators
 
@@ -118,6 +146,12 @@ AUTH_PASSWORD_VALIDATORS = [
 
 LANGUAGE_CODE = 'ru'
 
+# языки схемы OpenAPI (/swagger/schema/?lang=): другие значения игнорируются
+LANGUAGES = [
+    ('ru', 'Русский'),
+    ('en', 'English'),
+]
+
 TIME_ZONE = 'Europe/Moscow'
 
 USE_I18N = True
@@ -136,6 +170,14 @@ STATIC_URL = '/static/'
 DEFAULT_AUTO_FIELD = 'django.db.models.BigAutoField'
 
 REST_FRAMEWORK ={
+    "DEFAULT_RENDERER_CLASSES": [
+        "APIpj.renderers.ORJSONRenderer",
+    ] + ([] if PRODUCTION else ["rest_framework.renderers.BrowsableAPIRenderer"]),
+    "DEFAULT_PARSER_CLASSES": [
+        "APIpj.renderers.ORJSONParser",
+        "rest_framework.parsers.FormParser",
+        "rest_framework.parsers.MultiPartParser",
+    ],
     "DEFAULT_AUTHENTICATION_CLASSES": (
         "rest_framework_simplejwt.authentication.JWTAuthentication",
     ),
@@ -144,12 +186,23 @@ REST_FRAMEWORK ={
     ],
     "DEFAULT_PAGINATION_CLASS": "rest_framework.pagination.LimitOffsetPagination",
     "PAGE_SIZE": 10,
-    'DEFAULT_SCHEMA_CLASS': 'drf_spectacular.openapi.AutoSchema',
+    "DEFAULT_THROTTLE_CLASSES": [
+        "APIpj.throttling.IPTokenBucketThrottle",
+        "APIpj.throttling.SubmitterEmailThrottle",
+    ],
+    # число доверенных прокси перед приложением: 0 — IP клиента берётся из REMOTE_ADDR,
+    # X-Forwarded-For не учитывается (его может подставить кто угодно)
+    "NUM_PROXIES": int(os.getenv("API_NUM_PROXIES", 0)),
     'DEFAULT_PERMISSION_CLASSES': [
         'rest_framework.permissions.DjangoModelPermissionsOrAnonReadOnly'
-    ]
+    ],
+    # ошибки в конверте {status, message, id} / {state, message} со стабильным code (APIpj.exceptions)
+    "EXCEPTION_HANDLER": "APIpj.exceptions.api_exception_handler",
 }
 
+if API_DOCS_ENABLED:
+    REST_FRAMEWORK['DEFAULT_SCHEMA_CLASS'] = 'drf_spectacular.openapi.AutoSchema'
+
 LOCAL_APPS = [
     'APIpj',
 ]
@@ -159,6 +212,118 @@ AUTH_USER_MODEL = 'APIpj.User'
 MEDIA_URL = "/media/"
 MEDIA_ROOT = BASE_DIR / "media"
 
+# Сжатие ответов (APIpj.middleware.CompressionMiddleware): brotli, если установлен, иначе gzip
+API_COMPRESSION_MIN_SIZE = int(os.getenv("API_COMPRESSION_MIN_SIZE", 1024))
+API_COMPRESSION_BROTLI_QUALITY = int(os.getenv("API_COMPRESSION_BROTLI_QUALITY", 5))
+# сжимаемые типы ответов (плюс любые +json); потоковые ответы и SSE не сжимаются
+API_COMPRESSION_TYPES = tuple(
+    t.strip() for t in os.getenv(
+        "API_COMPRESSION_TYPES",
+        "application/json,application/vnd.oai.openapi,application/javascript,"
+        "text/html,text/plain,text/css,text/javascript,image/svg+xml",
+    ).split(",") if t.strip()
+)
+
+# Idempotency-Key для POST /api/submitData/: срок хранения ответа (и резерва упавшего воркера), в секундах
+IDEMPOTENCY_KEY_TTL = int(os.getenv("IDEMPOTENCY_KEY_TTL", 24 * 60 * 60))
+
+# Ограничение частоты запросов (APIpj.throttling). Для нескольких воркеров на одной машине:
+# API_THROTTLE_BACKEND=APIpj.throttling.SQLiteBucketBackend
+API_THROTTLE = {
+    "BACKEND": os.getenv("API_THROTTLE_BACKEND", "APIpj.throttling.LocalBucketBackend"),
+    "OPTIONS": {"path": os.getenv("API_THROTTLE_SQLITE_PATH")} if os.getenv("API_THROTTLE_SQLITE_PATH") else {},
+    "RATES": {
+        "ip": os.getenv("API_THROTTLE_IP_RATE", "120/min"),
+        "email": os.getenv("API_THROTTLE_EMAIL_RATE", "30/min"),
+    },
+    # одновременные загрузки изображений на воркер; сверх лимита — сразу 503 с Retry-After, без ожидания слота
+    "UPLOAD_CONCURRENCY": int(os.getenv("API_UPLOAD_CONCURRENCY", 8)),
+    "UPLOAD_RETRY_AFTER": 5,
+}
+
+# GET /api/metrics/ — только администраторам; API_METRICS_PUBLIC=1 открывает его всем (например, для сборщика метрик во внутренней сети)
+API_METRICS_PUBLIC = os.getenv("API_METRICS_PUBLIC", "0") == "1"
+
+# Поток смен статуса (GET /api/submitData/events/, только ASGI). Для нескольких процессов:
+# API_EVENTS_BACKEND=APIpj.events.PostgresNotifyBackend
+API_EVENTS = {
+    "BACKEND": os.getenv("API_EVENTS_BACKEND", "APIpj.events.LocalBackend"),
+    "OPTIONS": {},
+    # размер очереди подписчика; при переполнении клиент получает событие resync
+    "QUEUE_SIZE": 100,
+    "HEARTBEAT": 15,
+}
+
+# Поиск возможных дублей перевалов (APIpj.duplicates), показывается в админке
+DUPLICATE_DETECTOR = {
+    "RADIUS_KM": 3.0,
+    # ближе этого расстояния запись считается дублем независимо от названия
+    "SAME_PLACE_KM": 0.3,
+    "MIN_SIMILARITY": 0.6,
+    "MAX_CANDIDATES": 50,
+    # как часто подтягивать изменения из БД и полностью перечитывать координаты, в секундах
+    "REFRESH_INTERVAL": 5,
+    "RELOAD_INTERVAL": 60 * 60,
+    # updated_at ставится до commit: инкрементальное обновление перечитывает и это число секунд до
+    # прошлой синхронизации, чтобы не пропустить транзакции, зафиксированные позже (дольше — до полной перезагрузки)
+    "OVERLAP": 60,
+}
+
+# фото, снятое дальше этого расстояния от координат перевала, помечается в админке (APIpj.exif)
+EXIF_GPS_MAX_DISTANCE_KM = float(os.getenv("EXIF_GPS_MAX_DISTANCE_KM", "5"))
+
+# принятые и отклонённые перевалы старше этого срока переносит в архив archive_perevals
+ARCHIVE_AFTER_DAYS = int(os.getenv("ARCHIVE_AFTER_DAYS", 365))
+
+# сколько последних перевалов хранится в сводке пользователя (APIpj.summaries)
+USER_SUMMARY_RECENT = 10
+
+# кластеры маркеров для карты (APIpj.clusters): агрегаты на уровнях 0..MAX_ZOOM,
+# тайл делится на CELLS_PER_TILE x CELLS_PER_TILE ячеек, ответ тайла кэшируется на CACHE_TTL секунд
+MAP_CLUSTERS = {
+    "MAX_ZOOM": 14,
+    "CELLS_PER_TILE": 8,
+    "CACHE_TTL": 60,
+}
+
+# журнал правок перевалов (APIpj.audit): буфер процесса пишется фоновым потоком пачками по BATCH_SIZE
+# раз в FLUSH_INTERVAL секунд; больше MAX_BUFFER записей в буфере не держим — лишние отбрасываются (audit.overflow)
+AUDIT_LOG = {
+    "BATCH_SIZE": 500,
+    "FLUSH_INTERVAL": 2.0,
+    "MAX_BUFFER": 10_000,
+    "BACKGROUND": True,
+}
+
+# HTTP-кэширование списка и карточки перевала (APIpj.http_cache): max-age по статусу перевала, с;
+# 0 — no-cache, клиент каждый раз проверяет ответ по ETag (304, если не изменился)
+API_HTTP_CACHE = {
+    "MAX_AGE": {
+        "new": 0,
+        "pending": 0,
+        "accepted": int(os.getenv("API_HTTP_CACHE_MODERATED_MAX_AGE", 24 * 60 * 60)),
+        "rejected": int(os.getenv("API_HTTP_CACHE_MODERATED_MAX_AGE", 24 * 60 * 60)),
+    },
+}
+
+# ширина полосы высот в индексе HeightBand (APIpj.heights), м; после изменения — rebuild_height_bands
+HEIGHT_BAND_SIZE = 100
+
+# лента изменений (GET /api/submitData/changes/) отдаёт записи не моложе этого числа секунд:
+# транзакция, получившая меньший id, но зафиксированная позже, не будет пропущена курсором
+API_CHANGES_SAFETY_LAG = float(os.getenv("API_CHANGES_SAFETY_LAG", 5))
+
+# Как часто воркер перечитывает справочник видов активности из БД (APIpj.refdata), в секундах
+REFERENCE_CACHE_CHECK_INTERVAL = int(os.getenv("REFERENCE_CACHE_CHECK_INTERVAL", 5))
+
+# Бюджет времени импорта при старте воркера, мс (python manage.py benchmark startup)
+STARTUP_IMPORT_BUDGET_MS = int(os.getenv("STARTUP_IMPORT_BUDGET_MS", 1500))
+
+# Собранная OpenAPI-схема (python manage.py build_schema) и вручную поддерживаемая схема для /swagger/
+API_SCHEMA_FILE = BASE_DIR / "static" / "openapi.generated.yaml"
+API_STATIC_SCHEMA_FILE = BASE_DIR / "static" / "FinalAPI.yaml"
+API_SCHEMA_MAX_AGE = 60 * 60
+
 SPECTACULAR_SETTINGS = {
     'TITLE': 'FinalAPI',
     'DESCRIPTION': 'Pereval REST API — это DRF-приложение для управления данными о горных перевалах. API позволяет создавать, получать, редактировать и фильтровать записи о перевалах, включая информацию о пользователях, координатах, уровнях сложности и изображениях. Проект включает автоматические тесты, интерактивную Swagger-документацию и линтеры для форматирования кода.',
@@ -0,0 +1,43 @@
+"""
+Профиль для тестов: `python manage.py test` выбирает его автоматически (см. manage.py).
+
+SQLite в памяти вместо PostgreSQL, быстрый хешер паролей, файлы Image.data в памяти.
+Подходит для параллельного запуска: `python manage.py test --parallel` — у каждого процесса
+своя копия БД, кэша и хранилища файлов.
+"""
+from .settings import *  # noqa: F401,F403
+
+SECRET_KEY = SECRET_KEY or "test-secret-key"  # noqa: F405
+DEBUG = False
+
+DATABASES = {
+    "default": {
+        "ENGINE": "django.db.backends.sqlite3",
+        "NAME": ":memory:",
+    }
+}
+
+CACHES = {
+    "default": {
+        "BACKEND": "django.core.cache.backends.locmem.LocMemCache",
+    }
+}
+
+# MD5 в десятки раз быстрее PBKDF2, для тестовых пользователей стойкость не нужна
+PASSWORD_HASHERS = ["django.contrib.auth.hashers.MD5PasswordHasher"]
+
+# загруженные изображения не пишутся на диск; тесты, которым нужен путь к файлу,
+# переопределяют STORAGES на FileSystemStorage во временном каталоге
+STORAGES = {
+    "default": {"BACKEND": "django.core.files.storage.InMemoryStorage"},
+    "staticfiles": {"BACKEND": "django.contrib.staticfiles.storage.StaticFilesStorage"},
+}
+
+# лимиты частоты не мешают остальным тестам; TestThrottling задаёт свои
+API_THROTTLE = dict(API_THROTTLE, RATES={"ip": "100000/min", "email": "100000/min"})  # noqa: F405
+
+# журнал правок пишется сразу после commit, без фонового потока
+AUDIT_LOG = dict(AUDIT_LOG, BACKGROUND=False)  # noqa: F405
+
+# изменения видны в ленте сразу; задержку проверяет TestChangeFeed
+API_CHANGES_SAFETY_LAG = 0
@@ -18,18 +18,25 @@ from django.contrib import admin
 from django.urls import path, include
 from django.conf import settings
 from django.conf.urls.static import static
-from drf_spectacular.views import SpectacularAPIView, SpectacularSwaggerView, SpectacularRedocView
 
 
 urlpatterns = [
     path('admin/', admin.site.urls),
-    path('swagger/', SpectacularSwaggerView.as_view(url='/static/FinalAPI.yaml'), name='schema-swagger-ui'),
     path('api/', include('APIpj.urls')),
-    path('swagger/schema/', SpectacularAPIView.as_view(), name='schema'),
-    path('swagger/docs/', SpectacularSwaggerView.as_view(url_name='schema'), name='swagger-ui'),
-    path('swagger/redoc/', SpectacularRedocView.as_view(url_name='schema'), name='redoc'),
 ]
 
+# генераторы схемы импортируем, только если документация включена
+if settings.API_DOCS_ENABLED:
+    from drf_spectacular.views import SpectacularSwaggerView, SpectacularRedocView
+    from APIpj.schema import CachedSpectacularAPIView
+
+    urlpatterns += [
+        path('swagger/', SpectacularSwaggerView.as_view(url='/static/FinalAPI.yaml'), name='schema-swagger-ui'),
+        path('swagger/schema/', CachedSpectacularAPIView.as_view(), name='schema'),
+        path('swagger/docs/', SpectacularSwaggerView.as_view(url_name='schema'), name='swagger-ui'),
+        path('swagger/redoc/', SpectacularRedocView.as_view(url_name='schema'), name='redoc'),
+    ]
+
 
 if settings.DEBUG:
     urlpatterns += static(settings.MEDIA_URL, document_root=settings.MEDIA_ROOT)
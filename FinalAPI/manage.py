@@ -6,7 +6,9 @@ import sys
 
 def main():
     """Run administrative tasks."""
-    os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'FinalAPI.settings')
+    # тесты по умолчанию идут на SQLite в памяти (FinalAPI/settings_test.py)
+    default = 'FinalAPI.settings_test' if sys.argv[1:2] == ['test'] else 'FinalAPI.settings'
+    os.environ.setdefault('DJANGO_SETTINGS_MODULE', default)
     try:
         from django.core.management import execute_from_command_line
     except ImportError as exc: